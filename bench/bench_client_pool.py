@@ -0,0 +1,81 @@
+"""Per-call overhead of a fresh OpenAI client per call vs. the pooled registry.
+
+Usage: python -m bench.bench_client_pool --calls 200
+"""
+
+from __future__ import annotations
+
+import argparse
+import json
+import os
+import statistics
+import time
+
+from bench.stub_server import StubServer
+
+
+def _time_calls(fn, calls: int) -> list[float]:
+    samples: list[float] = []
+    for _ in range(calls):
+        start = time.perf_counter()
+        fn()
+        samples.append(time.perf_counter() - start)
+    return samples
+
+
+def _summary(samples: list[float]) -> dict[str, float]:
+    ordered = sorted(samples)
+    return {
+        "mean_ms": round(statistics.fmean(ordered) * 1000, 3),
+        "p50_ms": round(ordered[len(ordered) // 2] * 1000, 3),
+        "p95_ms": round(ordered[int(len(ordered) * 0.95) - 1] * 1000, 3),
+    }
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--calls", type=int, default=200)
+    args = parser.parse_args()
+
+    server = StubServer().start_background()
+    os.environ["API_BASE_URL"] = server.base_url
+    os.environ.setdefault("API_KEY", "stub")
+
+    from openai import OpenAI
+
+    from utils import api_client
+
+    def fresh_client_call() -> None:
+        # 旧实现：每次调用都新建客户端（新连接池 + 新握手）
+        client = OpenAI(api_key=api_client.API_KEY, base_url=api_client.API_BASE_URL)
+        client.chat.completions.create(
+            model="bench", temperature=0, messages=[{"role": "user", "content": "ping"}]
+        )
+        client.close()
+
+    def pooled_call() -> None:
+        api_client.call_text_model("ping", "bench")
+
+    try:
+        fresh_client_call()
+        pooled_call()
+        before_conns = server.connection_count
+        fresh = _time_calls(fresh_client_call, args.calls)
+        fresh_conns = server.connection_count - before_conns
+        before_conns = server.connection_count
+        pooled = _time_calls(pooled_call, args.calls)
+        pooled_conns = server.connection_count - before_conns
+    finally:
+        api_client.close_clients()
+        server.stop()
+
+    result = {
+        "calls": args.calls,
+        "fresh_client": {**_summary(fresh), "new_connections": fresh_conns},
+        "pooled_client": {**_summary(pooled), "new_connections": pooled_conns},
+    }
+    print(json.dumps(result, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,88 @@
+"""Image payload bytes per episode with and without the preprocessing stage.
+
+The call mix mirrors one graph-mode episode (step 0 + MIN_HOPS hops + final):
+每个 hop 含两个 operate 草稿、出题、视觉核查、Medium/Strong 求解与 Review。
+
+Usage: python -m bench.bench_image_payload --image data/test.png
+"""
+
+from __future__ import annotations
+
+import argparse
+import json
+import tempfile
+from pathlib import Path
+
+
+def _episode_call_mix(hops: int) -> list[tuple[str, str, int]]:
+    from utils.config import (
+        MODEL_OPERATE_CALCULATION,
+        MODEL_OPERATE_DISTINCTION,
+        MODEL_REVIEW,
+        MODEL_SOLVE_MEDIUM,
+        MODEL_SOLVE_STRONG,
+        MODEL_STAGE_1,
+        MODEL_STAGE_2,
+        MODEL_SUM,
+        MODEL_VISION_KNOWLEDGE,
+    )
+
+    return [
+        ("visual_knowledge", MODEL_VISION_KNOWLEDGE, 1),
+        ("step0", MODEL_STAGE_1, 1),
+        ("operate_distinction", MODEL_OPERATE_DISTINCTION, hops),
+        ("operate_calculation", MODEL_OPERATE_CALCULATION, hops),
+        ("step_generation", MODEL_STAGE_2, hops),
+        ("visual_verification", MODEL_REVIEW, hops),
+        ("solver_medium", MODEL_SOLVE_MEDIUM, hops + 2),
+        ("solver_strong", MODEL_SOLVE_STRONG, hops + 2),
+        ("review", MODEL_REVIEW, hops + 2),
+        ("final", MODEL_SUM, 1),
+    ]
+
+
+def _payload_bytes(image_path: Path, hops: int, preprocess: bool) -> dict[str, object]:
+    from utils import api_client
+
+    api_client.IMAGE_PREPROCESS = preprocess
+    per_site: dict[str, int] = {}
+    total = 0
+    calls = 0
+    for site, model, count in _episode_call_mix(hops):
+        size = len(api_client._image_data_url(image_path, model))
+        per_site[site] = per_site.get(site, 0) + size * count
+        total += size * count
+        calls += count
+    return {"vision_calls": calls, "payload_bytes": total, "per_call_site": per_site}
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--image", default="data/test.png")
+    parser.add_argument("--hops", type=int, default=None)
+    args = parser.parse_args()
+
+    from utils import api_client
+    from utils.config import MAX_STEPS_PER_ROUND, MIN_HOPS
+
+    hops = args.hops if args.hops is not None else min(MAX_STEPS_PER_ROUND - 1, max(MIN_HOPS, 2))
+    image_path = Path(args.image)
+    with tempfile.TemporaryDirectory() as cache_dir:
+        api_client.IMAGE_CACHE_DIR = cache_dir
+        without_stage = _payload_bytes(image_path, hops, preprocess=False)
+        with_stage = _payload_bytes(image_path, hops, preprocess=True)
+
+    saved = int(without_stage["payload_bytes"]) - int(with_stage["payload_bytes"])  # type: ignore[arg-type]
+    result = {
+        "image": str(image_path),
+        "hops": hops,
+        "without_preprocess": without_stage,
+        "with_preprocess": with_stage,
+        "saved_bytes": saved,
+        "saved_ratio": round(saved / int(without_stage["payload_bytes"]), 4),  # type: ignore[arg-type]
+    }
+    print(json.dumps(result, indent=2))
+
+
+if __name__ == "__main__":
+    main()
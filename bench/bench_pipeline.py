@@ -0,0 +1,340 @@
+"""End-to-end pipeline overhead and throughput against the local stub or a replay cache.
+
+阶段:
+- sequential：顺序跑 --episodes 个 run_episode，记录每个 episode 的墙钟 / CPU 时间、API 调用数、写入字节；
+  第一个 episode 额外用 cProfile 按模块归类本地 CPU（prompt 构建、解析、日志、JSON I/O、客户端等，仅主线程）
+- concurrency：按 --concurrency 中的每个并发度用线程池跑 --episodes 个 episode，记录 episodes/min
+- main_loop（--main-loop）：在子进程中运行 main.py 直到收满目标题数，记录墙钟 / 子进程 CPU / 峰值 RSS
+
+replay 后端依赖固定随机种子重现 prompt，只运行 sequential 阶段。
+结果以 JSON 输出到 stdout（--output 同时写文件），便于对比热路径回归。
+stub 后端在独立子进程中运行，CPU 与 RSS 只统计客户端；replay 后端读取 LLM_CACHE_DIR 中录制的响应，不访问网络。
+
+Usage:
+    python -m bench.bench_pipeline --episodes 3 --concurrency 1,2,4 --latency-ms 50
+    python -m bench.bench_pipeline --backend stub --record-cache /tmp/llm_cache    # 录制
+    python -m bench.bench_pipeline --backend replay --cache-dir /tmp/llm_cache     # 回放
+    python -m bench.bench_pipeline --main-loop --output bench_pipeline.json
+"""
+
+from __future__ import annotations
+
+import argparse
+import cProfile
+import json
+import os
+import pstats
+import random
+import resource
+import shutil
+import signal
+import subprocess
+import sys
+import tempfile
+import time
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+from typing import Any
+
+_REPO_ROOT = Path(__file__).resolve().parent.parent
+_OUTPUT_FILES = ("details.jsonl", "details.json", "genqa_simple.jsonl", "genqa_medium.jsonl", "genqa_strong.jsonl")
+
+# cProfile 自身耗时(tottime)按文件路径归类；按顺序匹配，第一个命中的类别生效
+_CPU_CATEGORIES: list[tuple[str, tuple[str, ...]]] = [
+    ("prompt_building", ("/prompts/",)),
+    ("parsing", ("/utils/parsing.py", "/utils/mcq.py", "/steps/validation.py", "/steps/obfuscate_agent.py", "/re/", "sre_")),
+    ("logging", ("/utils/details_logger.py", "/utils/terminal.py", "/utils/metrics.py", "<built-in method builtins.print>")),
+    ("json_io", ("/json/", "/utils/file_io.py", "/utils/genqa.py", "/utils/llm_cache.py", "<built-in method posix.", "<built-in method io.")),
+    ("image_encoding", ("/PIL/", "base64", "hashlib")),
+    ("api_client", ("/utils/api_client.py", "/utils/rate_limit.py", "/openai/", "/httpx/", "/httpcore/", "/pydantic", "/anyio/", "/asyncio/", "ssl", "socket", "selectors", "threading.py")),
+    ("graph", ("/graph/",)),
+    ("pipeline", (str(_REPO_ROOT),)),
+]
+
+
+def _peak_rss_mb(who: int = resource.RUSAGE_SELF) -> float:
+    # Linux 上 ru_maxrss 单位为 KB
+    return round(resource.getrusage(who).ru_maxrss / 1024, 1)
+
+
+def _output_bytes(workdir: Path) -> dict[str, int]:
+    sizes = {}
+    for name in _OUTPUT_FILES:
+        path = workdir / name
+        if path.exists():
+            sizes[name] = path.stat().st_size
+    return sizes
+
+
+def _bytes_delta(before: dict[str, int], after: dict[str, int]) -> dict[str, int]:
+    return {name: size - before.get(name, 0) for name, size in after.items() if size != before.get(name, 0)}
+
+
+def _start_stub(args: argparse.Namespace) -> tuple[subprocess.Popen[str], str]:
+    command = [
+        sys.executable, "-m", "bench.stub_server", "--port", "0",
+        "--seed", str(args.seed),
+        "--latency", args.latency,
+        "--latency-ms", str(args.latency_ms),
+        "--error-rate", str(args.error_rate),
+        "--rate-limit-rate", str(args.rate_limit_rate),
+        "--retry-after", "0.05",
+    ]  # fmt: skip
+    proc = subprocess.Popen(command, cwd=_REPO_ROOT, stdout=subprocess.PIPE, text=True)
+    line = proc.stdout.readline() if proc.stdout else ""
+    if "listening on" not in line:
+        proc.kill()
+        raise RuntimeError(f"stub server 启动失败: {line!r}")
+    return proc, line.rsplit(" ", 1)[-1].strip()
+
+
+def _stop_stub(proc: subprocess.Popen[str]) -> dict[str, Any]:
+    proc.send_signal(signal.SIGINT)
+    try:
+        output, _ = proc.communicate(timeout=10)
+    except subprocess.TimeoutExpired:
+        proc.kill()
+        return {}
+    for line in output.splitlines():
+        if line.startswith("stub server stats:"):
+            return json.loads(line.split(":", 1)[1])
+    return {}
+
+
+def _configure_env(args: argparse.Namespace, workdir: Path, base_url: str | None) -> dict[str, str]:
+    env = {
+        "API_KEY": "stub",
+        "API_CALL_SITE_HEADER": "X-Call-Site",
+        "API_RETRY_SLEEP_SECONDS": "0",
+        "API_RECONNECT_SLEEP_SECONDS": "0",
+        "DETAILS_PATH": str(workdir / "details.jsonl"),
+        "GENQA_SIMPLE_PATH": str(workdir / "genqa_simple.jsonl"),
+        "GENQA_MEDIUM_PATH": str(workdir / "genqa_medium.jsonl"),
+        "GENQA_STRONG_PATH": str(workdir / "genqa_strong.jsonl"),
+        "GRAPH_CACHE_PATH": str(workdir / "data" / "graph_cache.json"),
+        "GRAPH_STORE_PATH": str(workdir / "data" / "graph_store.sqlite3"),
+        "IMAGE_CACHE_DIR": str(workdir / "data" / ".image_cache"),
+        "METRICS_PATH": "",
+    }
+    if base_url:
+        env["API_BASE_URL"] = base_url
+    if args.backend == "replay":
+        env["LLM_CACHE_MODE"] = "replay-only"
+        env["LLM_CACHE_DIR"] = str(Path(args.cache_dir).resolve())
+    elif args.record_cache:
+        env["LLM_CACHE_MODE"] = "read-write"
+        env["LLM_CACHE_DIR"] = str(Path(args.record_cache).resolve())
+    else:
+        env["LLM_CACHE_MODE"] = "off"
+    os.environ.update(env)
+    return env
+
+
+def _cpu_breakdown(profile: cProfile.Profile, top: int = 15) -> dict[str, Any]:
+    stats = pstats.Stats(profile)
+    totals: dict[str, float] = {}
+    functions: list[tuple[float, str]] = []
+    for (filename, line, name), (_, _, tottime, _, _) in stats.stats.items():  # type: ignore[attr-defined]
+        label = filename if filename != "~" else name
+        category = next(
+            (category for category, needles in _CPU_CATEGORIES if any(needle in label for needle in needles)),
+            "other",
+        )
+        totals[category] = totals.get(category, 0.0) + tottime
+        functions.append((tottime, f"{filename}:{line}({name})" if filename != "~" else name))
+    # 归类只看函数所在文件；SDK 内部调用的 json / str.encode 等会落在 json_io / other，需结合 top_functions 判断
+    functions.sort(reverse=True)
+    return {
+        "by_category": {
+            category: round(seconds, 4) for category, seconds in sorted(totals.items(), key=lambda item: -item[1])
+        },
+        "top_functions": [{"function": label, "seconds": round(seconds, 4)} for seconds, label in functions[:top]],
+    }
+
+
+def _run_sequential(
+    episodes: int, context: str, image_path: Path, workdir: Path, mode: str, seed: int
+) -> dict[str, Any]:
+    from pipeline import run_episode
+    from utils.details_logger import get_details_logger
+    from utils.metrics import get_metrics_sink
+
+    results: list[dict[str, Any]] = []
+    breakdown: dict[str, Any] = {}
+    for index in range(episodes):
+        # 固定随机种子：replay 后端需要每次生成同样的 prompt 才能命中录制的响应
+        random.seed(seed + index)
+        get_metrics_sink().reset()
+        before = _output_bytes(workdir)
+        # 用线程 CPU 时间计时，阻塞在 socket / 锁上的等待不计入
+        profile = cProfile.Profile(time.thread_time) if index == 0 else None
+        wall_start, cpu_start = time.perf_counter(), time.process_time()
+        if profile is not None:
+            profile.enable()
+        episode = run_episode(context, image_path, mode=mode)
+        if profile is not None:
+            profile.disable()
+        get_details_logger().flush()
+        wall, cpu = time.perf_counter() - wall_start, time.process_time() - cpu_start
+        # 用按调用点的累计值：内存里的逐条记录有上限，大批量运行时会丢弃最早的记录
+        sites = get_metrics_sink().call_site_stats().values()
+        api_wall = sum(stats.wall_seconds for stats in sites)
+        results.append(
+            {
+                "wall_seconds": round(wall, 3),
+                "cpu_seconds": round(cpu, 3),
+                "api_calls": sum(stats.calls for stats in sites),
+                "api_wall_seconds": round(api_wall, 3),
+                "steps": len(episode.steps),
+                "bytes_written": _bytes_delta(before, _output_bytes(workdir)),
+                "profiled": profile is not None,
+            }
+        )
+        if profile is not None:
+            breakdown = _cpu_breakdown(profile)
+    # 第一个 episode 含冷启动与 profiler 开销，均值只统计其余 episode
+    steady = results[1:] or results
+    return {
+        "episodes": results,
+        "mean_wall_seconds": round(sum(item["wall_seconds"] for item in steady) / len(steady), 3),
+        "mean_cpu_seconds": round(sum(item["cpu_seconds"] for item in steady) / len(steady), 3),
+        "cpu_profile_first_episode": breakdown,
+        "peak_rss_mb": _peak_rss_mb(),
+    }
+
+
+def _run_concurrent(
+    levels: list[int], episodes: int, context: str, image_path: Path, workdir: Path, mode: str
+) -> list[dict[str, Any]]:
+    from pipeline import run_episode
+    from utils.details_logger import get_details_logger
+    from utils.metrics import get_metrics_sink
+
+    rows = []
+    for workers in levels:
+        get_metrics_sink().reset()
+        before = _output_bytes(workdir)
+        wall_start, cpu_start = time.perf_counter(), time.process_time()
+        with ThreadPoolExecutor(max_workers=workers) as pool:
+            futures = [pool.submit(run_episode, context, image_path, mode=mode) for _ in range(episodes)]
+            failures = sum(1 for future in futures if future.exception() is not None)
+        get_details_logger().flush()
+        wall, cpu = time.perf_counter() - wall_start, time.process_time() - cpu_start
+        rows.append(
+            {
+                "concurrency": workers,
+                "episodes": episodes,
+                "failures": failures,
+                "wall_seconds": round(wall, 3),
+                "episodes_per_minute": round(episodes * 60 / wall, 2) if wall > 0 else None,
+                "cpu_seconds_per_episode": round(cpu / episodes, 3),
+                "api_calls": sum(stats.calls for stats in get_metrics_sink().call_site_stats().values()),
+                "bytes_written": _bytes_delta(before, _output_bytes(workdir)),
+                "peak_rss_mb": _peak_rss_mb(),
+            }
+        )
+    return rows
+
+
+def _run_main_loop(env: dict[str, str], workdir: Path, mode: str, timeout: float) -> dict[str, Any]:
+    # main.py 启动时会清空 details 日志，放在独立目录中运行，不影响前面阶段的统计
+    run_dir = workdir / "main_loop"
+    shutil.copytree(workdir / "data", run_dir / "data", ignore=shutil.ignore_patterns(".*", "graph_cache.json", "graph_store.sqlite3*"))
+    paths = {
+        name: str(run_dir / Path(env[name]).name)
+        for name in ("DETAILS_PATH", "GENQA_SIMPLE_PATH", "GENQA_MEDIUM_PATH", "GENQA_STRONG_PATH")
+    }
+    usage_before = resource.getrusage(resource.RUSAGE_CHILDREN)
+    wall_start = time.perf_counter()
+    proc = subprocess.run(
+        [sys.executable, str(_REPO_ROOT / "main.py"), "--mode", mode],
+        cwd=run_dir,
+        env={**os.environ, **env, **paths, "PYTHONPATH": str(_REPO_ROOT)},
+        capture_output=True,
+        text=True,
+        timeout=timeout,
+    )
+    wall = time.perf_counter() - wall_start
+    usage_after = resource.getrusage(resource.RUSAGE_CHILDREN)
+    cpu = (usage_after.ru_utime - usage_before.ru_utime) + (usage_after.ru_stime - usage_before.ru_stime)
+    attempts = proc.stdout.count(">>> 尝试第")
+    return {
+        "returncode": proc.returncode,
+        "attempts": attempts,
+        "wall_seconds": round(wall, 3),
+        "cpu_seconds": round(cpu, 3),
+        "cpu_seconds_per_attempt": round(cpu / attempts, 3) if attempts else None,
+        "attempts_per_minute": round(attempts * 60 / wall, 2) if wall > 0 else None,
+        # stub 子进程此时仍在运行，已结束的子进程只有 main.py
+        "peak_rss_mb": _peak_rss_mb(resource.RUSAGE_CHILDREN),
+        "bytes_written": _output_bytes(run_dir),
+        "stderr_tail": proc.stderr[-500:] if proc.returncode else "",
+    }
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--backend", choices=["stub", "replay"], default="stub")
+    parser.add_argument("--cache-dir", default="data/.llm_cache", help="replay 后端读取的响应缓存目录")
+    parser.add_argument("--record-cache", default="", help="stub 后端同时把响应录制到该目录，供之后 replay")
+    parser.add_argument("--image", default="data/test.png")
+    parser.add_argument("--context", default="data/context.txt")
+    parser.add_argument("--mode", default="multi_select", choices=["multi_select", "single_select"])
+    parser.add_argument("--episodes", type=int, default=3)
+    parser.add_argument("--concurrency", default="1,2,4", help="逗号分隔的并发度；置空跳过")
+    parser.add_argument("--main-loop", action="store_true", help="额外在子进程中运行完整的 main.py 循环")
+    parser.add_argument("--main-timeout", type=float, default=900)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--latency", choices=["fixed", "uniform", "lognormal"], default="fixed")
+    parser.add_argument("--latency-ms", type=float, default=0.0)
+    parser.add_argument("--error-rate", type=float, default=0.0)
+    parser.add_argument("--rate-limit-rate", type=float, default=0.0)
+    parser.add_argument("--output", default="")
+    args = parser.parse_args()
+
+    image_src, context_src = Path(args.image).resolve(), Path(args.context).resolve()
+    output_path = Path(args.output).resolve() if args.output else None
+    levels = [int(level) for level in args.concurrency.split(",") if level.strip()]
+    workdir = Path(tempfile.mkdtemp(prefix="autoqa-bench-"))
+    (workdir / "data").mkdir()
+    image_path = workdir / "data" / image_src.name
+    shutil.copy(image_src, image_path)
+    context = context_src.read_text(encoding="utf-8")
+    (workdir / "data" / "context.txt").write_text(context, encoding="utf-8")
+
+    stub, base_url = _start_stub(args) if args.backend == "stub" else (None, None)
+    env = _configure_env(args, workdir, base_url)
+    os.chdir(workdir)
+    # 终端输出丢弃，但仍经过 TeeStream 与 details 日志，计入本地开销
+    sys.stdout = open(os.devnull, "w", encoding="utf-8")
+    result: dict[str, Any] = {
+        "backend": args.backend,
+        "mode": args.mode,
+        "stub": {"latency": args.latency, "latency_ms": args.latency_ms, "error_rate": args.error_rate,
+                 "rate_limit_rate": args.rate_limit_rate, "seed": args.seed} if stub else None,
+        "python": sys.version.split()[0],
+    }  # fmt: skip
+    try:
+        from utils.details_logger import setup_details_logging
+
+        setup_details_logging()
+        startup_rss = _peak_rss_mb()
+        result["startup_rss_mb"] = startup_rss
+        result["sequential"] = _run_sequential(args.episodes, context, image_path, workdir, args.mode, args.seed)
+        if levels and args.backend == "stub":
+            result["concurrency"] = _run_concurrent(levels, args.episodes, context, image_path, workdir, args.mode)
+        if args.main_loop and args.backend == "stub":
+            result["main_loop"] = _run_main_loop(env, workdir, args.mode, args.main_timeout)
+    finally:
+        if stub is not None:
+            result["stub_counters"] = _stop_stub(stub)
+        shutil.rmtree(workdir, ignore_errors=True)
+
+    text = json.dumps(result, indent=2, ensure_ascii=False)
+    sys.__stdout__.write(text + "\n")
+    if output_path is not None:
+        output_path.write_text(text + "\n", encoding="utf-8")
+
+
+if __name__ == "__main__":
+    main()
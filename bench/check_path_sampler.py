@@ -0,0 +1,178 @@
+"""Brute-force check of graph.pipeline_path_sampling.PathSampler on small random graphs.
+
+对每个随机小图与参数组合（长度、require_image、require_distinct_sources、max_shortcut_edges），
+穷举所有首尾相接的边序列作为基准，检查：
+- count 等于满足相邻约束（捷径上限 / 相邻边来源不同、图片边要求）的路径数
+- _enumerate() 给出的路径集合与穷举得到的合法路径集合一致
+- sample() 只返回合法路径；合法路径不多时按卡方检验确认抽样均匀
+- 拒绝抽样失败且超过穷举上限时退化为放宽约束的抽样，仍返回满足相邻约束的路径
+有不一致时以非零状态退出。
+
+Usage: python -m bench.check_path_sampler --graphs 50 --seed 0
+"""
+
+from __future__ import annotations
+
+import argparse
+import contextlib
+import io
+import json
+import math
+import random
+import sys
+from collections import Counter
+
+import graph.pipeline_path_sampling as path_sampling
+from graph.knowledge_graph import KnowledgeGraph
+from graph.pipeline_graph import KnowledgeEdge
+from graph.pipeline_path_sampling import PathSampler
+
+
+def _random_graph(rng: random.Random) -> KnowledgeGraph:
+    entities = [f"e{index}" for index in range(rng.randint(2, 6))]
+    edges = [
+        KnowledgeEdge(
+            head=rng.choice(entities),
+            relation=f"r{index}",
+            tail=rng.choice(entities),
+            source_id=rng.choice([None, 1, 2, 3, 4]),
+            source_type="image" if rng.random() < 0.3 else "text",
+        )
+        for index in range(rng.randint(3, 12))
+    ]
+    return KnowledgeGraph(edges)
+
+
+def _brute_force(
+    graph: KnowledgeGraph, length: int, *, require_image: bool, distinct: bool, max_shortcuts: int
+) -> tuple[set[tuple[int, ...]], set[tuple[int, ...]]]:
+    """返回 (满足相邻约束的路径, 其中来源也互不相同的合法路径)；不要求来源互不相同时两者相同。"""
+    limit = 0 if distinct else max(0, min(max_shortcuts, length - 1))
+    adjacent: set[tuple[int, ...]] = set()
+    valid: set[tuple[int, ...]] = set()
+
+    def extend(path: list[int]) -> None:
+        if len(path) == length:
+            edges = [graph.edges[index] for index in path]
+            if require_image and not any(edge.source_type == "image" for edge in edges):
+                return
+            shortcuts = sum(
+                1
+                for current, following in zip(edges, edges[1:])
+                if current.source_id is not None and current.source_id == following.source_id
+            )
+            if shortcuts > limit:
+                return
+            adjacent.add(tuple(path))
+            known = [edge.source_id for edge in edges if edge.source_id is not None]
+            if not distinct or len(known) == len(set(known)):
+                valid.add(tuple(path))
+            return
+        for next_index in graph.out_edges[graph.edge_tails[path[-1]]]:
+            extend([*path, next_index])
+
+    for start in range(len(graph.edges)):
+        extend([start])
+    return adjacent, valid
+
+
+def _indices(position: dict[int, int], path: list[KnowledgeEdge]) -> tuple[int, ...]:
+    return tuple(position[id(edge)] for edge in path)
+
+
+def _chi_square_z(observed: Counter[tuple[int, ...]], support: set[tuple[int, ...]], draws: int) -> float:
+    # Wilson–Hilferty 近似：卡方统计量换算为标准正态分数。一次运行要做数百次检验，
+    # 阈值取 z > 4.5（单次 p 约 3e-6），均匀时整轮误报的概率仍在千分之一量级
+    expected = draws / len(support)
+    chi2 = sum((observed.get(path, 0) - expected) ** 2 / expected for path in support)
+    df = len(support) - 1
+    return ((chi2 / df) ** (1 / 3) - (1 - 2 / (9 * df))) / math.sqrt(2 / (9 * df))
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--graphs", type=int, default=50)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--draws-per-path", type=int, default=200, help="均匀性检验时每条合法路径的期望抽中次数")
+    parser.add_argument("--max-uniform-support", type=int, default=20, help="合法路径数不超过该值时做均匀性检验")
+    args = parser.parse_args()
+
+    rng = random.Random(args.seed)
+    random.seed(args.seed)
+    failures: list[str] = []
+    stats = Counter()
+    worst_z = -math.inf
+    for graph_index in range(args.graphs):
+        graph = _random_graph(rng)
+        position = {id(edge): index for index, edge in enumerate(graph.edges)}
+        for length in range(1, 5):
+            for require_image in (False, True):
+                for distinct in (False, True):
+                    max_shortcuts = rng.randint(0, 2)
+                    label = (
+                        f"graph={graph_index} length={length} image={require_image} "
+                        f"distinct={distinct} shortcuts={max_shortcuts}"
+                    )
+                    adjacent, valid = _brute_force(
+                        graph, length, require_image=require_image, distinct=distinct, max_shortcuts=max_shortcuts
+                    )
+                    sampler = PathSampler(
+                        graph,
+                        length,
+                        require_image=require_image,
+                        require_distinct_sources=distinct,
+                        max_shortcut_edges=max_shortcuts,
+                    )
+                    stats["cases"] += 1
+                    if sampler.count != len(adjacent):
+                        failures.append(f"{label}: count {sampler.count} != brute force {len(adjacent)}")
+                        continue
+                    if sampler.count and {tuple(path) for path in sampler._enumerate()} != valid:
+                        failures.append(f"{label}: enumeration differs from brute force")
+                        continue
+                    if distinct and adjacent - valid:
+                        # 强制走“拒绝失败 + 超过穷举上限”的分支：结果只需满足相邻约束
+                        saved = path_sampling._MAX_REJECTION_DRAWS, path_sampling._MAX_ENUMERATED_PATHS
+                        path_sampling._MAX_REJECTION_DRAWS, path_sampling._MAX_ENUMERATED_PATHS = 1, 0
+                        try:
+                            with contextlib.redirect_stdout(io.StringIO()):
+                                relaxed = {_indices(position, sampler.sample()) for _ in range(20)}
+                        finally:
+                            path_sampling._MAX_REJECTION_DRAWS, path_sampling._MAX_ENUMERATED_PATHS = saved
+                        stats["relaxed_fallback_checks"] += 1
+                        if not relaxed <= adjacent:
+                            failures.append(f"{label}: relaxed fallback returned paths outside the adjacent set")
+                    if not valid:
+                        if sampler.sample():
+                            failures.append(f"{label}: sampled a path although none is valid")
+                        continue
+                    stats["nonempty_cases"] += 1
+                    if len(valid) < 2 or len(valid) > args.max_uniform_support:
+                        path = _indices(position, sampler.sample())
+                        if path not in valid:
+                            failures.append(f"{label}: sampled invalid path {path}")
+                        continue
+                    draws = len(valid) * args.draws_per_path
+                    observed = Counter(_indices(position, sampler.sample()) for _ in range(draws))
+                    if set(observed) - valid:
+                        failures.append(f"{label}: sampled invalid paths {sorted(set(observed) - valid)[:3]}")
+                        continue
+                    z = _chi_square_z(observed, valid, draws)
+                    worst_z = max(worst_z, z)
+                    stats["uniformity_checks"] += 1
+                    if z > 4.5:
+                        failures.append(f"{label}: non-uniform sampling (z={z:.2f}, {len(valid)} paths)")
+
+    report = {
+        **stats,
+        "worst_uniformity_z": round(worst_z, 2) if stats["uniformity_checks"] else None,
+        "failures": failures[:20],
+        "failure_count": len(failures),
+    }
+    print(json.dumps(report, indent=2))
+    if failures:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
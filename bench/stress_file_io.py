@@ -0,0 +1,106 @@
+"""Concurrent-writer stress test for the shared output files.
+
+N 个进程同时写同一批文件（graph store、genqa jsonl / 旧版 JSON 数组、details 两种后端），
+结束后检查每个文件都能完整解析且没有丢失任何一条写入。有丢失或损坏时以非零状态退出。
+
+Usage: python -m bench.stress_file_io --processes 8 --writes 25
+"""
+
+from __future__ import annotations
+
+import argparse
+import json
+import multiprocessing
+import os
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+
+def _worker(root: str, worker_id: int, writes: int) -> None:
+    os.environ["GRAPH_STORE_PATH"] = str(Path(root) / "graph_store.sqlite3")
+    os.environ["GRAPH_CACHE_PATH"] = str(Path(root) / "graph_cache.json")
+
+    from graph.graph_store import get_graph_store
+    from utils.details_logger import DetailsLogger, JsonlDetailsLogger
+    from utils.genqa import save_genqa_item
+
+    root_path = Path(root)
+    legacy_details = DetailsLogger(root_path / "details.json")
+    jsonl_details = JsonlDetailsLogger(root_path / "details.jsonl", fsync_policy="never")
+    for index in range(writes):
+        tag = f"w{worker_id}-{index}"
+        # 不传 max_documents，不做清理，检查时每条写入都应保留
+        chunk_key = (tag, "stress", 1)
+        get_graph_store().save_document(
+            tag, [chunk_key], {chunk_key: [{"head": tag, "relation": "r", "tail": "shared"}]}
+        )
+        save_genqa_item(root_path / "genqa.jsonl", {"id": tag})
+        save_genqa_item(root_path / "genqa.json", {"id": tag})
+        legacy_details.log_event("stress", {"id": tag})
+        jsonl_details.log_event("stress", {"id": tag})
+    jsonl_details.close()
+
+
+def _check(root: Path, expected: set[str]) -> dict[str, dict[str, int]]:
+    from utils.details_logger import load_details
+    from utils.genqa import load_genqa_items
+
+    from graph.graph_store import GraphStore
+
+    found: dict[str, set[str]] = {}
+    store = GraphStore(root / "graph_store.sqlite3")
+    found["graph_store.sqlite3"] = {edge["head"] for edge in store.find_edges(tail="shared")}
+    for name in ("genqa.jsonl", "genqa.json"):
+        found[name] = {item["id"] for item in load_genqa_items(root / name)}
+    for name in ("details.json", "details.jsonl"):
+        details = load_details(root / name)
+        found[name] = {event["payload"]["id"] for event in details["events"]}
+    return {
+        name: {"found": len(ids), "missing": len(expected - ids)}
+        for name, ids in found.items()
+    }
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--processes", type=int, default=8)
+    parser.add_argument("--writes", type=int, default=25)
+    args = parser.parse_args()
+
+    expected = {f"w{w}-{i}" for w in range(args.processes) for i in range(args.writes)}
+    with tempfile.TemporaryDirectory() as root:
+        ctx = multiprocessing.get_context("spawn")
+        workers = [
+            ctx.Process(target=_worker, args=(root, worker_id, args.writes))
+            for worker_id in range(args.processes)
+        ]
+        started = time.perf_counter()
+        for process in workers:
+            process.start()
+        for process in workers:
+            process.join()
+        elapsed = time.perf_counter() - started
+        failed_workers = [p.exitcode for p in workers if p.exitcode != 0]
+        result = _check(Path(root), expected)
+
+    print(
+        json.dumps(
+            {
+                "processes": args.processes,
+                "writes_per_process": args.writes,
+                "expected": len(expected),
+                "elapsed_seconds": round(elapsed, 3),
+                "failed_workers": len(failed_workers),
+                "files": result,
+            },
+            indent=2,
+        )
+    )
+    if failed_workers or any(entry["missing"] for entry in result.values()):
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
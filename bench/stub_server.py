@@ -0,0 +1,425 @@
+"""Local OpenAI-compatible stub server for offline end-to-end runs and the benchmarks in bench/.
+
+Replies are picked per call site from the request header named by API_CALL_SITE_HEADER
+(default X-Call-Site here), so every stage of the pipeline gets output in the tag format
+it parses. Latency, 5xx and 429 injection are drawn from an RNG seeded per request body,
+so a run is reproducible regardless of how concurrent requests interleave.
+
+Usage:
+    python -m bench.stub_server --port 8765 --latency lognormal --latency-ms 300 --error-rate 0.02
+    API_BASE_URL=http://127.0.0.1:8765/v1 API_KEY=stub API_CALL_SITE_HEADER=X-Call-Site python main.py
+"""
+
+from __future__ import annotations
+
+import argparse
+import hashlib
+import json
+import math
+import random
+import threading
+import time
+from dataclasses import dataclass, field
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+from typing import Any
+
+
+_STEP_REPLY = """<question>根据图中标注的读数，若额定阈值为 3.0 V，按超限判定规则，下列哪项结论成立？</question>
+<selections>
+A. 超过额定值，应触发保护
+B. 低于额定值，正常运行
+C. 恰好等于额定值
+D. 无法从读数判断
+</selections>
+<answer>A</answer>
+<answer_text>触发过载保护</answer_text>
+<evidence>图中仪表指针指向 3.5 V；参考信息给出额定阈值 3.0 V。</evidence>
+<modal_use>both</modal_use>
+<cross_modal_bridge>true</cross_modal_bridge>
+<reasoning>读数 3.5 V 大于阈值 3.0 V，按规则判定为超限。</reasoning>"""
+
+_FINAL_REPLY = """<question>根据图中仪表读数与参考信息中的阈值规则，若读数持续超过额定值，系统最终会进入哪种状态？</question>
+<selections>
+A. 触发过载保护并切断输出
+B. 维持正常输出
+C. 自动提升额定值
+D. 进入待机但不切断输出
+</selections>
+<answer>A</answer>
+<reasoning>图中读数 3.5 V 高于额定 3.0 V；按参考信息，超限持续即触发保护并切断输出。</reasoning>"""
+
+_GRAPH_CHAINS = [
+    (["电压表", "读数", "额定电压", "过载保护"], ["显示", "对比", "超出触发"], "读数超过额定电压时触发过载保护"),
+    (["过载保护", "继电器", "输出回路"], ["驱动", "切断"], "保护动作由继电器切断输出回路"),
+    (["电流表", "负载电流", "额定电流", "过载保护"], ["测量", "对比", "超出触发"], "负载电流超过额定电流同样触发保护"),
+    (["指示灯", "运行状态", "输出回路"], ["指示", "对应"], "指示灯颜色表示运行状态"),
+    (["额定电压", "安全裕量", "告警阈值"], ["扣除", "得到"], "额定值扣除安全裕量得到告警阈值"),
+    (["告警阈值", "蜂鸣器", "运行状态"], ["触发", "提示"], "超过告警阈值时蜂鸣器提示"),
+]
+_GRAPH_REPLY = json.dumps(
+    [{"chain": chain, "links": links, "evidence": evidence} for chain, links, evidence in _GRAPH_CHAINS],
+    ensure_ascii=False,
+)
+
+_FACTS_REPLY = json.dumps(
+    [
+        {"fact": "额定电压为 3.0 V", "source": "L1", "kind": "number"},
+        {"fact": "读数超过额定值时触发过载保护", "source": "L2", "kind": "rule"},
+        {"fact": "保护动作由继电器切断输出回路", "source": "L3", "kind": "mechanism"},
+    ],
+    ensure_ascii=False,
+)
+
+# 调用点 -> 回复模板；未带调用点请求头时使用 unspecified，包含各阶段会解析的全部标签
+DEFAULT_RESPONSES: dict[str, str] = {
+    "step0": _STEP_REPLY,
+    "step_generation": _STEP_REPLY,
+    "step_revise": _STEP_REPLY,
+    "operate_distinction": (
+        "<draft>视觉证据：指针读数 3.5 V → 参考信息：额定 3.0 V → 区分点：是否超限 → "
+        "结论：超限，干扰项取相近数值。</draft>"
+    ),
+    "operate_calculation": "<draft>读取图中 3.5 V，与阈值 3.0 V 作差得 0.5 V，超出 16.7%，判定为超限。</draft>",
+    "visual_verification": "<verified>yes</verified>",
+    # 求解器统一答错，使题目进入 Strong 档，main.py 的循环能按目标数量正常结束
+    "solver_medium": "<answer>B</answer>",
+    "solver_strong": "<answer>B</answer>",
+    "solver_text_only": "<answer>C</answer>",
+    "solver_no_image": "<answer>C</answer>",
+    "review": "<answer>correct</answer>",
+    "obfuscate": "<stem>图中读数对应的量若持续高于参考信息中的额定阈值，按判定规则系统会进入哪种状态？</stem>",
+    "final": _FINAL_REPLY,
+    "final_harden": _FINAL_REPLY,
+    "refine": _FINAL_REPLY,
+    "refine_rationale": "题干与选项结构完整，已补全条件。",
+    "refine_review_feedback": "评审意见已处理。",
+    "analysis": "该题需要同时读取图中数值并结合参考信息中的阈值规则，单一模态无法作答。",
+    "visual_knowledge": (
+        "<description>\n- 图中央为电压表，指针指向 3.5 V\n- 右侧电流表读数 1.2 A\n"
+        "- 左上角指示灯为红色\n</description>\n<summary>\n电压表 3.5 V，电流表 1.2 A，指示灯红色\n</summary>"
+    ),
+    "fact_extraction": _FACTS_REPLY,
+    "graph_extraction": _GRAPH_REPLY,
+    "unspecified": f"{_FINAL_REPLY}\n<verified>yes</verified>",
+}
+
+
+@dataclass
+class StubConfig:
+    seed: int = 0
+    latency: str = "fixed"  # fixed / uniform / lognormal
+    latency_ms: float = 0.0  # fixed 为固定值，uniform 为均值，lognormal 为中位数
+    latency_spread: float = 0.5  # uniform 为相对半宽，lognormal 为 sigma
+    site_latency_ms: dict[str, float] = field(default_factory=dict)
+    error_rate: float = 0.0  # 返回 500 的概率
+    rate_limit_rate: float = 0.0  # 返回 429 的概率
+    retry_after: float = 1.0  # 429 响应的 Retry-After(秒)
+    chunk_delay_ms: float = 0.0  # 流式响应每个分片之间的间隔
+    call_site_header: str = "X-Call-Site"
+    responses: dict[str, list[str]] = field(
+        default_factory=lambda: {site: [text] for site, text in DEFAULT_RESPONSES.items()}
+    )
+
+
+def _completion_payload(
+    model: str, content: str, finish_reason: str = "stop", prompt_tokens: int = 0
+) -> dict[str, Any]:
+    completion_tokens = (len(content) + 3) // 4
+    return {
+        "id": "chatcmpl-stub",
+        "object": "chat.completion",
+        "created": int(time.time()),
+        "model": model,
+        "choices": [
+            {
+                "index": 0,
+                "message": {"role": "assistant", "content": content},
+                "finish_reason": finish_reason,
+            }
+        ],
+        "usage": {
+            "prompt_tokens": prompt_tokens,
+            "completion_tokens": completion_tokens,
+            "total_tokens": prompt_tokens + completion_tokens,
+        },
+    }
+
+
+def _prompt_tokens(request: dict[str, Any]) -> int:
+    # 粗估即可：文本按 4 个字符 1 个 token，每张图片计 85
+    total = 0
+    for message in request.get("messages") or []:
+        content = message.get("content") if isinstance(message, dict) else None
+        for part in content if isinstance(content, list) else [content]:
+            if isinstance(part, dict):
+                if part.get("type") == "image_url":
+                    total += 85
+                    continue
+                part = part.get("text")
+            if isinstance(part, str):
+                total += (len(part) + 3) // 4
+    return total
+
+
+def _chunk_payload(model: str, delta: dict[str, str], finish_reason: str | None) -> dict[str, Any]:
+    return {
+        "id": "chatcmpl-stub",
+        "object": "chat.completion.chunk",
+        "created": int(time.time()),
+        "model": model,
+        "choices": [{"index": 0, "delta": delta, "finish_reason": finish_reason}],
+    }
+
+
+class _StubHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    disable_nagle_algorithm = True
+    server: "StubServer"
+
+    def log_message(self, format: str, *args: Any) -> None:  # noqa: A002
+        return
+
+    def _send_json(self, status: int, payload: dict[str, Any], headers: dict[str, str] | None = None) -> None:
+        body = json.dumps(payload, ensure_ascii=False).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(body)
+
+    def _write_chunk(self, data: bytes) -> None:
+        self.wfile.write(f"{len(data):x}\r\n".encode("ascii") + data + b"\r\n")
+        self.wfile.flush()
+
+    def _send_stream(
+        self,
+        model: str,
+        content: str,
+        finish_reason: str = "stop",
+        usage: dict[str, int] | None = None,
+        chunk_chars: int = 8,
+    ) -> None:
+        # SSE + chunked 编码；客户端提前断开时直接结束
+        self.send_response(200)
+        self.send_header("Content-Type", "text/event-stream")
+        self.send_header("Transfer-Encoding", "chunked")
+        self.end_headers()
+        events = [_chunk_payload(model, {"role": "assistant", "content": ""}, None)]
+        for start in range(0, len(content), chunk_chars):
+            events.append(_chunk_payload(model, {"content": content[start : start + chunk_chars]}, None))
+        events.append(_chunk_payload(model, {}, finish_reason))
+        if usage is not None:
+            # stream_options.include_usage：末尾追加一个 choices 为空、只带 usage 的 chunk
+            events.append({**_chunk_payload(model, {}, None), "choices": [], "usage": usage})
+        try:
+            for event in events:
+                self._write_chunk(f"data: {json.dumps(event, ensure_ascii=False)}\n\n".encode("utf-8"))
+                self.server.on_stream_chunk()
+            self._write_chunk(b"data: [DONE]\n\n")
+            self._write_chunk(b"")
+        except (BrokenPipeError, ConnectionResetError):
+            self.close_connection = True
+
+    def do_POST(self) -> None:  # noqa: N802
+        length = int(self.headers.get("Content-Length") or 0)
+        raw = self.rfile.read(length) if length else b""
+        try:
+            request = json.loads(raw.decode("utf-8") or "{}")
+        except json.JSONDecodeError:
+            self._send_json(400, {"error": {"message": "invalid json"}})
+            return
+        if not self.path.rstrip("/").endswith("/chat/completions"):
+            self._send_json(404, {"error": {"message": f"unknown path {self.path}"}})
+            return
+        self.server.record_connection(self.client_address)
+        call_site = self.headers.get(self.server.config.call_site_header) or "unspecified"
+        rng = self.server.request_rng(call_site, raw)
+
+        delay = self.server.latency_seconds(call_site, rng)
+        if delay > 0:
+            time.sleep(delay)
+        # 错误注入：先判 429 再判 500，两者互斥
+        draw = rng.random()
+        config = self.server.config
+        if draw < config.rate_limit_rate:
+            self.server.count("rate_limited")
+            self._send_json(
+                429,
+                {"error": {"message": "stub rate limit", "type": "rate_limit_error"}},
+                {"Retry-After": f"{config.retry_after:g}"},
+            )
+            return
+        if draw < config.rate_limit_rate + config.error_rate:
+            self.server.count("errors")
+            self._send_json(500, {"error": {"message": "stub internal error", "type": "server_error"}})
+            return
+
+        self.server.count("ok")
+        model = str(request.get("model") or "stub")
+        content = self.server.reply(request, call_site)
+        finish_reason = "stop"
+        # 粗略模拟输出上限：按 4 个字符 1 个 token 截断
+        limit = request.get("max_tokens") or request.get("max_completion_tokens")
+        if isinstance(limit, int) and len(content) > limit * 4:
+            content = content[: limit * 4]
+            finish_reason = "length"
+        payload = _completion_payload(model, content, finish_reason, _prompt_tokens(request))
+        if request.get("stream"):
+            include_usage = (request.get("stream_options") or {}).get("include_usage")
+            self._send_stream(model, content, finish_reason, payload["usage"] if include_usage else None)
+            return
+        self._send_json(200, payload)
+
+
+class StubServer(ThreadingHTTPServer):
+    daemon_threads = True
+
+    def __init__(self, host: str = "127.0.0.1", port: int = 0, config: StubConfig | None = None) -> None:
+        super().__init__((host, port), _StubHandler)
+        self.config = config or StubConfig()
+        self._connections: set[tuple[str, int]] = set()
+        self._lock = threading.Lock()
+        self._thread: threading.Thread | None = None
+        self._seen: dict[str, int] = {}
+        self._replies: dict[str, int] = {}
+        self._counters: dict[str, int] = {"ok": 0, "errors": 0, "rate_limited": 0}
+
+    @property
+    def base_url(self) -> str:
+        host, port = self.server_address[:2]
+        return f"http://{host}:{port}/v1"
+
+    @property
+    def connection_count(self) -> int:
+        with self._lock:
+            return len(self._connections)
+
+    def record_connection(self, address: tuple[str, int]) -> None:
+        with self._lock:
+            self._connections.add(address)
+
+    def count(self, name: str) -> None:
+        with self._lock:
+            self._counters[name] = self._counters.get(name, 0) + 1
+
+    def stats(self) -> dict[str, int]:
+        with self._lock:
+            return dict(self._counters)
+
+    def request_rng(self, call_site: str, body: bytes) -> random.Random:
+        # 按 (种子, 请求体, 该请求体第几次出现) 派生随机数：与线程调度顺序无关，重试时会重新抽样
+        digest = hashlib.sha256(body).hexdigest()
+        with self._lock:
+            occurrence = self._seen.get(digest, 0)
+            self._seen[digest] = occurrence + 1
+        return random.Random(f"{self.config.seed}:{call_site}:{digest}:{occurrence}")
+
+    def latency_seconds(self, call_site: str, rng: random.Random) -> float:
+        config = self.config
+        base_ms = config.site_latency_ms.get(call_site, config.latency_ms)
+        if base_ms <= 0:
+            return 0.0
+        if config.latency == "uniform":
+            low = base_ms * max(0.0, 1 - config.latency_spread)
+            high = base_ms * (1 + config.latency_spread)
+            return rng.uniform(low, high) / 1000
+        if config.latency == "lognormal":
+            return rng.lognormvariate(math.log(base_ms), config.latency_spread) / 1000
+        return base_ms / 1000
+
+    def reply(self, request: dict[str, Any], call_site: str) -> str:
+        # 同一调用点配置多条回复时按请求顺序轮换
+        responses = self.config.responses
+        choices = responses.get(call_site) or responses.get("unspecified") or ["<answer>A</answer>"]
+        with self._lock:
+            index = self._replies.get(call_site, 0)
+            self._replies[call_site] = index + 1
+        return choices[index % len(choices)]
+
+    def on_stream_chunk(self) -> None:
+        if self.config.chunk_delay_ms > 0:
+            time.sleep(self.config.chunk_delay_ms / 1000)
+
+    def start_background(self) -> "StubServer":
+        self._thread = threading.Thread(target=self.serve_forever, daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self) -> None:
+        self.shutdown()
+        self.server_close()
+
+
+def _parse_site_mapping(value: str) -> dict[str, float]:
+    mapping: dict[str, float] = {}
+    for item in value.split(","):
+        if "=" not in item:
+            continue
+        site, number = item.split("=", 1)
+        mapping[site.strip()] = float(number)
+    return mapping
+
+
+def load_responses(path: Path) -> dict[str, list[str]]:
+    """读取 {call_site: 回复 或 [回复, ...]} 格式的 JSON 文件，覆盖对应调用点的默认模板。"""
+    payload = json.loads(path.read_text(encoding="utf-8"))
+    if not isinstance(payload, dict):
+        raise ValueError(f"{path}: 需要 JSON 对象")
+    responses = {site: [text] for site, text in DEFAULT_RESPONSES.items()}
+    for site, value in payload.items():
+        responses[str(site)] = [str(item) for item in value] if isinstance(value, list) else [str(value)]
+    return responses
+
+
+def config_from_args(args: argparse.Namespace) -> StubConfig:
+    return StubConfig(
+        seed=args.seed,
+        latency=args.latency,
+        latency_ms=args.latency_ms,
+        latency_spread=args.latency_spread,
+        site_latency_ms=_parse_site_mapping(args.site_latency_ms),
+        error_rate=args.error_rate,
+        rate_limit_rate=args.rate_limit_rate,
+        retry_after=args.retry_after,
+        chunk_delay_ms=args.chunk_delay_ms,
+        call_site_header=args.call_site_header,
+        **({"responses": load_responses(Path(args.responses))} if args.responses else {}),
+    )
+
+
+def add_stub_arguments(parser: argparse.ArgumentParser) -> None:
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--latency", choices=["fixed", "uniform", "lognormal"], default="fixed")
+    parser.add_argument("--latency-ms", type=float, default=0.0)
+    parser.add_argument("--latency-spread", type=float, default=0.5)
+    parser.add_argument("--site-latency-ms", default="", help="按调用点覆盖，如 step0=800,review=200")
+    parser.add_argument("--error-rate", type=float, default=0.0)
+    parser.add_argument("--rate-limit-rate", type=float, default=0.0)
+    parser.add_argument("--retry-after", type=float, default=1.0)
+    parser.add_argument("--chunk-delay-ms", type=float, default=0.0)
+    parser.add_argument("--call-site-header", default="X-Call-Site")
+    parser.add_argument("--responses", default="", help="JSON 文件：{call_site: 回复 或 [回复, ...]}")
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="OpenAI-compatible stub server")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8765)
+    add_stub_arguments(parser)
+    args = parser.parse_args()
+    server = StubServer(args.host, args.port, config_from_args(args))
+    print(f"stub server listening on {server.base_url}", flush=True)
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        print(f"stub server stats: {json.dumps(server.stats())}", flush=True)
+        server.server_close()
+
+
+if __name__ == "__main__":
+    main()
@@ -7,10 +7,12 @@ from graph.pipeline_graph import (
     group_edges_by_head,
     group_edges_by_tail,
 )
+from graph.knowledge_graph import KnowledgeGraph
 from graph.pipeline_path_sampling import sample_path
 
 __all__ = [
     "KnowledgeEdge",
+    "KnowledgeGraph",
     "build_entity_pool",
     "build_knowledge_edges_cached",
     "edge_to_evidence_payload",
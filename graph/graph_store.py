@@ -0,0 +1,439 @@
+"""SQLite 知识图谱存储：documents / chunks / entities / edges 四张表，替代整体读写的 graph_cache.json。
+
+- 块按 (内容哈希, 模型, 提示词版本) 唯一，文档通过 document_chunks 按顺序引用块；
+- 文档记录最近使用时间（构建或缓存命中时刷新），超出保留数量时按它淘汰最久未用的文档；
+- 实体名单独入表并以整数 id 引用，边上对 head / tail / 来源块建索引，查找与插入均走 B 树索引；
+- WAL + busy_timeout，每个进程/线程一个连接，写入在 IMMEDIATE 事务内完成，多个 worker 进程可共享同一文件。
+
+Usage:
+    python -m graph.graph_store migrate [data/graph_cache.json]
+    python -m graph.graph_store stats
+    python -m graph.graph_store query --head 实体名
+"""
+
+from __future__ import annotations
+
+import argparse
+import json
+import os
+import sqlite3
+import threading
+import time
+from pathlib import Path
+from threading import Lock
+from typing import Any
+
+from utils.config import GRAPH_CACHE_PATH, GRAPH_STORE_PATH, MODEL_JUDGE
+
+# (块内容 sha1, 抽取模型, 提示词版本)
+ChunkKey = tuple[str, str, int]
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value TEXT);
+CREATE TABLE IF NOT EXISTS documents (
+    id INTEGER PRIMARY KEY,
+    doc_key TEXT NOT NULL UNIQUE,
+    built_at REAL NOT NULL,
+    last_used_at REAL
+);
+CREATE INDEX IF NOT EXISTS documents_built_at ON documents (built_at);
+CREATE TABLE IF NOT EXISTS chunks (
+    id INTEGER PRIMARY KEY,
+    content_hash TEXT NOT NULL,
+    model TEXT NOT NULL,
+    prompt_version INTEGER NOT NULL,
+    created_at REAL NOT NULL,
+    UNIQUE (content_hash, model, prompt_version)
+);
+CREATE TABLE IF NOT EXISTS document_chunks (
+    document_id INTEGER NOT NULL REFERENCES documents (id) ON DELETE CASCADE,
+    position INTEGER NOT NULL,
+    chunk_id INTEGER NOT NULL REFERENCES chunks (id),
+    PRIMARY KEY (document_id, position)
+);
+CREATE INDEX IF NOT EXISTS document_chunks_chunk ON document_chunks (chunk_id);
+CREATE TABLE IF NOT EXISTS entities (
+    id INTEGER PRIMARY KEY,
+    name TEXT NOT NULL UNIQUE
+);
+CREATE TABLE IF NOT EXISTS edges (
+    id INTEGER PRIMARY KEY,
+    chunk_id INTEGER NOT NULL REFERENCES chunks (id) ON DELETE CASCADE,
+    local_id INTEGER,
+    head_id INTEGER NOT NULL REFERENCES entities (id),
+    relation TEXT NOT NULL,
+    tail_id INTEGER NOT NULL REFERENCES entities (id),
+    evidence TEXT,
+    source_type TEXT
+);
+CREATE INDEX IF NOT EXISTS edges_head ON edges (head_id);
+CREATE INDEX IF NOT EXISTS edges_tail ON edges (tail_id);
+CREATE INDEX IF NOT EXISTS edges_source ON edges (chunk_id, local_id);
+"""
+
+_EDGE_COLUMNS = """
+    SELECT h.name, e.relation, t.name, e.evidence, e.local_id, e.source_type
+    FROM edges e
+    JOIN entities h ON h.id = e.head_id
+    JOIN entities t ON t.id = e.tail_id
+"""
+
+
+def _edge_row(row: tuple[Any, ...]) -> dict[str, Any]:
+    head, relation, tail, evidence, local_id, source_type = row
+    return {
+        "head": head,
+        "relation": relation,
+        "tail": tail,
+        "evidence": evidence,
+        "source_id": local_id,
+        "source_type": source_type,
+    }
+
+
+class GraphStore:
+    def __init__(self, path: Path, legacy_json: Path | None = None) -> None:
+        path.parent.mkdir(parents=True, exist_ok=True)
+        self._path = path
+        self._legacy_json = legacy_json
+        self._local = threading.local()
+
+    @property
+    def path(self) -> Path:
+        return self._path
+
+    def _connection(self) -> sqlite3.Connection:
+        # sqlite 连接不能跨线程使用，fork 出的子进程也不能沿用父进程的连接
+        conn = getattr(self._local, "conn", None)
+        if conn is None or getattr(self._local, "pid", None) != os.getpid():
+            conn = sqlite3.connect(self._path, timeout=30, isolation_level=None)
+            conn.execute("PRAGMA busy_timeout=30000")
+            _enable_wal(conn)
+            conn.execute("PRAGMA foreign_keys=ON")
+            conn.executescript(_SCHEMA)
+            _migrate(conn)
+            self._local.conn = conn
+            self._local.pid = os.getpid()
+            if self._legacy_json is not None:
+                self._import_legacy_once(conn)
+        return conn
+
+    def _import_legacy_once(self, conn: sqlite3.Connection) -> None:
+        # 首次打开时导入旧版 JSON 缓存；meta 标记在同一事务内写入，多个进程同时启动也只导入一次
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            done = conn.execute("SELECT 1 FROM meta WHERE key = 'legacy_json_imported'").fetchone()
+            if done is None:
+                if self._legacy_json is not None and self._legacy_json.exists():
+                    _import_payload(conn, _read_json(self._legacy_json))
+                conn.execute(
+                    "INSERT INTO meta (key, value) VALUES ('legacy_json_imported', ?)",
+                    (str(self._legacy_json),),
+                )
+            conn.execute("COMMIT")
+        except BaseException:
+            conn.execute("ROLLBACK")
+            raise
+
+    def touch_document(self, doc_key: str) -> bool:
+        """缓存命中时刷新文档的最近使用时间；文档不存在时返回 False。"""
+        cursor = self._connection().execute(
+            "UPDATE documents SET last_used_at = ? WHERE doc_key = ?", (time.time(), doc_key)
+        )
+        return cursor.rowcount > 0
+
+    def load_chunks(self, keys: list[ChunkKey]) -> dict[ChunkKey, list[dict[str, Any]]]:
+        """返回已缓存的块及其边（按块内序号排列）；未缓存的块不在结果中。"""
+        conn = self._connection()
+        found: dict[ChunkKey, list[dict[str, Any]]] = {}
+        for key in keys:
+            row = conn.execute(
+                "SELECT id FROM chunks WHERE content_hash = ? AND model = ? AND prompt_version = ?",
+                key,
+            ).fetchone()
+            if row is None:
+                continue
+            rows = conn.execute(
+                _EDGE_COLUMNS + " WHERE e.chunk_id = ? ORDER BY e.local_id", (row[0],)
+            ).fetchall()
+            found[key] = [_edge_row(edge) for edge in rows]
+        return found
+
+    def save_document(
+        self,
+        doc_key: str,
+        chunk_keys: list[ChunkKey],
+        new_chunks: dict[ChunkKey, list[dict[str, Any]]],
+        max_documents: int = 0,
+    ) -> None:
+        """写入新抽取的块并记录文档引用的块；max_documents > 0 时只保留最近使用的文档，清理不再被引用的块。"""
+        conn = self._connection()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            for key, edges in new_chunks.items():
+                _insert_chunk(conn, key, edges)
+            stale_chunks = _save_document_row(conn, doc_key, chunk_keys)
+            if max_documents > 0:
+                stale_chunks |= _evict_documents(conn, max_documents)
+            _delete_unreferenced_chunks(conn, stale_chunks)
+            conn.execute("COMMIT")
+        except BaseException:
+            conn.execute("ROLLBACK")
+            raise
+
+    def find_edges(self, *, head: str | None = None, tail: str | None = None) -> list[dict[str, Any]]:
+        clauses: list[str] = []
+        params: list[str] = []
+        if head is not None:
+            clauses.append("e.head_id = (SELECT id FROM entities WHERE name = ?)")
+            params.append(head)
+        if tail is not None:
+            clauses.append("e.tail_id = (SELECT id FROM entities WHERE name = ?)")
+            params.append(tail)
+        where = f" WHERE {' AND '.join(clauses)}" if clauses else ""
+        rows = self._connection().execute(_EDGE_COLUMNS + where, params).fetchall()
+        return [_edge_row(row) for row in rows]
+
+    def stats(self) -> dict[str, int]:
+        conn = self._connection()
+        return {
+            table: conn.execute(f"SELECT COUNT(*) FROM {table}").fetchone()[0]
+            for table in ("documents", "chunks", "entities", "edges")
+        }
+
+    def import_json(self, path: Path) -> dict[str, int]:
+        conn = self._connection()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            counts = _import_payload(conn, _read_json(path))
+            conn.execute("COMMIT")
+        except BaseException:
+            conn.execute("ROLLBACK")
+            raise
+        return counts
+
+
+def _enable_wal(conn: sqlite3.Connection) -> None:
+    # 切换 journal_mode 需要独占锁且不走 busy handler：多个进程同时首次打开新库时可能直接报 locked，稍后重试
+    deadline = time.monotonic() + 30
+    while True:
+        try:
+            conn.execute("PRAGMA journal_mode=WAL")
+            return
+        except sqlite3.OperationalError as exc:
+            if "locked" not in str(exc) or time.monotonic() >= deadline:
+                raise
+            time.sleep(0.05)
+
+
+def _migrate(conn: sqlite3.Connection) -> None:
+    # 旧库的 documents 表没有 last_used_at：补列并以 built_at 初始化，在 IMMEDIATE 事务内检查，多个进程只执行一次
+    columns = {row[1] for row in conn.execute("PRAGMA table_info(documents)")}
+    if "last_used_at" not in columns:
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            columns = {row[1] for row in conn.execute("PRAGMA table_info(documents)")}
+            if "last_used_at" not in columns:
+                conn.execute("ALTER TABLE documents ADD COLUMN last_used_at REAL")
+                conn.execute("UPDATE documents SET last_used_at = built_at")
+            conn.execute("COMMIT")
+        except BaseException:
+            conn.execute("ROLLBACK")
+            raise
+    conn.execute("CREATE INDEX IF NOT EXISTS documents_last_used_at ON documents (last_used_at)")
+
+
+def _entity_id(conn: sqlite3.Connection, name: str) -> int:
+    conn.execute("INSERT OR IGNORE INTO entities (name) VALUES (?)", (name,))
+    return conn.execute("SELECT id FROM entities WHERE name = ?", (name,)).fetchone()[0]
+
+
+def _insert_chunk(conn: sqlite3.Connection, key: ChunkKey, edges: list[dict[str, Any]]) -> bool:
+    cursor = conn.execute(
+        "INSERT OR IGNORE INTO chunks (content_hash, model, prompt_version, created_at) VALUES (?, ?, ?, ?)",
+        (*key, time.time()),
+    )
+    if cursor.rowcount == 0:
+        # 其他 worker 已写入同一块
+        return False
+    chunk_id = cursor.lastrowid
+    conn.executemany(
+        "INSERT INTO edges (chunk_id, local_id, head_id, relation, tail_id, evidence, source_type)"
+        " VALUES (?, ?, ?, ?, ?, ?, ?)",
+        [
+            (
+                chunk_id,
+                edge.get("source_id"),
+                _entity_id(conn, edge["head"]),
+                edge["relation"],
+                _entity_id(conn, edge["tail"]),
+                edge.get("evidence"),
+                edge.get("source_type"),
+            )
+            for edge in edges
+        ],
+    )
+    return True
+
+
+def _save_document_row(
+    conn: sqlite3.Connection, doc_key: str, chunk_keys: list[ChunkKey], built_at: float | None = None
+) -> set[int]:
+    built_at = time.time() if built_at is None else built_at
+    conn.execute(
+        "INSERT INTO documents (doc_key, built_at, last_used_at) VALUES (?, ?, ?)"
+        " ON CONFLICT (doc_key) DO UPDATE SET built_at = excluded.built_at,"
+        " last_used_at = MAX(COALESCE(last_used_at, 0), excluded.last_used_at)",
+        (doc_key, built_at, built_at),
+    )
+    document_id = conn.execute("SELECT id FROM documents WHERE doc_key = ?", (doc_key,)).fetchone()[0]
+    previous = {
+        row[0]
+        for row in conn.execute(
+            "SELECT chunk_id FROM document_chunks WHERE document_id = ?", (document_id,)
+        )
+    }
+    conn.execute("DELETE FROM document_chunks WHERE document_id = ?", (document_id,))
+    for position, key in enumerate(chunk_keys):
+        # 抽取失败的块没有入库，下次构建时会重新抽取
+        conn.execute(
+            "INSERT INTO document_chunks (document_id, position, chunk_id)"
+            " SELECT ?, ?, id FROM chunks WHERE content_hash = ? AND model = ? AND prompt_version = ?",
+            (document_id, position, *key),
+        )
+    return previous
+
+
+def _evict_documents(conn: sqlite3.Connection, max_documents: int) -> set[int]:
+    evicted = [
+        row[0]
+        for row in conn.execute(
+            "SELECT id FROM documents ORDER BY last_used_at DESC LIMIT -1 OFFSET ?", (max_documents,)
+        )
+    ]
+    chunk_ids: set[int] = set()
+    for document_id in evicted:
+        chunk_ids.update(
+            row[0]
+            for row in conn.execute(
+                "SELECT chunk_id FROM document_chunks WHERE document_id = ?", (document_id,)
+            )
+        )
+        conn.execute("DELETE FROM documents WHERE id = ?", (document_id,))
+    return chunk_ids
+
+
+def _delete_unreferenced_chunks(conn: sqlite3.Connection, chunk_ids: set[int]) -> None:
+    # 只检查本次可能失去引用的块与实体，清理开销与被清理的规模成正比，而不是与全库大小成正比
+    entity_ids: set[int] = set()
+    for chunk_id in chunk_ids:
+        if conn.execute(
+            "SELECT 1 FROM document_chunks WHERE chunk_id = ? LIMIT 1", (chunk_id,)
+        ).fetchone():
+            continue
+        for head_id, tail_id in conn.execute(
+            "SELECT head_id, tail_id FROM edges WHERE chunk_id = ?", (chunk_id,)
+        ):
+            entity_ids.update((head_id, tail_id))
+        conn.execute("DELETE FROM chunks WHERE id = ?", (chunk_id,))
+    for entity_id in entity_ids:
+        conn.execute(
+            "DELETE FROM entities WHERE id = ?"
+            " AND NOT EXISTS (SELECT 1 FROM edges WHERE head_id = ?)"
+            " AND NOT EXISTS (SELECT 1 FROM edges WHERE tail_id = ?)",
+            (entity_id, entity_id, entity_id),
+        )
+
+
+def _read_json(path: Path) -> dict[str, Any]:
+    payload = json.loads(path.read_text(encoding="utf-8"))
+    return payload if isinstance(payload, dict) else {}
+
+
+def _parse_chunk_key(text: str) -> ChunkKey | None:
+    # JSON 缓存中的块键格式为 "<sha1>:<model>:v<prompt_version>"
+    content_hash, _, rest = text.partition(":")
+    model, _, version = rest.rpartition(":v")
+    if not content_hash or not model or not version.isdigit():
+        return None
+    return content_hash, model, int(version)
+
+
+def _import_payload(conn: sqlite3.Connection, payload: dict[str, Any]) -> dict[str, int]:
+    """导入旧版 JSON 缓存：v4 按块存储；v3 及更早按整篇文档存储，等价于只有一个块（提示词版本 1）的文档。"""
+    chunks: dict[ChunkKey, list[dict[str, Any]]] = {}
+    documents: dict[str, tuple[list[ChunkKey], float]] = {}
+    if isinstance(payload.get("documents"), dict) and isinstance(payload.get("chunks"), dict):
+        for text, entry in payload["chunks"].items():
+            key = _parse_chunk_key(text)
+            if key is not None and isinstance(entry, dict) and isinstance(entry.get("edges"), list):
+                chunks[key] = entry["edges"]
+        for doc_key, entry in payload["documents"].items():
+            if not isinstance(entry, dict):
+                continue
+            keys = [key for key in map(_parse_chunk_key, entry.get("chunks") or []) if key]
+            documents[doc_key] = (keys, float(entry.get("built_at") or 0.0))
+    else:
+        items = payload.get("items") if isinstance(payload.get("items"), dict) else payload
+        for doc_key, entry in items.items():
+            if not isinstance(entry, dict) or not isinstance(entry.get("edges"), list):
+                continue
+            key = (doc_key, str(entry.get("model") or MODEL_JUDGE), 1)
+            chunks[key] = entry["edges"]
+            documents[doc_key] = ([key], 0.0)
+
+    imported_chunks = 0
+    for key, edges in chunks.items():
+        valid = [
+            edge
+            for edge in edges
+            if isinstance(edge, dict) and edge.get("head") and edge.get("relation") and edge.get("tail")
+        ]
+        imported_chunks += _insert_chunk(conn, key, valid)
+    imported_documents = 0
+    for doc_key, (keys, built_at) in documents.items():
+        exists = conn.execute("SELECT 1 FROM documents WHERE doc_key = ?", (doc_key,)).fetchone()
+        if exists:
+            continue
+        _save_document_row(conn, doc_key, keys, built_at)
+        imported_documents += 1
+    return {"documents": imported_documents, "chunks": imported_chunks}
+
+
+_STORE: GraphStore | None = None
+_STORE_LOCK = Lock()
+
+
+def get_graph_store() -> GraphStore:
+    global _STORE
+    with _STORE_LOCK:
+        if _STORE is None:
+            _STORE = GraphStore(Path(GRAPH_STORE_PATH), legacy_json=Path(GRAPH_CACHE_PATH))
+        return _STORE
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="知识图谱存储工具")
+    parser.add_argument("--db", default=GRAPH_STORE_PATH)
+    subparsers = parser.add_subparsers(dest="command", required=True)
+    migrate_parser = subparsers.add_parser("migrate", help="导入旧版 JSON 知识边缓存")
+    migrate_parser.add_argument("source", nargs="?", default=GRAPH_CACHE_PATH)
+    subparsers.add_parser("stats", help="各表行数")
+    query_parser = subparsers.add_parser("query", help="按实体查边")
+    query_parser.add_argument("--head")
+    query_parser.add_argument("--tail")
+    args = parser.parse_args()
+
+    store = GraphStore(Path(args.db))
+    if args.command == "migrate":
+        counts = store.import_json(Path(args.source))
+        print(f"imported {counts['documents']} documents, {counts['chunks']} chunks -> {args.db}")
+    elif args.command == "stats":
+        print(json.dumps(store.stats(), indent=2))
+    else:
+        for edge in store.find_edges(head=args.head, tail=args.tail):
+            print(json.dumps(edge, ensure_ascii=False))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,99 @@
+from collections.abc import Iterable, Iterator
+
+from graph.pipeline_graph import KnowledgeEdge
+
+
+class KnowledgeGraph:
+    """
+    一轮生成所用的本地知识图谱，构建一次后供采样、干扰项、分支提示等共用。
+
+    实体名驻留为整数 id；out_edges / in_edges 按实体 id 存放以其为 head / tail 的边序号，
+    edges_by_source_type 按来源类型（text / image）存放边序号。
+    """
+
+    __slots__ = (
+        "edges",
+        "entity_names",
+        "entity_ids",
+        "edge_heads",
+        "edge_tails",
+        "out_edges",
+        "in_edges",
+        "edges_by_source_type",
+        "_sorted_entities",
+    )
+
+    def __init__(self, edges: Iterable[KnowledgeEdge]) -> None:
+        self.edges: tuple[KnowledgeEdge, ...] = tuple(edges)
+        self.entity_names: list[str] = []
+        self.entity_ids: dict[str, int] = {}
+        self.edge_heads: list[int] = []
+        self.edge_tails: list[int] = []
+        self.out_edges: list[list[int]] = []
+        self.in_edges: list[list[int]] = []
+        self.edges_by_source_type: dict[str, list[int]] = {}
+        for index, edge in enumerate(self.edges):
+            head = self._intern(edge.head)
+            tail = self._intern(edge.tail)
+            self.edge_heads.append(head)
+            self.edge_tails.append(tail)
+            self.out_edges[head].append(index)
+            self.in_edges[tail].append(index)
+            self.edges_by_source_type.setdefault(edge.source_type or "text", []).append(index)
+        self._sorted_entities = sorted(self.entity_names)
+
+    def _intern(self, name: str) -> int:
+        entity_id = self.entity_ids.get(name)
+        if entity_id is None:
+            entity_id = self.entity_ids[name] = len(self.entity_names)
+            self.entity_names.append(name)
+            self.out_edges.append([])
+            self.in_edges.append([])
+        return entity_id
+
+    def __len__(self) -> int:
+        return len(self.edges)
+
+    def __iter__(self) -> Iterator[KnowledgeEdge]:
+        return iter(self.edges)
+
+    @property
+    def num_entities(self) -> int:
+        return len(self.entity_names)
+
+    def edges_from(self, entity: str) -> list[KnowledgeEdge]:
+        entity_id = self.entity_ids.get(entity)
+        if entity_id is None:
+            return []
+        return [self.edges[index] for index in self.out_edges[entity_id]]
+
+    def edges_to(self, entity: str) -> list[KnowledgeEdge]:
+        entity_id = self.entity_ids.get(entity)
+        if entity_id is None:
+            return []
+        return [self.edges[index] for index in self.in_edges[entity_id]]
+
+    def edges_of_type(self, source_type: str) -> list[KnowledgeEdge]:
+        return [self.edges[index] for index in self.edges_by_source_type.get(source_type, [])]
+
+    def has_source_type(self, source_type: str) -> bool:
+        return bool(self.edges_by_source_type.get(source_type))
+
+    def entity_pool(self) -> list[str]:
+        """按名称排序的全部实体，等价于 build_entity_pool(edges)。"""
+        return list(self._sorted_entities)
+
+    def distractors(self, answer: str, limit: int | None = None) -> list[str]:
+        """除答案外的实体（按名称排序），取到 limit 个即停止。"""
+        picked: list[str] = []
+        for entity in self._sorted_entities:
+            if entity == answer:
+                continue
+            picked.append(entity)
+            if limit is not None and len(picked) >= limit:
+                break
+        return picked
+
+    def branch_candidates(self, edge: KnowledgeEdge) -> list[KnowledgeEdge]:
+        """与 edge 同一 head、但指向其他 tail 的边，用作分支/对比知识。"""
+        return [candidate for candidate in self.edges_from(edge.head) if candidate.tail != edge.tail]
@@ -1,18 +1,28 @@
+import asyncio
 import hashlib
 import json
 import os
-from dataclasses import dataclass
-from pathlib import Path
+import re
+import sqlite3
+import zlib
+from dataclasses import dataclass, replace
 from typing import Any
 
-from utils.api_client import call_text_model
+from graph.graph_store import ChunkKey, get_graph_store
+from utils.api_client import CircuitOpenError, acall_text_model, call_text_model, run_async
 from utils.config import (
     DEFAULT_TEMPERATURE,
+    DOC_CHUNK_WORDS,
+    GRAPH_CACHE_MAX_DOCUMENTS,
+    GRAPH_CHUNK_OVERLAP_WORDS,
+    GRAPH_EXTRACTION_MODE,
     MODEL_JUDGE,
 )
+from utils.llm_cache import LLMCacheMiss
+from utils.tracing import traced
 
 
-@dataclass(frozen=True)
+@dataclass(frozen=True, slots=True)
 class KnowledgeEdge:
     head: str
     relation: str
@@ -24,9 +34,14 @@ class KnowledgeEdge:
 
 _EDGE_CACHE: dict[str, list[KnowledgeEdge]] = {}
 _DEBUG_GRAPH = os.getenv("GRAPH_DEBUG", "false").lower() in {"1", "true", "yes"}
-_DISK_CACHE_VERSION = 3
-_DISK_CACHE_PATH = Path(os.getenv("GRAPH_CACHE_PATH", "data/graph_cache.json"))
-_DISK_CACHE: dict[str, dict[str, Any]] | None = None
+# 修改 _chain_extraction_prompt 时递增，旧提示词抽出的分块缓存随之失效
+_CHAIN_PROMPT_VERSION = 1
+# chunked 模式下 source_id = 块序号 * 步长 + 块内边序号，不同块的边不会撞号，且可由 source_id 反查所在块
+_CHUNK_SOURCE_STRIDE = 1000
+# 一个 CJK 字符算一个词，其余按空白切分，中英文混排时块大小都近似按“词数”计
+_WORD_RE = re.compile(r"[\u3400-\u9fff\uf900-\ufaff]|[^\s\u3400-\u9fff\uf900-\ufaff]+")
+# 分块边界由最近几个词的哈希决定，插入/删除一段文字只影响附近的块
+_BOUNDARY_WINDOW_WORDS = 3
 
 
 def _debug_log(message: str) -> None:
@@ -34,38 +49,6 @@ def _debug_log(message: str) -> None:
         print(message)
 
 
-def _load_disk_cache() -> dict[str, dict[str, Any]]:
-    global _DISK_CACHE
-    if _DISK_CACHE is not None:
-        return _DISK_CACHE
-    if not _DISK_CACHE_PATH.exists():
-        _DISK_CACHE = {}
-        return _DISK_CACHE
-    try:
-        payload = json.loads(_DISK_CACHE_PATH.read_text(encoding="utf-8"))
-    except (OSError, json.JSONDecodeError) as exc:
-        _debug_log(f"[Graph Mode][Knowledge] disk cache read failed: {exc}")
-        _DISK_CACHE = {}
-        return _DISK_CACHE
-    if isinstance(payload, dict) and isinstance(payload.get("items"), dict):
-        _DISK_CACHE = payload["items"]
-        return _DISK_CACHE
-    if isinstance(payload, dict):
-        _DISK_CACHE = payload
-        return _DISK_CACHE
-    _DISK_CACHE = {}
-    return _DISK_CACHE
-
-
-def _save_disk_cache(items: dict[str, dict[str, Any]]) -> None:
-    try:
-        _DISK_CACHE_PATH.parent.mkdir(parents=True, exist_ok=True)
-        payload = {"version": _DISK_CACHE_VERSION, "items": items}
-        _DISK_CACHE_PATH.write_text(json.dumps(payload, ensure_ascii=True), encoding="utf-8")
-    except OSError as exc:
-        _debug_log(f"[Graph Mode][Knowledge] disk cache write failed: {exc}")
-
-
 def _serialize_edges(edges: list[KnowledgeEdge]) -> list[dict[str, Any]]:
     return [
         {
@@ -119,9 +102,58 @@ def _deserialize_edges(data: list[dict[str, Any]]) -> list[KnowledgeEdge]:
 
 def _cache_key(context: str) -> str:
     payload = context.encode("utf-8")
+    if GRAPH_EXTRACTION_MODE == "chunked":
+        # 分块参数不同，切出的块也不同；single 模式保持原有键，已有缓存继续可用
+        prefix = f"chunked:{DOC_CHUNK_WORDS}:{GRAPH_CHUNK_OVERLAP_WORDS}\n".encode("utf-8")
+        payload = prefix + payload
     return hashlib.sha1(payload).hexdigest()
 
 
+def _chunk_cache_key(chunk: str) -> ChunkKey:
+    content_hash = hashlib.sha1(chunk.encode("utf-8")).hexdigest()
+    return content_hash, MODEL_JUDGE, _CHAIN_PROMPT_VERSION
+
+
+def split_context_chunks(
+    context: str,
+    chunk_words: int = DOC_CHUNK_WORDS,
+    overlap_words: int = GRAPH_CHUNK_OVERLAP_WORDS,
+) -> list[str]:
+    """把全文切成平均约 chunk_words 词、相互重叠 overlap_words 词的块；块是原文的连续切片。
+
+    边界按内容确定（最近几个词的哈希命中即切分，块长限制在 [chunk_words/2, chunk_words*2]），
+    文档局部修改后其余块的内容不变，分块缓存仍能命中。
+    """
+    text = context.strip()
+    spans = [match.span() for match in _WORD_RE.finditer(text)]
+    if not spans:
+        return []
+    words = [text[begin:end].casefold() for begin, end in spans]
+    min_words = max(1, chunk_words // 2)
+    max_words = max(min_words, chunk_words * 2)
+    divisor = max(1, chunk_words - min_words)
+    bounds: list[tuple[int, int]] = []
+    start = 0
+    for index in range(len(words)):
+        size = index - start + 1
+        if size < min_words:
+            continue
+        window = " ".join(words[max(start, index - _BOUNDARY_WINDOW_WORDS + 1) : index + 1])
+        if size >= max_words or zlib.crc32(window.encode("utf-8")) % divisor == 0:
+            bounds.append((start, index + 1))
+            start = index + 1
+    if start < len(words):
+        if bounds and len(words) - start < min_words:
+            bounds[-1] = (bounds[-1][0], len(words))
+        else:
+            bounds.append((start, len(words)))
+    overlap_words = max(0, overlap_words)
+    return [
+        text[spans[max(0, begin - overlap_words)][0] : spans[end - 1][1]]
+        for begin, end in bounds
+    ]
+
+
 def _chain_extraction_prompt(context: str) -> str:
     return (
         "请从下面全文中总结多条“串联的知识点链”，用于构建本地知识图谱。\n"
@@ -140,13 +172,9 @@ def _chain_extraction_prompt(context: str) -> str:
     )
 
 
-def extract_edges_from_context(context: str, source_type: str | None = "text") -> list[KnowledgeEdge]:
-    prompt = _chain_extraction_prompt(context)
-    raw = call_text_model(
-        prompt,
-        MODEL_JUDGE,
-        temperature=DEFAULT_TEMPERATURE,
-    )
+def _parse_chain_edges(
+    raw: str, source_type: str | None, source_base: int = 0
+) -> list[KnowledgeEdge]:
     cleaned = raw.strip()
     if cleaned.startswith("```"):
         cleaned = cleaned.strip("`").strip()
@@ -201,7 +229,7 @@ def extract_edges_from_context(context: str, source_type: str | None = "text") -
                     relation=relation,
                     tail=tail,
                     evidence=evidence,
-                    source_id=edge_id,
+                    source_id=source_base + edge_id,
                     source_type=source_type,
                 )
             )
@@ -212,37 +240,112 @@ def extract_edges_from_context(context: str, source_type: str | None = "text") -
     return edges
 
 
+def extract_edges_from_context(context: str, source_type: str | None = "text") -> list[KnowledgeEdge]:
+    prompt = _chain_extraction_prompt(context)
+    raw = call_text_model(
+        prompt,
+        MODEL_JUDGE,
+        temperature=DEFAULT_TEMPERATURE,
+        call_site="graph_extraction",
+    )
+    return _parse_chain_edges(raw, source_type)
+
+
+async def _extract_chunks_parallel(chunks: list[str]) -> list[str | BaseException]:
+    # 各块同时发出，实际并发度由 api_client 的按模型并发槽位控制
+    tasks = [
+        acall_text_model(
+            _chain_extraction_prompt(chunk),
+            MODEL_JUDGE,
+            temperature=DEFAULT_TEMPERATURE,
+            call_site="graph_extraction",
+        )
+        for chunk in chunks
+    ]
+    return await asyncio.gather(*tasks, return_exceptions=True)
+
+
+def _merge_chunk_edges(
+    chunk_edges: list[list[KnowledgeEdge] | None], renumber: bool
+) -> list[KnowledgeEdge]:
+    """按 (head, relation, tail) 合并各块的边；重叠区域被相邻两块各抽出一次时只保留序号较小的块中的那条。"""
+    edges: list[KnowledgeEdge] = []
+    seen: set[tuple[str, str, str]] = set()
+    for index, local_edges in enumerate(chunk_edges):
+        source_base = (index + 1) * _CHUNK_SOURCE_STRIDE if renumber else 0
+        for edge in local_edges or []:
+            key = (edge.head.casefold(), edge.relation.casefold(), edge.tail.casefold())
+            if key in seen:
+                continue
+            seen.add(key)
+            if source_base and edge.source_id is not None:
+                edge = replace(edge, source_id=source_base + edge.source_id)
+            edges.append(edge)
+    return edges
+
+
+@traced()
 def build_knowledge_edges_cached(context: str) -> list[KnowledgeEdge]:
+    """构建全文的知识边。图存储按块缓存（块内容哈希 + 模型 + 提示词版本），
+    文档修改后只有新增或变化的块需要重新调用模型；single 模式下全文即一个块。"""
     key = _cache_key(context)
     if key in _EDGE_CACHE:
+        try:
+            # 进程内命中也刷新存储中的最近使用时间，避免正在使用的文档被其他进程清理
+            get_graph_store().touch_document(key)
+        except sqlite3.Error as exc:
+            _debug_log(f"[Graph Mode][Knowledge] graph store touch failed: {exc}")
         return _EDGE_CACHE[key]
 
-    disk_cache = _load_disk_cache()
-    disk_entry = disk_cache.get(key)
-    if isinstance(disk_entry, dict):
-        cached_version = disk_entry.get("version")
-        cached_model = disk_entry.get("model")
-        cached_edges = disk_entry.get("edges")
-        if (
-            cached_version == _DISK_CACHE_VERSION
-            and cached_model in (None, MODEL_JUDGE)
-            and isinstance(cached_edges, list)
-        ):
-            edges = _deserialize_edges(cached_edges)
-            _EDGE_CACHE[key] = edges
-            _debug_log(
-                f"[Graph Mode][Knowledge] disk cache hit key={key} edges={len(edges)}"
-            )
-            return edges
-
-    edges = extract_edges_from_context(context, source_type="text")
-    _EDGE_CACHE[key] = edges
-    disk_cache[key] = {
-        "version": _DISK_CACHE_VERSION,
-        "model": MODEL_JUDGE,
-        "edges": _serialize_edges(edges),
-    }
-    _save_disk_cache(disk_cache)
+    chunked = GRAPH_EXTRACTION_MODE == "chunked"
+    chunks = split_context_chunks(context) if chunked else [context]
+    chunk_keys = [_chunk_cache_key(chunk) for chunk in chunks]
+    store = get_graph_store()
+    cached = store.load_chunks(chunk_keys)
+    chunk_edges: list[list[KnowledgeEdge] | None] = []
+    missing: list[int] = []
+    for index, chunk_key in enumerate(chunk_keys):
+        if chunk_key in cached:
+            chunk_edges.append(_deserialize_edges(cached[chunk_key]))
+        else:
+            chunk_edges.append(None)
+            missing.append(index)
+
+    new_chunks: dict[ChunkKey, list[dict[str, Any]]] = {}
+    failures: list[BaseException] = []
+    if missing:
+        results = run_async(_extract_chunks_parallel([chunks[index] for index in missing]))
+        for result in results:
+            # replay-only 未命中、熔断快速失败与取消是整次构建的问题而不是单块失败：与单次调用一致直接抛出，
+            # 不保存只含部分块的图
+            if isinstance(result, (LLMCacheMiss, CircuitOpenError, asyncio.CancelledError)):
+                raise result
+        for index, result in zip(missing, results):
+            if isinstance(result, BaseException):
+                failures.append(result)
+                _debug_log(f"[Graph Mode][Knowledge] chunk {index} extraction failed: {result!r}")
+                continue
+            local_edges = _parse_chain_edges(result, "text")
+            chunk_edges[index] = local_edges
+            new_chunks[chunk_keys[index]] = _serialize_edges(local_edges)
+        if len(failures) == len(chunks):
+            # 全部失败时与单次调用一致，把异常抛给调用方
+            raise failures[0]
+    _debug_log(
+        f"[Graph Mode][Knowledge] chunks={len(chunks)} cached={len(chunks) - len(missing)} "
+        f"extracted={len(new_chunks)} failed={len(failures)}"
+    )
+
+    edges = _merge_chunk_edges(chunk_edges, renumber=chunked)
+    if not failures:
+        # 有块失败时不放入进程内缓存，下次调用只重试失败的块
+        _EDGE_CACHE[key] = edges
+    try:
+        # 全部命中时只刷新文档的最近使用时间；清理按最近使用而不是最近构建排序
+        if new_chunks or not store.touch_document(key):
+            store.save_document(key, chunk_keys, new_chunks, GRAPH_CACHE_MAX_DOCUMENTS)
+    except sqlite3.Error as exc:
+        _debug_log(f"[Graph Mode][Knowledge] graph store write failed: {exc}")
     _debug_log(f"[Graph Mode][Knowledge] total_edges={len(edges)}")
     return edges
 
@@ -1,63 +1,201 @@
 import random
 
-from graph.pipeline_graph import KnowledgeEdge, group_edges_by_head
-from utils.config import MAX_SHORTCUT_EDGES, PATH_SAMPLER, REQUIRE_DISTINCT_SOURCES
+from graph.knowledge_graph import KnowledgeGraph
+from graph.pipeline_graph import KnowledgeEdge
+from utils.config import MAX_SHORTCUT_EDGES, REQUIRE_DISTINCT_SOURCES
+
+# 相邻两条边之外的来源重复只能在抽样后检查：先拒绝重抽，仍抽不到时在可行路径数不大的情况下穷举；
+# 路径太多无法穷举时放宽为只要求相邻边来源不同，返回最后一次抽样
+_MAX_REJECTION_DRAWS = 256
+_MAX_ENUMERATED_PATHS = 200_000
+
+
+class PathSampler:
+    """
+    恰好 length 条边的知识链路径的均匀采样器。
+
+    预先按边计算“从这条边出发、还剩 r 步时的合法续接数”（状态里带着已用捷径数与是否已经过图片边），
+    之后一次前向抽样即可得到均匀分布的路径；count == 0 时说明不存在合法路径，无需反复重试。
+    相邻两条边的来源约束与捷径上限在计数中精确处理；require_distinct_sources 下更远距离的来源重复
+    （只会出现在带环的路径上）靠拒绝抽样排除，拒绝抽样不改变均匀性；拒绝抽样失败且路径数超过穷举上限时，
+    退化为在“相邻边来源不同”的路径中均匀抽取。
+    """
+
+    def __init__(
+        self,
+        graph: KnowledgeGraph,
+        length: int,
+        *,
+        require_image: bool = False,
+        require_distinct_sources: bool = REQUIRE_DISTINCT_SOURCES,
+        max_shortcut_edges: int = MAX_SHORTCUT_EDGES,
+    ) -> None:
+        self._graph = graph
+        self._length = length
+        self._require_image = require_image
+        self._distinct = require_distinct_sources
+        # 要求来源互不相同时相邻边不可能同源，捷径数恒为 0
+        self._max_shortcuts = 0 if require_distinct_sources else max(0, min(max_shortcut_edges, length - 1))
+        self._is_image = [edge.source_type == "image" for edge in graph.edges]
+        self._successors = [
+            [
+                (next_index, shortcut)
+                for next_index in graph.out_edges[graph.edge_tails[index]]
+                if (shortcut := self._step_cost(edge, graph.edges[next_index])) is not None
+            ]
+            for index, edge in enumerate(graph.edges)
+        ]
+        # _counts[r][edge][shortcuts][has_image]：当前在 edge（已计入路径）、还需 r 条边时的合法续接数
+        self._counts: list[list[list[list[int]]]] = []
+        if length > 0:
+            self._fill_counts()
+        self.count = self._start_count()
+
+    def _step_cost(self, current: KnowledgeEdge, following: KnowledgeEdge) -> int | None:
+        """续接 following 消耗的捷径数；None 表示不允许续接。"""
+        same_source = current.source_id is not None and current.source_id == following.source_id
+        if not same_source:
+            return 0
+        if self._distinct:
+            return None
+        return 1
+
+    def _fill_counts(self) -> None:
+        shortcut_states = self._max_shortcuts + 1
+        image_done = 0 if self._require_image else 1
+        base = [[1 if has_image or image_done else 0 for has_image in (0, 1)] for _ in range(shortcut_states)]
+        self._counts.append([base for _ in self._graph.edges])
+        for _ in range(1, self._length):
+            previous = self._counts[-1]
+            layer: list[list[list[int]]] = []
+            for successors in self._successors:
+                table = [[0, 0] for _ in range(shortcut_states)]
+                for used in range(shortcut_states):
+                    for has_image in (0, 1):
+                        total = 0
+                        for next_index, shortcut in successors:
+                            if used + shortcut > self._max_shortcuts:
+                                continue
+                            total += previous[next_index][used + shortcut][has_image or self._is_image[next_index]]
+                        table[used][has_image] = total
+                layer.append(table)
+            self._counts.append(layer)
+
+    def _start_weights(self) -> list[tuple[int, int]]:
+        if self._length <= 0:
+            return []
+        top = self._counts[self._length - 1]
+        return [
+            (index, top[index][0][self._is_image[index]])
+            for index in range(len(self._graph.edges))
+        ]
+
+    def _start_count(self) -> int:
+        return sum(weight for _, weight in self._start_weights())
+
+    @staticmethod
+    def _pick(weighted: list[tuple[int, int]]) -> int:
+        # 整数权重精确抽样，计数很大时也不会因浮点误差偏离均匀
+        target = random.randrange(sum(weight for _, weight in weighted))
+        for index, weight in weighted:
+            if target < weight:
+                return index
+            target -= weight
+        raise AssertionError("unreachable")
+
+    def _draw(self) -> list[int]:
+        current = self._pick([item for item in self._start_weights() if item[1]])
+        path = [current]
+        used = 0
+        has_image = self._is_image[current]
+        for remaining in range(self._length - 2, -1, -1):
+            layer = self._counts[remaining]
+            options: list[tuple[int, int]] = []
+            shortcut_of: dict[int, int] = {}
+            for next_index, shortcut in self._successors[current]:
+                if used + shortcut > self._max_shortcuts:
+                    continue
+                weight = layer[next_index][used + shortcut][has_image or self._is_image[next_index]]
+                if weight:
+                    options.append((next_index, weight))
+                    shortcut_of[next_index] = shortcut
+            current = self._pick(options)
+            used += shortcut_of[current]
+            has_image = has_image or self._is_image[current]
+            path.append(current)
+        return path
+
+    def _sources_distinct(self, path: list[int]) -> bool:
+        sources = [self._graph.edges[index].source_id for index in path]
+        known = [source for source in sources if source is not None]
+        return len(known) == len(set(known))
+
+    def _enumerate(self) -> list[list[int]]:
+        # 只沿计数非零的状态展开，展开的分支数不超过 count
+        found: list[list[int]] = []
+
+        def extend(path: list[int], used: int, has_image: int, remaining: int) -> None:
+            if remaining == 0:
+                if not self._distinct or self._sources_distinct(path):
+                    found.append(list(path))
+                return
+            layer = self._counts[remaining - 1]
+            for next_index, shortcut in self._successors[path[-1]]:
+                if used + shortcut > self._max_shortcuts:
+                    continue
+                next_image = has_image or self._is_image[next_index]
+                if layer[next_index][used + shortcut][next_image]:
+                    path.append(next_index)
+                    extend(path, used + shortcut, next_image, remaining - 1)
+                    path.pop()
+
+        for index, weight in self._start_weights():
+            if weight:
+                extend([index], 0, self._is_image[index], self._length - 1)
+        return found
+
+    def sample(self) -> list[KnowledgeEdge]:
+        """均匀抽取一条合法路径；不存在时返回空列表。"""
+        if self.count == 0:
+            return []
+        candidate: list[int] | None = None
+        draws = _MAX_REJECTION_DRAWS if self._distinct else 1
+        for _ in range(draws):
+            path = self._draw()
+            if not self._distinct or self._sources_distinct(path):
+                candidate = path
+                break
+        if candidate is None:
+            if self.count > _MAX_ENUMERATED_PATHS:
+                print(
+                    f"[Graph Mode] 拒绝抽样 {draws} 次未抽到来源互不相同的路径，且候选路径过多（{self.count} 条）"
+                    f"无法穷举，放宽为只要求相邻知识边来源不同。"
+                )
+                candidate = path
+            else:
+                valid = self._enumerate()
+                if not valid:
+                    return []
+                candidate = random.choice(valid)
+        return [self._graph.edges[index] for index in candidate]
 
 
 def sample_path(
-    edges: list[KnowledgeEdge],
+    graph: KnowledgeGraph,
     length: int,
     *,
+    require_image: bool = False,
     require_distinct_sources: bool = REQUIRE_DISTINCT_SOURCES,
-    sampler: str = PATH_SAMPLER,
     max_shortcut_edges: int = MAX_SHORTCUT_EDGES,
 ) -> list[KnowledgeEdge]:
-    if length <= 0:
-        return []
-    if not edges:
+    """在所有恰好 length 条边、首尾相接的合法路径中均匀抽取一条；不存在合法路径时返回空列表。"""
+    if length <= 0 or not graph:
         return []
-
-    if sampler not in {"rbfs", "random_walk"}:
-        sampler = "rbfs"
-
-    by_head = group_edges_by_head(edges)
-    heads = list(by_head.keys())
-    random.shuffle(heads)
-
-    def is_shortcut(edge_a: KnowledgeEdge, edge_b: KnowledgeEdge) -> bool:
-        if edge_a.source_id is None or edge_b.source_id is None:
-            return False
-        return edge_a.source_id == edge_b.source_id
-
-    for start in heads:
-        path: list[KnowledgeEdge] = []
-        used_sources: set[int] = set()
-        shortcut_edges = 0
-        current = start
-
-        for _ in range(length):
-            candidates = by_head.get(current, [])
-            if require_distinct_sources:
-                candidates = [
-                    edge
-                    for edge in candidates
-                    if edge.source_id is None or edge.source_id not in used_sources
-                ]
-            if not candidates:
-                break
-            edge = random.choice(candidates)
-            if path and is_shortcut(path[-1], edge):
-                shortcut_edges += 1
-                if shortcut_edges > max_shortcut_edges:
-                    break
-            path.append(edge)
-            if edge.source_id is not None:
-                used_sources.add(edge.source_id)
-            current = edge.tail
-
-        if len(path) == length:
-            return path
-
-    shuffled = edges[:]
-    random.shuffle(shuffled)
-    return shuffled[:length]
+    sampler = PathSampler(
+        graph,
+        length,
+        require_image=require_image,
+        require_distinct_sources=require_distinct_sources,
+        max_shortcut_edges=max_shortcut_edges,
+    )
+    return sampler.sample()
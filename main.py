@@ -5,6 +5,7 @@ from pipeline import run_episode
 from utils.config import GENQA_MEDIUM_PATH, GENQA_SIMPLE_PATH, GENQA_STRONG_PATH, MAX_ROUNDS
 from utils.details_logger import setup_details_logging
 from utils.genqa import save_genqa_item
+from utils.metrics import print_calls_summary
 
 
 def _pick_existing_path(candidates: list[Path]) -> Path:
@@ -79,36 +80,7 @@ def main() -> None:
 
         review_raw = episode.review_raw
         review_passed = episode.review_passed
-        review_decision = None
-        if not medium_correct:
-            review_raw, review_passed = review_question(
-                episode.stage_final.question,
-                episode.stage_final.answer,
-                episode.stage_final.reasoning,
-                image_path,
-            )
-            if review_passed is True:
-                review_decision = "correct"
-                target_path = genqa_hard_path if strong_correct else genqa_simple_path
-                print(f"[Review] 结果: correct -> {target_path}")
-                save_genqa_item(
-                    target_path,
-                    {
-                        "source": "final",
-                        "question": episode.stage_final.question,
-                        "answer": episode.stage_final.answer,
-                        "reasoning": episode.stage_final.reasoning,
-                        "difficulty_metrics": episode.difficulty_metrics,
-                        "review_decision": review_decision,
-                        "review_raw": review_raw,
-                    },
-                )
-            elif review_passed is False:
-                review_decision = "incorrect"
-                print("[Review] 结果: incorrect")
-            else:
-                review_decision = "unknown"
-                print("[Review] 结果: unknown")
+        # run_episode 已完成 Final 评审，这里只按求解结果分档保存
         if review_passed is True:
             review_decision = "correct"
             if medium_correct:
@@ -164,6 +136,7 @@ def main() -> None:
         f"Medium={medium_questions_found}, "
         f"Strong={strong_questions_found}。"
     )
+    print_calls_summary()
 
 
 if __name__ == "__main__":
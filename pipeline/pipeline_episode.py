@@ -11,26 +11,32 @@ from prompts import (
 )
 from steps import derive_stage_results, generate_steps
 from steps.obfuscate_agent import obfuscate_question
-from utils.api_client import call_text_model, call_vision_model
+from utils.api_client import call_text_model, call_vision_model, image_cache_stats
 from utils.config import (
     DEFAULT_TEMPERATURE,
     MODEL_SUM,
 )
 from utils.details_logger import get_details_logger
+from utils.llm_cache import get_llm_cache, llm_cache_stats
 from utils.mcq import has_valid_options
 from utils.parsing import extract_tag_optional
+from utils.rate_limit import rate_limit_stats
 from utils.schema import EpisodeResult, StageResult, StepResult
 from utils.terminal import print_final_input, print_final_summary
+from utils.tracing import traced
 
 
-def run_final(prompt: str, image_path: Path, model: str) -> StageResult:
-    raw = call_vision_model(prompt, image_path, model)
+def run_final(
+    prompt: str, image_path: Path, model: str, *, call_site: str = "final"
+) -> StageResult:
+    raw = call_vision_model(prompt, image_path, model, call_site=call_site)
     question = extract_tag_optional(raw, "question") or raw.strip()
     answer = extract_tag_optional(raw, "answer") or ""
     reasoning = extract_tag_optional(raw, "reasoning")
     return StageResult(question=question, answer=answer, raw=raw, reasoning=reasoning)
 
 
+@traced()
 def run_episode(
     context: str,
     image_path: Path,
@@ -132,7 +138,9 @@ def run_episode(
                 "text-only solved",
                 mode,
             )
-            stage_final = run_final(harden_prompt, image_path, MODEL_SUM)
+            stage_final = run_final(
+                harden_prompt, image_path, MODEL_SUM, call_site="final_harden"
+            )
             stage_final.question = obfuscate_question(stage_final.question, raw=stage_final.raw)
             get_details_logger().log_event(
                 "final_stage_hardened",
@@ -237,6 +245,7 @@ def run_episode(
         feedback_prompt,
         MODEL_SUM,
         temperature=DEFAULT_TEMPERATURE,
+        call_site="analysis",
     ).strip()
     if reflect_feedback:
         print("[Final] 反馈:", reflect_feedback)
@@ -248,6 +257,11 @@ def run_episode(
         refine_attempts=refine_attempts,
         max_refine_attempts=max_refine_attempts,
     )
+    get_details_logger().log_event("image_cache", image_cache_stats())
+    if get_llm_cache().enabled:
+        get_details_logger().log_event("llm_cache", llm_cache_stats())
+    if rate_stats := rate_limit_stats():
+        get_details_logger().log_event("rate_limit", rate_stats)
 
     return EpisodeResult(
         stage_1=stage_1,
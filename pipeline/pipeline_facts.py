@@ -3,6 +3,7 @@ import json
 from prompts import build_fact_extraction_prompt
 from utils.api_client import call_text_model
 from utils.config import MODEL_STAGE_2
+from utils.llm_cache import LLMCacheMiss
 
 
 def number_context_lines(context: str) -> str:
@@ -32,7 +33,7 @@ def load_fact_candidates(context: str, max_facts: int) -> list[dict[str, str]]:
         return []
     prompt = build_fact_extraction_prompt(number_context_lines(context), max_facts)
     try:
-        raw = call_text_model(prompt, MODEL_STAGE_2)
+        raw = call_text_model(prompt, MODEL_STAGE_2, call_site="fact_extraction")
         cleaned = strip_code_fence(raw)
         data = json.loads(cleaned)
         if not isinstance(data, list):
@@ -53,6 +54,8 @@ def load_fact_candidates(context: str, max_facts: int) -> list[dict[str, str]]:
                     }
                 )
         return results if results else fallback_fact_candidates(context, max_facts)
+    except LLMCacheMiss:
+        raise
     except Exception:
         return fallback_fact_candidates(context, max_facts)
 
@@ -9,10 +9,11 @@ from utils.api_client import call_vision_model
 from utils.config import DEFAULT_TEMPERATURE, MODEL_REVIEW, MODEL_SOLVE_MEDIUM, MODEL_SUM
 from utils.parsing import extract_tag_optional
 from utils.schema import StageResult, StepResult
+from utils.tracing import traced
 
 
 def _run_final_revision(prompt: str, image_path: Path) -> StageResult:
-    raw = call_vision_model(prompt, image_path, MODEL_SUM)
+    raw = call_vision_model(prompt, image_path, MODEL_SUM, call_site="refine")
     question = extract_tag_optional(raw, "question") or raw.strip()
     answer = extract_tag_optional(raw, "answer") or ""
     reasoning = extract_tag_optional(raw, "reasoning")
@@ -21,16 +22,25 @@ def _run_final_revision(prompt: str, image_path: Path) -> StageResult:
 
 def _get_medium_rationale(question: str, answer: str, image_path: Path) -> str:
     prompt = build_solver_rationale_prompt(question, answer)
-    raw = call_vision_model(prompt, image_path, MODEL_SOLVE_MEDIUM, temperature=0)
+    raw = call_vision_model(
+        prompt, image_path, MODEL_SOLVE_MEDIUM, temperature=0, call_site="refine_rationale"
+    )
     return raw.strip()
 
 
 def _get_review_feedback(question: str, answer: str, reasoning: str, image_path: Path) -> str:
     prompt = build_review_feedback_prompt(question, answer, reasoning)
-    raw = call_vision_model(prompt, image_path, MODEL_REVIEW, temperature=DEFAULT_TEMPERATURE)
+    raw = call_vision_model(
+        prompt,
+        image_path,
+        MODEL_REVIEW,
+        temperature=DEFAULT_TEMPERATURE,
+        call_site="refine_review_feedback",
+    )
     return raw.strip()
 
 
+@traced()
 def refine_final_question(
     *,
     context: str,
@@ -4,8 +4,10 @@ from prompts import build_review_prompt
 from utils.api_client import call_vision_model
 from utils.config import DEFAULT_TEMPERATURE, MODEL_REVIEW
 from utils.parsing import extract_tag_optional, parse_review_decision
+from utils.tracing import traced
 
 
+@traced()
 def review_question(
     question: str,
     answer: str,
@@ -25,6 +27,7 @@ def review_question(
         image_path,
         MODEL_REVIEW,
         temperature=DEFAULT_TEMPERATURE,
+        call_site="review",
     )
     decision = parse_review_decision(raw)
 
@@ -1,15 +1,31 @@
+import asyncio
 from pathlib import Path
 from typing import Any
 
 from prompts import build_solver_prompt, build_solver_prompt_text_only
-from utils.api_client import call_no_image_model, call_text_model, call_vision_model
+from utils.api_client import (
+    acall_no_image_model,
+    acall_text_model,
+    acall_vision_model,
+    call_no_image_model,
+    call_text_model,
+    call_vision_model,
+    run_async,
+)
 from utils.config import (
     DEFAULT_TEMPERATURE,
     MODEL_SOLVE_MEDIUM,
     MODEL_SOLVE_STRONG,
+    PARALLEL_SOLVERS,
+    SOLVER_STREAMING,
 )
 from utils.parsing import extract_tag_optional, parse_option_letter_optional
 from utils.schema import StageResult
+from utils.tracing import traced
+
+
+# 求解器只需要 <answer> 中的字母：流式读取时答案标签闭合即断开，不再等待后续输出
+_SOLVER_STREAM_UNTIL = "</answer>" if SOLVER_STREAMING else None
 
 
 def _normalize_solver_output(raw: str) -> tuple[str, str | None]:
@@ -23,6 +39,10 @@ def _normalize_solver_output(raw: str) -> tuple[str, str | None]:
     return "<answer></answer>", None
 
 
+def _solver_call_site(model: str) -> str:
+    return "solver_medium" if model == MODEL_SOLVE_MEDIUM else "solver_strong"
+
+
 def solve_mcq(
     question: str, image_path: Path, model: str, mode: str = "multi_select"
 ) -> tuple[str, str | None]:
@@ -32,6 +52,8 @@ def solve_mcq(
         image_path,
         model,
         temperature=DEFAULT_TEMPERATURE,
+        call_site=_solver_call_site(model),
+        stream_until=_SOLVER_STREAM_UNTIL,
     )
     normalized_raw, solver_letter = _normalize_solver_output(solver_raw)
     return normalized_raw, solver_letter
@@ -41,7 +63,14 @@ def solve_mcq_text_only(
     question: str, model: str, mode: str = "multi_select"
 ) -> tuple[str, str | None]:
     solver_prompt = build_solver_prompt_text_only(question, mode)
-    solver_raw = call_text_model(solver_prompt, model, max_tokens=4096, temperature=0)
+    solver_raw = call_text_model(
+        solver_prompt,
+        model,
+        max_tokens=4096,
+        temperature=0,
+        call_site="solver_text_only",
+        stream_until=_SOLVER_STREAM_UNTIL,
+    )
     normalized_raw, solver_letter = _normalize_solver_output(solver_raw)
     return normalized_raw, solver_letter
 
@@ -54,11 +83,57 @@ def solve_mcq_no_image(
         solver_prompt,
         model,
         temperature=DEFAULT_TEMPERATURE,
+        call_site="solver_no_image",
+        stream_until=_SOLVER_STREAM_UNTIL,
     )
     normalized_raw, solver_letter = _normalize_solver_output(solver_raw)
     return normalized_raw, solver_letter
 
 
+async def asolve_mcq(
+    question: str, image_path: Path, model: str, mode: str = "multi_select"
+) -> tuple[str, str | None]:
+    solver_prompt = build_solver_prompt(question, mode)
+    solver_raw = await acall_vision_model(
+        solver_prompt,
+        image_path,
+        model,
+        temperature=DEFAULT_TEMPERATURE,
+        call_site=_solver_call_site(model),
+        stream_until=_SOLVER_STREAM_UNTIL,
+    )
+    return _normalize_solver_output(solver_raw)
+
+
+async def asolve_mcq_text_only(
+    question: str, model: str, mode: str = "multi_select"
+) -> tuple[str, str | None]:
+    solver_prompt = build_solver_prompt_text_only(question, mode)
+    solver_raw = await acall_text_model(
+        solver_prompt,
+        model,
+        max_tokens=4096,
+        temperature=0,
+        call_site="solver_text_only",
+        stream_until=_SOLVER_STREAM_UNTIL,
+    )
+    return _normalize_solver_output(solver_raw)
+
+
+async def asolve_mcq_no_image(
+    question: str, model: str, mode: str = "multi_select"
+) -> tuple[str, str | None]:
+    solver_prompt = build_solver_prompt(question, mode)
+    solver_raw = await acall_no_image_model(
+        solver_prompt,
+        model,
+        temperature=DEFAULT_TEMPERATURE,
+        call_site="solver_no_image",
+        stream_until=_SOLVER_STREAM_UNTIL,
+    )
+    return _normalize_solver_output(solver_raw)
+
+
 def grade_answer(answer: str, solver_letter: str | None) -> bool:
     standard = parse_option_letter_optional(answer)
     if not standard or not solver_letter:
@@ -74,39 +149,127 @@ def grade_partial_answer(standard: str, prediction: str | None) -> bool:
     return bool(pred_set) and pred_set.issubset(std_set) and pred_set != std_set
 
 
-def evaluate_difficulty(
-    final: StageResult,
-    image_path: Path,
-    cross_modal_used: bool,
-    num_hops: int,
-    mode: str = "multi_select",
-) -> dict[str, Any]:
+_SolverOutputs = tuple[
+    str,  # medium_raw
+    str | None,  # medium_letter
+    str,  # strong_text_only_raw
+    str | None,  # strong_text_only_letter
+    str | None,  # strong_raw
+    str | None,  # strong_letter
+    str | None,  # strong_no_image_raw
+    str | None,  # strong_no_image_letter
+]
+
+
+def _run_solvers_sequential(final: StageResult, image_path: Path, mode: str) -> _SolverOutputs:
     medium_raw, medium_letter = solve_mcq(
         final.question, image_path, MODEL_SOLVE_MEDIUM, mode
     )
-    medium_correct = grade_answer(final.answer, medium_letter)
-    medium_partial = grade_partial_answer(final.answer, medium_letter)
-
     strong_text_only_raw, strong_text_only_letter = solve_mcq_text_only(
         final.question, MODEL_SOLVE_STRONG, mode
     )
-    strong_text_only_correct = grade_answer(final.answer, strong_text_only_letter)
 
     strong_raw = None
     strong_letter = None
     strong_no_image_raw = None
     strong_no_image_letter = None
-    strong_correct = None
-    strong_no_image_correct = None
-
-    if not medium_correct:
-        strong_raw, strong_letter = solve_mcq(final.question, image_path, MODEL_SOLVE_STRONG)
+    if not grade_answer(final.answer, medium_letter):
+        strong_raw, strong_letter = solve_mcq(final.question, image_path, MODEL_SOLVE_STRONG, mode)
         strong_no_image_raw, strong_no_image_letter = solve_mcq_no_image(
             final.question, MODEL_SOLVE_STRONG, mode
         )
+    return (
+        medium_raw,
+        medium_letter,
+        strong_text_only_raw,
+        strong_text_only_letter,
+        strong_raw,
+        strong_letter,
+        strong_no_image_raw,
+        strong_no_image_letter,
+    )
+
+
+async def _run_solvers_parallel(final: StageResult, image_path: Path, mode: str) -> _SolverOutputs:
+    """
+    Medium 与 text-only 互不依赖，直接并发；Strong 两路只依赖 Medium 结果，
+    因此推测执行，Medium 答对后取消并丢弃。返回值与顺序执行完全一致。
+    """
+    medium_task = asyncio.create_task(
+        asolve_mcq(final.question, image_path, MODEL_SOLVE_MEDIUM, mode)
+    )
+    text_only_task = asyncio.create_task(
+        asolve_mcq_text_only(final.question, MODEL_SOLVE_STRONG, mode)
+    )
+    strong_task = asyncio.create_task(
+        asolve_mcq(final.question, image_path, MODEL_SOLVE_STRONG, mode)
+    )
+    no_image_task = asyncio.create_task(
+        asolve_mcq_no_image(final.question, MODEL_SOLVE_STRONG, mode)
+    )
+    tasks = [medium_task, text_only_task, strong_task, no_image_task]
+    try:
+        medium_raw, medium_letter = await medium_task
+        strong_raw = None
+        strong_letter = None
+        strong_no_image_raw = None
+        strong_no_image_letter = None
+        if grade_answer(final.answer, medium_letter):
+            strong_task.cancel()
+            no_image_task.cancel()
+        else:
+            strong_raw, strong_letter = await strong_task
+            strong_no_image_raw, strong_no_image_letter = await no_image_task
+        strong_text_only_raw, strong_text_only_letter = await text_only_task
+    finally:
+        for task in tasks:
+            if not task.done():
+                task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+    return (
+        medium_raw,
+        medium_letter,
+        strong_text_only_raw,
+        strong_text_only_letter,
+        strong_raw,
+        strong_letter,
+        strong_no_image_raw,
+        strong_no_image_letter,
+    )
+
+
+@traced()
+def evaluate_difficulty(
+    final: StageResult,
+    image_path: Path,
+    cross_modal_used: bool,
+    num_hops: int,
+    mode: str = "multi_select",
+) -> dict[str, Any]:
+    if PARALLEL_SOLVERS:
+        solver_outputs = run_async(_run_solvers_parallel(final, image_path, mode))
+    else:
+        solver_outputs = _run_solvers_sequential(final, image_path, mode)
+    (
+        medium_raw,
+        medium_letter,
+        strong_text_only_raw,
+        strong_text_only_letter,
+        strong_raw,
+        strong_letter,
+        strong_no_image_raw,
+        strong_no_image_letter,
+    ) = solver_outputs
+
+    medium_correct = grade_answer(final.answer, medium_letter)
+    medium_partial = grade_partial_answer(final.answer, medium_letter)
+    strong_text_only_correct = grade_answer(final.answer, strong_text_only_letter)
+    strong_correct = None
+    strong_no_image_correct = None
+    if not medium_correct:
         strong_correct = grade_answer(final.answer, strong_letter)
         strong_no_image_correct = grade_answer(final.answer, strong_no_image_letter)
-    
+
     difficulty_score = (
         1.0
         if (strong_correct and not medium_correct and not strong_text_only_correct)
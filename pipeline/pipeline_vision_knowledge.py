@@ -9,6 +9,7 @@ from utils.api_client import call_vision_model
 from utils.config import DEFAULT_TEMPERATURE, MODEL_VISION_KNOWLEDGE
 from utils.details_logger import get_details_logger
 from utils.parsing import extract_tag_optional
+from utils.tracing import traced
 
 
 @dataclass(frozen=True)
@@ -58,6 +59,7 @@ def _summarize_description(text: str, max_lines: int = 12, max_chars: int = 800)
     return summary
 
 
+@traced()
 def build_visual_knowledge(image_path: Path) -> VisionKnowledge:
     cache_key = _hash_image(image_path)
     cached = _VISION_CACHE.get(cache_key)
@@ -70,6 +72,7 @@ def build_visual_knowledge(image_path: Path) -> VisionKnowledge:
         image_path,
         MODEL_VISION_KNOWLEDGE,
         temperature=DEFAULT_TEMPERATURE,
+        call_site="visual_knowledge",
     )
     description = extract_tag_optional(raw, "description") or raw.strip()
     summary = extract_tag_optional(raw, "summary") or _summarize_description(description)
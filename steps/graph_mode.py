@@ -2,15 +2,18 @@
 
 from pathlib import Path
 
-from graph.pipeline_graph import KnowledgeEdge, build_entity_pool, build_knowledge_edges_cached
+from graph.knowledge_graph import KnowledgeGraph
+from graph.pipeline_graph import KnowledgeEdge, build_knowledge_edges_cached
 from steps.graph_mode_step0 import generate_step0
 from steps.graph_mode_step_chain import generate_step_chain
 from steps.graph_mode_utils import merge_edges_with_visual, sample_path_with_visual
 from utils.config import MAX_STEPS_PER_ROUND, MIN_HOPS
 from utils.details_logger import get_details_logger
 from utils.schema import StepResult
+from utils.tracing import traced
 
 
+@traced()
 def generate_steps_graph_mode(
     context: str,
     image_path: Path,
@@ -41,7 +44,7 @@ def generate_steps_graph_mode(
     # Build knowledge graph
     target_hops = min(MAX_STEPS_PER_ROUND - 1, max(MIN_HOPS, 2))
     text_edges = build_knowledge_edges_cached(context)
-    all_edges = merge_edges_with_visual(text_edges, visual_edges)
+    graph = KnowledgeGraph(merge_edges_with_visual(text_edges, visual_edges))
 
     # Generate Step 0 (anchor step)
     step0 = generate_step0(
@@ -50,19 +53,18 @@ def generate_steps_graph_mode(
         feedback,
         previous_final_question,
         visual_summary,
-        all_edges,
+        graph,
     )
     steps.append(step0)
 
     # Early exit if no edges or target_hops is 0
-    if not all_edges or target_hops <= 0:
+    if not graph or target_hops <= 0:
         print("[Graph Mode] 知识点链为空或 hop=0，退化为仅 step_0。")
         return steps, cross_modal_used
 
     # Sample path through knowledge graph
-    entity_pool = build_entity_pool(all_edges)
-    require_visual = any(edge.source_type == "image" for edge in all_edges)
-    path = sample_path_with_visual(all_edges, target_hops, require_visual)
+    require_visual = graph.has_source_type("image")
+    path = sample_path_with_visual(graph, target_hops, require_visual)
     if not path:
         print("[Graph Mode] 知识链路径采样失败，退化为仅 step_0。")
         return steps, cross_modal_used
@@ -94,7 +96,7 @@ def generate_steps_graph_mode(
         visual_summary,
         step0,
         path,
-        all_edges,
+        graph,
     )
     steps.extend(subsequent_steps)
 
@@ -3,7 +3,7 @@
 import random
 from pathlib import Path
 
-from graph.pipeline_graph import KnowledgeEdge
+from graph.knowledge_graph import KnowledgeGraph
 from prompts import build_extend_step_prompt, build_revise_prompt, build_stage1_step_prompt
 from steps.graph_mode_evaluation import (
     evaluate_step_with_solvers,
@@ -13,21 +13,22 @@ from steps.graph_mode_evaluation import (
 )
 from steps.graph_mode_utils import edge_source_label
 from steps.obfuscate_agent import obfuscate_step_question
-from steps.operate_calculation_agent import run_operate_calculation_agent
-from steps.operate_distinction_agent import run_operate_distinction_agent
+from steps.operate_drafts import run_operate_agents
 from steps.runner import run_step, select_model_for_step
 from utils.details_logger import get_details_logger
 from utils.schema import StepResult
 from utils.terminal import print_step_input
+from utils.tracing import traced
 
 
+@traced()
 def generate_step0(
     context: str,
     image_path: Path,
     feedback: str,
     previous_final_question: str | None,
     visual_summary: str | None,
-    all_edges: list[KnowledgeEdge],
+    graph: KnowledgeGraph,
 ) -> StepResult:
     """
     Generate Step 0 in graph mode.
@@ -52,23 +53,15 @@ def generate_step0(
             raw="",
         )
         fact_hint = "请基于图片与参考信息进行综合推断。"
-        if all_edges:
-            edge = random.choice(all_edges)
+        if graph:
+            edge = random.choice(graph.edges)
             source_label = edge_source_label(edge)
             fact_hint = (
                 f"[来源: {source_label}]\n"
                 f"Knowledge Link: {edge.head} -> {edge.relation} -> {edge.tail}\n"
                 f"Evidence: {edge.evidence}"
             )
-        operate_distinction = run_operate_distinction_agent(
-            context=context,
-            image_path=image_path,
-            previous_step=dummy_prev,
-            fact_hint=fact_hint,
-            feedback=feedback,
-            force_cross_modal=True,
-        )
-        operate_calculation = run_operate_calculation_agent(
+        operate_distinction, operate_calculation = run_operate_agents(
             context=context,
             image_path=image_path,
             previous_step=dummy_prev,
@@ -118,7 +111,7 @@ def generate_step0(
     )
 
     # Generate initial step
-    step0 = run_step(prompt, image_path, model, 0)
+    step0 = run_step(prompt, image_path, model, 0, call_site="step0")
     step0 = obfuscate_step_question(step0)
     print("[Step 0] 更新后题目:")
     print(step0.question)
@@ -167,7 +160,7 @@ def generate_step0(
                 False,
                 visual_summary,
             )
-            step0 = run_step(revise_prompt, image_path, model, 0)
+            step0 = run_step(revise_prompt, image_path, model, 0, call_site="step_revise")
             step0 = obfuscate_step_question(step0)
             print("[Step 0] 更新后题目:")
             print(step0.question)
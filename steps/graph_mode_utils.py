@@ -1,7 +1,8 @@
 """Graph mode utilities: edge processing and path sampling helpers."""
 
+from graph.knowledge_graph import KnowledgeGraph
 from graph.pipeline_graph import KnowledgeEdge
-from graph.pipeline_path_sampling import sample_path
+from graph.pipeline_path_sampling import PathSampler
 
 
 def normalize_edges(
@@ -57,16 +58,24 @@ def merge_edges_with_visual(
 
 
 def sample_path_with_visual(
-    edges: list[KnowledgeEdge], length: int, require_visual: bool
+    graph: KnowledgeGraph, length: int, require_visual: bool
 ) -> list[KnowledgeEdge]:
-    """Sample a path from edges, preferring visual edges if required."""
-    if not require_visual:
-        return sample_path(edges, length)
-    for _ in range(6):
-        path = sample_path(edges, length)
-        if any(edge.source_type == "image" for edge in path):
+    """Uniformly sample an exact-length path, containing a visual edge when required and possible."""
+    if length <= 0 or not graph:
+        return []
+    # count > 0 时仍可能抽不到：来源互不相同的约束只能在抽样后检查，所有候选路径都可能被排除
+    if require_visual:
+        path = PathSampler(graph, length, require_image=True).sample()
+        if path:
             return path
-    return sample_path(edges, length)
+        print(f"[Graph Mode] 不存在长度为 {length} 且包含图片知识边的合法路径，改为只用文本知识边采样。")
+    path = PathSampler(graph, length).sample()
+    if not path:
+        print(
+            f"[Graph Mode] 知识图谱中不存在长度为 {length} 的合法路径"
+            f"（{len(graph)} 条边，{graph.num_entities} 个实体）。"
+        )
+    return path
 
 
 def edge_source_label(edge: KnowledgeEdge) -> str:
@@ -7,13 +7,13 @@ from utils.parsing import extract_option_text, extract_question_and_selections,
 from utils.schema import StepResult
 
 
-_OPTION_PUNCT = r"[\\.．、:：)）]"
-_OPTION_INLINE_RE = re.compile(rf"([A-HＡ-Ｈ]){_OPTION_PUNCT}\\s*")
+_OPTION_PUNCT = r"[\.．、:：)）]"
+_OPTION_INLINE_RE = re.compile(rf"([A-HＡ-Ｈ]){_OPTION_PUNCT}\s*")
 _OPTION_LINE_RE = re.compile(
-    rf"(?m)^\\s*[\\(（【]?[A-HＡ-Ｈ][\\)）】]?\\s*(?:{_OPTION_PUNCT}\\s*)?[^\\n]+"
+    rf"(?m)^\s*[\(（【]?[A-HＡ-Ｈ][\)）】]?\s*(?:{_OPTION_PUNCT}\s*)?[^\n]+"
 )
 _OPTION_HINT_RE = re.compile(
-    rf"(?:[A-HＡ-Ｈ]\\s*{_OPTION_PUNCT}|\\([A-HＡ-Ｈ]\\)|（[A-HＡ-Ｈ]）|^\\s*[A-HＡ-Ｈ]\\s+[^\\n]+)",
+    rf"(?:[A-HＡ-Ｈ]\s*{_OPTION_PUNCT}|\([A-HＡ-Ｈ]\)|（[A-HＡ-Ｈ]）|^\s*[A-HＡ-Ｈ]\s+[^\n]+)",
     flags=re.MULTILINE,
 )
 _VISUAL_ANCHORS = ("图中", "图示", "图像", "图片")
@@ -35,7 +35,7 @@ def _normalize_letter(letter: str) -> str:
 
 
 def _extract_leading_letter(text: str) -> str | None:
-    match = re.match(r"^\\s*[\\(（【]?(?P<letter>[A-HＡ-Ｈ])", text)
+    match = re.match(r"^\s*[\(（【]?(?P<letter>[A-HＡ-Ｈ])", text)
     if not match:
         return None
     return _normalize_letter(match.group("letter"))
@@ -116,7 +116,9 @@ def obfuscate_question(
 
     # 只改写题干，保持选项不变
     prompt = build_obfuscate_prompt(stem)
-    obfuscate_raw = call_text_model(prompt, model, temperature=DEFAULT_TEMPERATURE)
+    obfuscate_raw = call_text_model(
+        prompt, model, temperature=DEFAULT_TEMPERATURE, call_site="obfuscate"
+    )
     rewritten = extract_tag_optional(obfuscate_raw, "stem") or obfuscate_raw.strip()
     rewritten = rewritten.strip()
     if not rewritten:
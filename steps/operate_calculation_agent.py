@@ -30,6 +30,7 @@ def run_operate_calculation_agent(
         image_path,
         MODEL_OPERATE_CALCULATION,
         temperature=DEFAULT_TEMPERATURE,
+        call_site="operate_calculation",
     )
     draft = (extract_tag_optional(raw, "draft") or raw.strip()).strip()
     return OperateResult(operator_type="calculation", draft=draft, raw=raw)
@@ -30,6 +30,7 @@ def run_operate_distinction_agent(
         image_path,
         MODEL_OPERATE_DISTINCTION,
         temperature=DEFAULT_TEMPERATURE,
+        call_site="operate_distinction",
     )
     draft = (extract_tag_optional(raw, "draft") or raw.strip()).strip()
     return OperateResult(operator_type="distinction", draft=draft, raw=raw)
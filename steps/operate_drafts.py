@@ -0,0 +1,55 @@
+"""Operate drafting: run the distinction and calculation agents side by side."""
+
+import contextvars
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+
+from steps.operate_calculation_agent import run_operate_calculation_agent
+from steps.operate_distinction_agent import run_operate_distinction_agent
+from utils.config import PARALLEL_OPERATE_AGENTS
+from utils.schema import OperateResult, StepResult
+
+_EXECUTOR = ThreadPoolExecutor(max_workers=4, thread_name_prefix="operate-draft")
+
+
+def run_operate_agents(
+    *,
+    context: str,
+    image_path: Path,
+    previous_step: StepResult,
+    fact_hint: str,
+    feedback: str,
+    force_cross_modal: bool,
+    forbidden_terms: list[str] | None = None,
+) -> tuple[OperateResult, OperateResult]:
+    """
+    Draft with both operate agents for the same step.
+
+    The two agents take identical inputs and do not depend on each other, so the
+    calculation draft runs on the executor while the distinction draft runs on the
+    calling thread; one drafting phase costs a single model round-trip.
+
+    Returns:
+        Tuple of (operate_distinction, operate_calculation)
+    """
+    kwargs = {
+        "context": context,
+        "image_path": image_path,
+        "previous_step": previous_step,
+        "fact_hint": fact_hint,
+        "feedback": feedback,
+        "force_cross_modal": force_cross_modal,
+        "forbidden_terms": forbidden_terms,
+    }
+    if not PARALLEL_OPERATE_AGENTS:
+        return run_operate_distinction_agent(**kwargs), run_operate_calculation_agent(**kwargs)
+
+    calculation_future = _EXECUTOR.submit(
+        contextvars.copy_context().run, run_operate_calculation_agent, **kwargs
+    )
+    try:
+        operate_distinction = run_operate_distinction_agent(**kwargs)
+    except BaseException:
+        calculation_future.cancel()
+        raise
+    return operate_distinction, calculation_future.result()
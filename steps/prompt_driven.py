@@ -15,8 +15,7 @@ from pipeline.pipeline_solvers import (
     solve_mcq_no_image,
     solve_mcq_text_only,
 )
-from steps.operate_calculation_agent import run_operate_calculation_agent
-from steps.operate_distinction_agent import run_operate_distinction_agent
+from steps.operate_drafts import run_operate_agents
 from steps.obfuscate_agent import obfuscate_step_question
 from steps.quality import is_low_quality_entity_matching
 from steps.runner import run_step, select_model_for_step
@@ -79,15 +78,7 @@ def generate_steps_prompt_driven(
             )
 
         if effective_previous_step:
-            operate_distinction = run_operate_distinction_agent(
-                context=context,
-                image_path=image_path,
-                previous_step=effective_previous_step,
-                fact_hint=fact_hint,
-                feedback=feedback,
-                force_cross_modal=force_cross_modal,
-            )
-            operate_calculation = run_operate_calculation_agent(
+            operate_distinction, operate_calculation = run_operate_agents(
                 context=context,
                 image_path=image_path,
                 previous_step=effective_previous_step,
@@ -240,7 +231,7 @@ def generate_steps_prompt_driven(
                 force_cross_modal,
                 visual_summary,
             )
-            step = run_step(revise_prompt, image_path, model, k)
+            step = run_step(revise_prompt, image_path, model, k, call_site="step_revise")
             step = obfuscate_step_question(step)
             print(f"[Step {k}] 更新后题目:")
             print(step.question)
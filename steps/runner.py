@@ -22,8 +22,10 @@ def select_model_for_step(k: int) -> str:
     return MODEL_STAGE_3
 
 
-def run_step(prompt: str, image_path: Path, model: str, k: int) -> StepResult:
-    raw = call_vision_model(prompt, image_path, model)
+def run_step(
+    prompt: str, image_path: Path, model: str, k: int, *, call_site: str = "step_generation"
+) -> StepResult:
+    raw = call_vision_model(prompt, image_path, model, call_site=call_site)
 
     # 提取题干和选项（支持新格式 <question> + <selections>）
     question_stem, selections = extract_question_and_selections(raw)
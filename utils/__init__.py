@@ -1,9 +1,17 @@
-from utils.api_client import call_text_model, call_vision_model, encode_image
+from utils.api_client import (
+    acall_text_model,
+    acall_vision_model,
+    call_text_model,
+    call_vision_model,
+    encode_image,
+)
 from utils.config import *  # noqa: F403
 from utils.parsing import *  # noqa: F403
 from utils.schema import *  # noqa: F403
 
 __all__ = [
+    "acall_text_model",
+    "acall_vision_model",
     "call_text_model",
     "call_vision_model",
     "encode_image",
@@ -1,16 +1,122 @@
+import asyncio
+import atexit
 import base64
+import email.utils
+import hashlib
+import io
+import json
+import mimetypes
+import random
 import time
+import weakref
+from collections.abc import AsyncIterator, Callable, Coroutine, Iterator
+from contextlib import asynccontextmanager, contextmanager
+from dataclasses import dataclass, field
 from pathlib import Path
+from threading import BoundedSemaphore, Lock, Thread
+from typing import Any, TypeVar
 
-from openai import OpenAI
+import httpx
+from openai import (
+    APIConnectionError,
+    APIStatusError,
+    AsyncOpenAI,
+    DefaultAsyncHttpxClient,
+    DefaultHttpxClient,
+    OpenAI,
+)
+
+try:
+    from PIL import Image
+except ImportError:  # Pillow 为可选依赖：缺失时不做图片预处理
+    Image = None
 
 from utils.config import (
     API_BASE_URL,
+    API_BREAKER_COOLDOWN_SECONDS,
+    API_BREAKER_PROBE_TIMEOUT_SECONDS,
+    API_BREAKER_FAILURE_THRESHOLD,
+    API_CALL_SITE_HEADER,
+    API_DEFAULT_MODEL_CONCURRENCY,
     API_KEY,
+    API_MAX_CONCURRENCY,
+    API_MAX_RETRIES,
+    API_MAX_TOKENS_PARAM,
+    API_MODEL_CONCURRENCY,
+    API_MODEL_RETRY_MAX_SLEEP,
+    API_POOL_KEEPALIVE_EXPIRY,
+    API_POOL_MAX_CONNECTIONS,
+    API_POOL_MAX_KEEPALIVE,
     API_RECONNECT_RETRIES,
     API_RECONNECT_SLEEP_SECONDS,
+    API_RETRY_MAX_SLEEP_SECONDS,
+    API_RETRY_SLEEP_SECONDS,
+    API_TIMEOUT_SECONDS,
+    CALL_SITE_BUDGETS,
+    CALL_SITE_BUDGETS_ENABLED,
     DEFAULT_TEMPERATURE,
+    IMAGE_CACHE_DIR,
+    IMAGE_DEFAULT_PROFILE,
+    IMAGE_MODEL_PROFILES,
+    IMAGE_PREPROCESS,
+    IMAGE_PROFILES,
+    MODEL_FALLBACKS,
+    STREAM_INCLUDE_USAGE,
 )
+from utils.details_logger import get_details_logger
+from utils.file_io import atomic_write_bytes
+from utils.llm_cache import LLMCacheMiss, cache_key, get_llm_cache
+from utils.metrics import CallRecord, call_span
+from utils.rate_limit import estimate_tokens, get_rate_limiter
+
+
+_T = TypeVar("_T")
+
+# 进程级客户端注册表：同一 (base_url, api_key, timeout) 共享一个连接池，复用长连接。
+_CLIENTS: dict[tuple[str, str, float], OpenAI] = {}
+_CLIENTS_LOCK = Lock()
+
+
+def _pool_limits() -> httpx.Limits:
+    return httpx.Limits(
+        max_connections=max(1, API_POOL_MAX_CONNECTIONS),
+        max_keepalive_connections=max(0, API_POOL_MAX_KEEPALIVE),
+        keepalive_expiry=API_POOL_KEEPALIVE_EXPIRY,
+    )
+
+
+def _get_client(
+    base_url: str = API_BASE_URL,
+    api_key: str | None = API_KEY,
+    timeout: float = API_TIMEOUT_SECONDS,
+) -> OpenAI:
+    key = (base_url, api_key or "", float(timeout))
+    with _CLIENTS_LOCK:
+        client = _CLIENTS.get(key)
+        if client is None:
+            client = OpenAI(
+                api_key=api_key,
+                base_url=base_url,
+                timeout=timeout,
+                max_retries=0,  # 重试统一由 RetryPolicy 负责
+                http_client=DefaultHttpxClient(limits=_pool_limits(), timeout=timeout),
+            )
+            _CLIENTS[key] = client
+        return client
+
+
+def close_clients() -> None:
+    with _CLIENTS_LOCK:
+        clients = list(_CLIENTS.values())
+        _CLIENTS.clear()
+    for client in clients:
+        try:
+            client.close()
+        except Exception:
+            pass
+
+
+atexit.register(close_clients)
 
 
 def encode_image(image_path: Path) -> str:
@@ -18,18 +124,215 @@ def encode_image(image_path: Path) -> str:
         return base64.b64encode(f.read()).decode("utf-8")
 
 
-def _sleep_before_retry(attempt: int, error: Exception) -> None:
-    max_attempts = max(5, int(API_RECONNECT_RETRIES))
-    if attempt >= max_attempts:
-        return
-    seconds = max(10, int(API_RECONNECT_SLEEP_SECONDS))
-    if seconds <= 0:
-        return
+# 编码后图片缓存：按 (路径, profile) 登记，(mtime, size) 变化即失效；同一内容只编码一次并共享同一个 data URL 字符串。
+_IMAGE_CACHE: dict[tuple[str, str], tuple[int, int, str]] = {}
+_IMAGE_CACHE_LOCK = Lock()
+_IMAGE_CACHE_STATS = {"hits": 0, "misses": 0, "payload_bytes": 0}
+_FORMAT_MIME = {"JPEG": "image/jpeg", "PNG": "image/png", "WEBP": "image/webp"}
+_FORMAT_SUFFIX = {"JPEG": ".jpg", "PNG": ".png", "WEBP": ".webp"}
+_PILLOW_WARNED = False
+
+
+def _image_profile_name(model: str | None) -> str:
+    if not IMAGE_PREPROCESS or model is None:
+        return "full"
+    name = IMAGE_MODEL_PROFILES.get(model, IMAGE_DEFAULT_PROFILE)
+    return name if name in IMAGE_PROFILES else "full"
+
+
+def _source_mime(image_path: Path) -> str:
+    mime, _ = mimetypes.guess_type(image_path.name)
+    return mime if mime and mime.startswith("image/") else "image/png"
+
+
+def _render_image(source: bytes, profile: dict[str, object]) -> tuple[bytes, str] | None:
+    global _PILLOW_WARNED
+    if Image is None:
+        if not _PILLOW_WARNED:
+            _PILLOW_WARNED = True
+            print("[api_client] Pillow 未安装，跳过图片预处理，使用原图上传。", flush=True)
+        return None
+    with Image.open(io.BytesIO(source)) as opened:
+        img = opened.copy()
+        fmt = str(profile.get("format") or opened.format or "PNG").upper()
+    max_edge = profile.get("max_edge")
+    if max_edge and max(img.size) > int(max_edge):  # type: ignore[arg-type]
+        img.thumbnail((int(max_edge), int(max_edge)), Image.LANCZOS)  # type: ignore[arg-type]
+    if fmt == "JPEG" and img.mode != "RGB":
+        rgba = img.convert("RGBA")
+        img = Image.new("RGB", rgba.size, (255, 255, 255))
+        img.paste(rgba, mask=rgba.getchannel("A"))
+    save_kwargs: dict[str, object] = {}
+    quality = profile.get("quality")
+    if quality and fmt in {"JPEG", "WEBP"}:
+        save_kwargs["quality"] = int(quality)  # type: ignore[arg-type]
+    if fmt in {"JPEG", "PNG"}:
+        save_kwargs["optimize"] = True
+    buf = io.BytesIO()
+    img.save(buf, format=fmt, **save_kwargs)
+    return buf.getvalue(), _FORMAT_MIME.get(fmt, f"image/{fmt.lower()}")
+
+
+def _derived_image(source: bytes, profile_name: str) -> tuple[bytes, str] | None:
+    profile = IMAGE_PROFILES[profile_name]
+    digest = hashlib.sha1(source).hexdigest()
+    signature = hashlib.sha1(json.dumps(profile, sort_keys=True).encode("utf-8")).hexdigest()[:10]
+    fmt = str(profile.get("format") or "").upper()
+    cache_dir = Path(IMAGE_CACHE_DIR)
+    stem = f"{digest}-{profile_name}-{signature}"
+    if fmt in _FORMAT_SUFFIX:
+        cached_path = cache_dir / f"{stem}{_FORMAT_SUFFIX[fmt]}"
+        if cached_path.exists():
+            return cached_path.read_bytes(), _FORMAT_MIME[fmt]
+    rendered = _render_image(source, profile)
+    if rendered is None:
+        return None
+    data, mime = rendered
+    if len(data) >= len(source):
+        return None
+    suffix = next((sfx for name, sfx in _FORMAT_SUFFIX.items() if _FORMAT_MIME[name] == mime), None)
+    if suffix:
+        try:
+            atomic_write_bytes(cache_dir / f"{stem}{suffix}", data)
+        except OSError as exc:
+            print(f"[api_client] 派生图片缓存写入失败: {exc}", flush=True)
+    return data, mime
+
+
+def _image_data_url(image_path: Path, model: str | None = None) -> str:
+    profile_name = _image_profile_name(model)
+    key = (str(image_path.resolve()), profile_name)
+    stat = image_path.stat()
+    with _IMAGE_CACHE_LOCK:
+        cached = _IMAGE_CACHE.get(key)
+        if cached is not None and cached[0] == stat.st_mtime_ns and cached[1] == stat.st_size:
+            _IMAGE_CACHE_STATS["hits"] += 1
+            _IMAGE_CACHE_STATS["payload_bytes"] += len(cached[2])
+            return cached[2]
+        source = image_path.read_bytes()
+        payload: tuple[bytes, str] | None = None
+        if profile_name != "full":
+            payload = _derived_image(source, profile_name)
+        if payload is None:
+            payload = (source, _source_mime(image_path))
+        data, mime = payload
+        data_url = f"data:{mime};base64,{base64.b64encode(data).decode('utf-8')}"
+        _IMAGE_CACHE[key] = (stat.st_mtime_ns, stat.st_size, data_url)
+        _IMAGE_CACHE_STATS["misses"] += 1
+        _IMAGE_CACHE_STATS["payload_bytes"] += len(data_url)
+        return data_url
+
+
+def image_cache_stats() -> dict[str, object]:
+    with _IMAGE_CACHE_LOCK:
+        hits = _IMAGE_CACHE_STATS["hits"]
+        misses = _IMAGE_CACHE_STATS["misses"]
+        payload_bytes = _IMAGE_CACHE_STATS["payload_bytes"]
+        entries = len(_IMAGE_CACHE)
+    total = hits + misses
+    return {
+        "hits": hits,
+        "misses": misses,
+        "entries": entries,
+        "hit_rate": round(hits / total, 4) if total else None,
+        "payload_bytes": payload_bytes,
+    }
+
+
+# 不会因重试而改变结果的错误：请求本身有问题或无权限，立即失败
+_FATAL_STATUS = {400, 401, 403, 404, 413, 422}
+
+
+def _retry_after_seconds(error: Exception) -> float | None:
+    response = getattr(error, "response", None)
+    headers = getattr(response, "headers", None)
+    if headers is None:
+        return None
+    raw_ms = headers.get("retry-after-ms")
+    if raw_ms:
+        try:
+            return max(0.0, float(raw_ms) / 1000)
+        except ValueError:
+            pass
+    raw = headers.get("retry-after")
+    if not raw:
+        return None
+    try:
+        return max(0.0, float(raw))
+    except ValueError:
+        pass
+    try:
+        retry_at = email.utils.parsedate_to_datetime(raw)
+    except (TypeError, ValueError):
+        return None
+    return max(0.0, retry_at.timestamp() - time.time())
+
+
+@dataclass(frozen=True)
+class RetryPolicy:
+    """
+    按错误类型决定是否重试及等待多久：
+    - fatal（400/401/403/404/413/422 等）：不重试；
+    - connection（连接失败/超时）：最多 reconnect_attempts 次，退避基数 reconnect_base_delay；
+    - retryable（429/5xx/响应结构异常等）：最多 max_attempts 次，退避基数 base_delay。
+    退避为带抖动的指数增长 base * 2^(n-1)，取 [一半, 全部] 之间的随机值，并受单模型上限约束；
+    响应带 Retry-After 时直接按服务端给出的时间等待。
+    """
+
+    max_attempts: int = max(1, API_MAX_RETRIES)
+    base_delay: float = max(0.0, float(API_RETRY_SLEEP_SECONDS))
+    reconnect_attempts: int = max(1, API_RECONNECT_RETRIES)
+    reconnect_base_delay: float = max(0.0, float(API_RECONNECT_SLEEP_SECONDS))
+    max_delay: float = API_RETRY_MAX_SLEEP_SECONDS
+    model_max_delay: dict[str, float] = field(default_factory=lambda: dict(API_MODEL_RETRY_MAX_SLEEP))
+
+    @staticmethod
+    def classify(error: Exception) -> str:
+        if isinstance(error, (LLMCacheMiss, CircuitOpenError)):
+            return "fatal"
+        if isinstance(error, APIConnectionError):
+            return "connection"
+        if isinstance(error, APIStatusError):
+            return "fatal" if error.status_code in _FATAL_STATUS else "retryable"
+        if isinstance(error, (httpx.TransportError, ConnectionError, TimeoutError)):
+            return "connection"
+        return "retryable"
+
+    def delay(self, model: str, attempt: int, error: Exception) -> float | None:
+        """第 attempt 次尝试失败后应等待的秒数；返回 None 表示不再重试。"""
+        kind = self.classify(error)
+        if kind == "fatal":
+            return None
+        if kind == "connection":
+            limit, base = self.reconnect_attempts, self.reconnect_base_delay
+        else:
+            limit, base = self.max_attempts, self.base_delay
+        if attempt >= limit:
+            return None
+        retry_after = _retry_after_seconds(error)
+        if retry_after is not None:
+            return retry_after
+        cap = self.model_max_delay.get(model, self.max_delay)
+        ceiling = min(cap, base * (2 ** (attempt - 1)))
+        return random.uniform(ceiling / 2, ceiling)
+
+
+_RETRY_POLICY = RetryPolicy()
+
+
+def _retry_delay(model: str, attempt: int, error: Exception) -> float | None:
+    seconds = _RETRY_POLICY.delay(model, attempt, error)
+    if seconds is None:
+        print(
+            f"[api_client] call failed (attempt {attempt}), giving up: {type(error).__name__}: {error}",
+            flush=True,
+        )
+        return None
     print(
-        f"[api_client] call failed (attempt {attempt}/{max_attempts}), retry in {seconds}s: {type(error).__name__}: {error}",
+        f"[api_client] call failed (attempt {attempt}), retry in {seconds:.1f}s: {type(error).__name__}: {error}",
         flush=True,
     )
-    time.sleep(seconds)
+    return seconds
 
 
 def _format_response_for_error(resp: object) -> str:
@@ -79,88 +382,784 @@ def _extract_response_text(resp: object) -> str:
     return content
 
 
+def _vision_messages(prompt: str, image_url: str) -> list[dict[str, object]]:
+    return [
+        {
+            "role": "user",
+            "content": [
+                {"type": "text", "text": prompt},
+                {
+                    "type": "image_url",
+                    "image_url": {"url": image_url},
+                },
+            ],
+        }
+    ]
+
+
+def _vision_messages_builder(prompt: str, image_path: Path) -> Callable[[str], list[dict[str, object]]]:
+    # 熔断改道到备用模型时按备用模型的图片 profile 重新编码；profile 相同时命中编码缓存，不重复处理
+    return lambda target: _vision_messages(prompt, _image_data_url(image_path, target))
+
+
+def _text_messages(prompt: str) -> list[dict[str, object]]:
+    return [{"role": "user", "content": prompt}]
+
+
+def _model_limit(model: str) -> int:
+    return max(1, API_MODEL_CONCURRENCY.get(model, API_DEFAULT_MODEL_CONCURRENCY))
+
+
+# 并发上限：全局 + 单模型两级信号量。同步调用(线程)与异步调用各有一套，配置相同。
+_SYNC_GLOBAL_SLOTS = BoundedSemaphore(max(1, API_MAX_CONCURRENCY))
+_SYNC_MODEL_SLOTS: dict[str, BoundedSemaphore] = {}
+_SYNC_SLOTS_LOCK = Lock()
+
+
+@contextmanager
+def _sync_slot(model: str) -> Iterator[None]:
+    with _SYNC_SLOTS_LOCK:
+        model_slots = _SYNC_MODEL_SLOTS.get(model)
+        if model_slots is None:
+            model_slots = BoundedSemaphore(_model_limit(model))
+            _SYNC_MODEL_SLOTS[model] = model_slots
+    with _SYNC_GLOBAL_SLOTS, model_slots:
+        yield
+
+
+class CircuitOpenError(RuntimeError):
+    """模型处于熔断状态且没有可用的备用模型。"""
+
+
+class CircuitBreaker:
+    """
+    单模型熔断器：closed 状态下连续失败 failure_threshold 次进入 open；
+    open 期间拒绝请求，cooldown 秒后进入 half_open 并只放行一个探测请求，
+    探测成功回到 closed，失败重新 open。探测被取消时释放占位；超过 probe_timeout 仍未结束的探测视为丢失，
+    放行新的探测。状态变化写入 details 日志（circuit_breaker 事件）。
+    """
+
+    def __init__(
+        self, model: str, *, failure_threshold: int, cooldown: float, probe_timeout: float
+    ) -> None:
+        self.model = model
+        self.failure_threshold = failure_threshold
+        self.cooldown = cooldown
+        self.probe_timeout = probe_timeout
+        self.state = "closed"
+        self._lock = Lock()
+        self._failures = 0
+        self._opened_at = 0.0
+        self._probe_in_flight = False
+        self._probe_started = 0.0
+        self._probe_id = 0
+        self._rejected = 0
+
+    def _transition(self, state: str, reason: str) -> None:
+        previous, self.state = self.state, state
+        payload = {
+            "model": self.model,
+            "from": previous,
+            "to": state,
+            "reason": reason,
+            "consecutive_failures": self._failures,
+            "rejected_calls": self._rejected,
+            "fallback": MODEL_FALLBACKS.get(self.model),
+        }
+        print(f"[api_client] circuit breaker {self.model}: {previous} -> {state} ({reason})", flush=True)
+        get_details_logger().log_event("circuit_breaker", payload)
+
+    def acquire(self) -> int | None:
+        """放行返回 0，放行的是 half_open 探测则返回探测编号(>0)，拒绝返回 None。"""
+        if self.failure_threshold <= 0:
+            return 0
+        with self._lock:
+            if self.state == "closed":
+                return 0
+            now = time.monotonic()
+            if self.state == "open" and now - self._opened_at >= self.cooldown:
+                self._transition("half_open", f"cooldown {self.cooldown:.0f}s elapsed")
+            if (
+                self.state == "half_open"
+                and self._probe_in_flight
+                and now - self._probe_started >= self.probe_timeout
+            ):
+                print(
+                    f"[api_client] circuit breaker {self.model}: probe #{self._probe_id} "
+                    f"unfinished after {self.probe_timeout:.0f}s, releasing",
+                    flush=True,
+                )
+                self._probe_in_flight = False
+            if self.state == "half_open" and not self._probe_in_flight:
+                self._probe_in_flight = True
+                self._probe_started = now
+                self._probe_id += 1
+                return self._probe_id
+            self._rejected += 1
+            return None
+
+    def release_probe(self, probe_id: int) -> None:
+        """探测请求既未成功也未失败（被取消/中断）时归还占位，熔断器保持 half_open 等待下一个探测。"""
+        if probe_id <= 0:
+            return
+        with self._lock:
+            if self.state == "half_open" and self._probe_in_flight and self._probe_id == probe_id:
+                self._probe_in_flight = False
+
+    def record_success(self) -> None:
+        if self.failure_threshold <= 0:
+            return
+        with self._lock:
+            self._failures = 0
+            self._probe_in_flight = False
+            if self.state != "closed":
+                self._transition("closed", "probe succeeded")
+
+    def record_failure(self, error: Exception) -> bool:
+        """记录一次失败；返回 True 表示这次失败使熔断器进入 open。"""
+        if self.failure_threshold <= 0:
+            return False
+        with self._lock:
+            self._failures += 1
+            reason = f"{type(error).__name__}: {error}"[:200]
+            if self.state == "half_open":
+                self._probe_in_flight = False
+                self._opened_at = time.monotonic()
+                self._transition("open", f"probe failed: {reason}")
+                return True
+            if self.state == "closed" and self._failures >= self.failure_threshold:
+                self._opened_at = time.monotonic()
+                self._transition("open", reason)
+                return True
+            return False
+
+    def stats(self) -> dict[str, object]:
+        with self._lock:
+            return {"state": self.state, "consecutive_failures": self._failures, "rejected_calls": self._rejected}
+
+
+_BREAKERS: dict[str, CircuitBreaker] = {}
+_BREAKERS_LOCK = Lock()
+
+
+def _breaker(model: str) -> CircuitBreaker:
+    with _BREAKERS_LOCK:
+        breaker = _BREAKERS.get(model)
+        if breaker is None:
+            breaker = CircuitBreaker(
+                model,
+                failure_threshold=API_BREAKER_FAILURE_THRESHOLD,
+                cooldown=API_BREAKER_COOLDOWN_SECONDS,
+                probe_timeout=API_BREAKER_PROBE_TIMEOUT_SECONDS,
+            )
+            _BREAKERS[model] = breaker
+        return breaker
+
+
+def circuit_breaker_stats() -> dict[str, dict[str, object]]:
+    with _BREAKERS_LOCK:
+        breakers = list(_BREAKERS.values())
+    return {breaker.model: breaker.stats() for breaker in breakers}
+
+
+def _route_model(model: str, last_error: Exception | None = None) -> tuple[str, int]:
+    """
+    返回 (本次请求实际使用的模型, 探测编号)：熔断时沿 MODEL_FALLBACKS 找第一个放行的模型，都不可用则快速失败，
+    抛出的 CircuitOpenError 以本次调用上一次尝试的真实错误 last_error 为 __cause__。
+    探测编号非 0 表示本次请求占用了 half_open 探测，未得出成败时须调用 release_probe 归还。
+    """
+    candidate: str | None = model
+    visited: list[str] = []
+    while candidate and candidate not in visited:
+        probe_id = _breaker(candidate).acquire()
+        if probe_id is not None:
+            return candidate, probe_id
+        visited.append(candidate)
+        candidate = MODEL_FALLBACKS.get(candidate)
+    raise CircuitOpenError(f"模型已熔断且无可用备用模型: {' -> '.join(visited)}") from last_error
+
+
+def _is_outage(error: Exception) -> bool:
+    # 只有连接失败/超时与 5xx 说明服务不可用；429 按 Retry-After 等待即可，响应解析失败是本地问题，都只交给重试策略
+    if RetryPolicy.classify(error) == "connection":
+        return True
+    return isinstance(error, APIStatusError) and error.status_code >= 500
+
+
+def _record_attempt_failure(model: str, error: Exception) -> bool:
+    """记录一次失败的尝试；返回 True 表示这次失败使熔断器进入 open。"""
+    # 请求类错误(4xx)说明服务端可达，不计入熔断
+    if RetryPolicy.classify(error) == "fatal":
+        _breaker(model).record_success()
+        return False
+    if not _is_outage(error):
+        return False
+    return _breaker(model).record_failure(error)
+
+
+def _budget_kwargs(call_site: str, max_tokens: int | None) -> tuple[int | None, dict[str, object]]:
+    """
+    按调用点预算表补全输出上限与停止序列，返回 (实际下发的上限, 请求参数)。
+    调用方显式传入的 max_tokens 总是下发；预算表只在 CALL_SITE_BUDGETS_ENABLED 时补全。
+    """
+    kwargs: dict[str, object] = {}
+    budget = CALL_SITE_BUDGETS.get(call_site, {}) if CALL_SITE_BUDGETS_ENABLED else {}
+    if max_tokens is None:
+        max_tokens = budget.get("max_tokens")  # type: ignore[assignment]
+    if max_tokens is not None:
+        kwargs[API_MAX_TOKENS_PARAM] = max_tokens
+    if budget.get("stop"):
+        kwargs["stop"] = budget["stop"]
+    return max_tokens, kwargs
+
+
+def _call_site_headers(call_site: str) -> dict[str, object]:
+    # 调用点请求头不参与缓存键，单独在发送时附加
+    if not API_CALL_SITE_HEADER:
+        return {}
+    return {"extra_headers": {API_CALL_SITE_HEADER: call_site}}
+
+
+def _finish_reason(resp: object) -> str | None:
+    choices = getattr(resp, "choices", None) or []
+    if not choices:
+        return None
+    reason = getattr(choices[0], "finish_reason", None)
+    return reason if isinstance(reason, str) else None
+
+
+def _report_truncation(record: CallRecord, max_tokens: int | None) -> None:
+    record.truncated = True
+    print(
+        f"[api_client] 输出因长度上限被截断: call_site={record.call_site}, "
+        f"model={record.served_model}, max_tokens={max_tokens}",
+        flush=True,
+    )
+    get_details_logger().log_event(
+        "truncated_output",
+        {
+            "call_site": record.call_site,
+            "model": record.served_model,
+            "max_tokens": max_tokens,
+            "completion_tokens": record.completion_tokens,
+            "response_bytes": record.response_bytes,
+        },
+    )
+
+
+def _cache_lookup(
+    model: str,
+    messages: list[dict[str, object]],
+    temperature: float,
+    kwargs: dict[str, object],
+) -> tuple[str | None, str | None]:
+    """返回 (缓存键, 命中的响应)。缓存关闭时键为 None；replay-only 未命中直接抛 LLMCacheMiss。"""
+    cache = get_llm_cache()
+    if not cache.enabled:
+        return None, None
+    key = cache_key(model, messages, temperature=temperature, **kwargs)
+    cached = cache.get(key)
+    if cached is None and cache.mode == "replay-only":
+        raise LLMCacheMiss(f"replay-only 模式下缓存未命中: model={model}, key={key}")
+    return key, cached
+
+
+def _chunk_text(chunk: object) -> str:
+    choices = getattr(chunk, "choices", None) or []
+    if not choices:
+        return ""
+    delta = getattr(choices[0], "delta", None)
+    content = getattr(delta, "content", None)
+    return content if isinstance(content, str) else ""
+
+
+class _StopScanner:
+    """增量扫描流式输出：只检查新片段与上一片段末尾拼接的窗口，整体 O(n)。"""
+
+    def __init__(self, marker: str) -> None:
+        self.marker = marker.lower()
+        self._tail = ""
+
+    def feed(self, piece: str) -> bool:
+        window = self._tail + piece.lower()
+        if self.marker in window:
+            return True
+        self._tail = window[-(len(self.marker) - 1) :] if len(self.marker) > 1 else ""
+        return False
+
+
+def _stream_kwargs(stream_until: str | None) -> dict[str, object]:
+    if stream_until is None:
+        return {}
+    kwargs: dict[str, object] = {"stream": True}
+    if STREAM_INCLUDE_USAGE:
+        # usage 只在最后一个 chunk 中返回；提前断开时收不到，见 _mark_early_stop
+        kwargs["stream_options"] = {"include_usage": True}
+    return kwargs
+
+
+def _mark_early_stop(record: CallRecord) -> None:
+    # 提前断开的流没有完整 usage，记为未知而不是 0（部分端点逐块返回累计值，也不可信）
+    record.early_stop = True
+    record.prompt_tokens = None
+    record.completion_tokens = None
+
+
+def _collect_stream(stream: Any, stream_until: str, record: CallRecord) -> str:
+    scanner = _StopScanner(stream_until)
+    parts: list[str] = []
+    try:
+        for chunk in stream:
+            record.set_usage(chunk)
+            record.finish_reason = _finish_reason(chunk) or record.finish_reason
+            piece = _chunk_text(chunk)
+            if not piece:
+                continue
+            parts.append(piece)
+            if scanner.feed(piece):
+                _mark_early_stop(record)
+                break
+    finally:
+        # 提前关闭即断开连接，服务端停止生成
+        stream.close()
+    return "".join(parts)
+
+
+async def _acollect_stream(stream: Any, stream_until: str, record: CallRecord) -> str:
+    scanner = _StopScanner(stream_until)
+    parts: list[str] = []
+    try:
+        async for chunk in stream:
+            record.set_usage(chunk)
+            record.finish_reason = _finish_reason(chunk) or record.finish_reason
+            piece = _chunk_text(chunk)
+            if not piece:
+                continue
+            parts.append(piece)
+            if scanner.feed(piece):
+                _mark_early_stop(record)
+                break
+    finally:
+        await stream.close()
+    return "".join(parts)
+
+
+def _request_bytes(messages: list[dict[str, object]]) -> int:
+    total = 0
+    for message in messages:
+        content = message.get("content")
+        for part in content if isinstance(content, list) else [content]:
+            if isinstance(part, str):
+                total += len(part.encode("utf-8"))
+            elif isinstance(part, dict):
+                text = part.get("text")
+                if isinstance(text, str):
+                    total += len(text.encode("utf-8"))
+                url = (part.get("image_url") or {}).get("url")  # type: ignore[union-attr]
+                if isinstance(url, str):
+                    total += len(url)
+    return total
+
+
+def _chat_completion(
+    model: str,
+    messages: list[dict[str, object]],
+    *,
+    temperature: float,
+    max_tokens: int | None = None,
+    call_site: str = "unspecified",
+    stream_until: str | None = None,
+    messages_for_model: Callable[[str], list[dict[str, object]]] | None = None,
+) -> str:
+    """messages_for_model 非空时，改道到备用模型的请求改用它按实际模型构造的消息。"""
+    max_tokens, kwargs = _budget_kwargs(call_site, max_tokens)
+
+    with call_span(call_site, model, _request_bytes(messages)) as record:
+        # 流式提前截断的回答与完整回答不同，stream_until 也计入缓存键
+        key, cached = _cache_lookup(
+            model, messages, temperature, {**kwargs, "stream_until": stream_until}
+        )
+        if cached is not None:
+            record.cache_hit = True
+            record.response_bytes = len(cached.encode("utf-8"))
+            return cached
+        if not API_KEY:
+            raise RuntimeError("缺少 API_KEY 配置，无法调用接口。")
+
+        attempt = 0
+        served = model
+        estimated_tokens = estimate_tokens(messages, max_tokens)
+        last_error: Exception | None = None
+        while True:
+            target, probe_id = _route_model(model, last_error)
+            attempt = attempt + 1 if target == served else 1
+            served = record.served_model = target
+            record.attempts += 1
+            try:
+                request_messages = messages
+                if target != model and messages_for_model is not None:
+                    request_messages = messages_for_model(target)
+                # 先按配额排队再占并发槽，等待期间不占用连接
+                queue_delay = get_rate_limiter().reserve(target, estimated_tokens)
+                if queue_delay > 0:
+                    record.queue_delay_seconds += queue_delay
+                    time.sleep(queue_delay)
+                try:
+                    with _sync_slot(target):
+                        client = _get_client()
+                        resp = client.chat.completions.create(
+                            model=target,
+                            temperature=temperature,
+                            messages=request_messages,
+                            **_stream_kwargs(stream_until),
+                            **kwargs,
+                            **_call_site_headers(call_site),
+                        )
+                        if stream_until is not None:
+                            record.streamed = True
+                            text = _collect_stream(resp, stream_until, record)
+                        else:
+                            text = _extract_response_text(resp)
+                            record.set_usage(resp)
+                            record.finish_reason = _finish_reason(resp)
+                except Exception as e:
+                    last_error = e
+                    if _record_attempt_failure(target, e):
+                        if MODEL_FALLBACKS.get(target):
+                            # 刚熔断：不再等待退避，下一轮直接改走备用模型
+                            continue
+                        # 没有备用模型时后续尝试都会被熔断拒绝，直接抛出真实的上游错误
+                        raise
+                    seconds = _retry_delay(target, attempt, e)
+                    if seconds is None:
+                        raise
+                    time.sleep(seconds)
+                    continue
+                _breaker(target).record_success()
+                record.response_bytes = len(text.encode("utf-8"))
+                if record.finish_reason == "length":
+                    _report_truncation(record, max_tokens)
+                # 备用模型的回答不写入原模型的缓存键
+                if key is not None and target == model:
+                    get_llm_cache().put(key, model, text)
+                return text
+            finally:
+                # 被取消/中断时探测既未成功也未失败，归还占位；已得出成败时为空操作
+                _breaker(target).release_probe(probe_id)
+
+
 def call_vision_model(
     prompt: str,
     image_path: Path,
     model: str,
     *,
     temperature: float = DEFAULT_TEMPERATURE,
+    call_site: str = "unspecified",
+    stream_until: str | None = None,
 ) -> str:
-    if not API_KEY:
-        raise RuntimeError("缺少 API_KEY 配置，无法调用接口。")
+    """stream_until 非空时流式读取，输出中出现该标记即断开，返回已收到的全部文本。"""
+    image_url = _image_data_url(image_path, model)
+    return _chat_completion(
+        model,
+        _vision_messages(prompt, image_url),
+        temperature=temperature,
+        call_site=call_site,
+        stream_until=stream_until,
+        messages_for_model=_vision_messages_builder(prompt, image_path),
+    )
 
-    base64_image = encode_image(image_path)
 
-    kwargs: dict[str, object] = {}
-    # if max_tokens is not None:
-    #     kwargs["max_tokens"] = max_tokens
+def call_text_model(
+    prompt: str,
+    model: str,
+    *,
+    max_tokens: int | None = None,
+    temperature: float = DEFAULT_TEMPERATURE,
+    call_site: str = "unspecified",
+    stream_until: str | None = None,
+) -> str:
+    return _chat_completion(
+        model,
+        _text_messages(prompt),
+        temperature=temperature,
+        max_tokens=max_tokens,
+        call_site=call_site,
+        stream_until=stream_until,
+    )
+
+
+def call_no_image_model(
+    prompt: str,
+    model: str,
+    *,
+    max_tokens: int | None = None,
+    temperature: float = 0,
+    call_site: str = "unspecified",
+    stream_until: str | None = None,
+) -> str:
+    return call_text_model(
+        prompt,
+        model,
+        max_tokens=max_tokens,
+        temperature=temperature,
+        call_site=call_site,
+        stream_until=stream_until,
+    )
+
 
-    last_error: Exception | None = None
-    max_attempts = max(5, int(API_RECONNECT_RETRIES))
-    for attempt in range(1, max_attempts + 1):
+# =============================================================================
+# 异步接口：与同步接口语义一致（重试、并发上限），供流水线在同一事件循环内并发等待多个调用。
+# 异步客户端与信号量都绑定到创建它们的事件循环，因此按事件循环分别登记。
+# =============================================================================
+class _LoopState:
+    def __init__(self) -> None:
+        self.clients: dict[tuple[str, str, float], AsyncOpenAI] = {}
+        self.global_slots = asyncio.Semaphore(max(1, API_MAX_CONCURRENCY))
+        self.model_slots: dict[str, asyncio.Semaphore] = {}
+
+
+_LOOP_STATES: "weakref.WeakKeyDictionary[asyncio.AbstractEventLoop, _LoopState]" = (
+    weakref.WeakKeyDictionary()
+)
+
+
+def _loop_state() -> _LoopState:
+    loop = asyncio.get_running_loop()
+    state = _LOOP_STATES.get(loop)
+    if state is None:
+        state = _LoopState()
+        _LOOP_STATES[loop] = state
+    return state
+
+
+def _get_async_client(
+    base_url: str = API_BASE_URL,
+    api_key: str | None = API_KEY,
+    timeout: float = API_TIMEOUT_SECONDS,
+) -> AsyncOpenAI:
+    state = _loop_state()
+    key = (base_url, api_key or "", float(timeout))
+    client = state.clients.get(key)
+    if client is None:
+        client = AsyncOpenAI(
+            api_key=api_key,
+            base_url=base_url,
+            timeout=timeout,
+            max_retries=0,
+            http_client=DefaultAsyncHttpxClient(limits=_pool_limits(), timeout=timeout),
+        )
+        state.clients[key] = client
+    return client
+
+
+@asynccontextmanager
+async def _async_slot(model: str) -> AsyncIterator[None]:
+    state = _loop_state()
+    model_slots = state.model_slots.get(model)
+    if model_slots is None:
+        model_slots = asyncio.Semaphore(_model_limit(model))
+        state.model_slots[model] = model_slots
+    async with state.global_slots, model_slots:
+        yield
+
+
+async def aclose_clients() -> None:
+    state = _LOOP_STATES.pop(asyncio.get_running_loop(), None)
+    if state is None:
+        return
+    for client in state.clients.values():
         try:
-            client = OpenAI(api_key=API_KEY, base_url=API_BASE_URL)
-            resp = client.chat.completions.create(
-                model=model,
-                temperature=temperature,
-                messages=[
-                    {
-                        "role": "user",
-                        "content": [
-                            {"type": "text", "text": prompt},
-                            {
-                                "type": "image_url",
-                                "image_url": {"url": f"data:image/png;base64,{base64_image}"},
-                            },
-                        ],
-                    }
-                ],
-                **kwargs,
+            await client.close()
+        except Exception:
+            pass
+
+
+# 后台事件循环：同步代码通过 run_async 提交协程，异步客户端因此可以跨调用复用连接池。
+_BACKGROUND_LOOP: asyncio.AbstractEventLoop | None = None
+_BACKGROUND_LOCK = Lock()
+
+
+def _background_loop() -> asyncio.AbstractEventLoop:
+    global _BACKGROUND_LOOP
+    with _BACKGROUND_LOCK:
+        if _BACKGROUND_LOOP is None:
+            loop = asyncio.new_event_loop()
+            Thread(target=loop.run_forever, name="api-client-loop", daemon=True).start()
+            _BACKGROUND_LOOP = loop
+        return _BACKGROUND_LOOP
+
+
+def run_async(coro: Coroutine[Any, Any, _T]) -> _T:
+    """在后台事件循环中运行协程并阻塞等待结果（可在任意线程调用）。"""
+    return asyncio.run_coroutine_threadsafe(coro, _background_loop()).result()
+
+
+def _stop_background_loop() -> None:
+    global _BACKGROUND_LOOP
+    with _BACKGROUND_LOCK:
+        loop = _BACKGROUND_LOOP
+        _BACKGROUND_LOOP = None
+    if loop is None:
+        return
+    try:
+        asyncio.run_coroutine_threadsafe(aclose_clients(), loop).result(timeout=5)
+    except Exception:
+        pass
+    loop.call_soon_threadsafe(loop.stop)
+
+
+atexit.register(_stop_background_loop)
+
+
+async def _achat_completion(
+    model: str,
+    messages: list[dict[str, object]],
+    *,
+    temperature: float,
+    max_tokens: int | None = None,
+    call_site: str = "unspecified",
+    stream_until: str | None = None,
+    messages_for_model: Callable[[str], list[dict[str, object]]] | None = None,
+) -> str:
+    """messages_for_model 非空时，改道到备用模型的请求改用它按实际模型构造的消息。"""
+    max_tokens, kwargs = _budget_kwargs(call_site, max_tokens)
+
+    with call_span(call_site, model, _request_bytes(messages)) as record:
+        # 流式提前截断的回答与完整回答不同，stream_until 也计入缓存键；
+        # 缓存与限流器可能读写磁盘（SQLite），放到线程里执行，不阻塞共享的事件循环
+        key, cached = None, None
+        if get_llm_cache().enabled:
+            key, cached = await asyncio.to_thread(
+                _cache_lookup, model, messages, temperature, {**kwargs, "stream_until": stream_until}
             )
-            return _extract_response_text(resp)
-        except Exception as e:
-            last_error = e
-            _sleep_before_retry(attempt, e)
-    raise last_error  # type: ignore[misc]
+        if cached is not None:
+            record.cache_hit = True
+            record.response_bytes = len(cached.encode("utf-8"))
+            return cached
+        if not API_KEY:
+            raise RuntimeError("缺少 API_KEY 配置，无法调用接口。")
 
+        attempt = 0
+        served = model
+        estimated_tokens = estimate_tokens(messages, max_tokens)
+        limiter = get_rate_limiter()
+        last_error: Exception | None = None
+        while True:
+            target, probe_id = _route_model(model, last_error)
+            attempt = attempt + 1 if target == served else 1
+            served = record.served_model = target
+            record.attempts += 1
+            try:
+                request_messages = messages
+                if target != model and messages_for_model is not None:
+                    request_messages = await asyncio.to_thread(messages_for_model, target)
+                queue_delay = await asyncio.to_thread(limiter.reserve, target, estimated_tokens)
+                if queue_delay > 0:
+                    record.queue_delay_seconds += queue_delay
+                    await asyncio.sleep(queue_delay)
+                try:
+                    async with _async_slot(target):
+                        client = _get_async_client()
+                        resp = await client.chat.completions.create(
+                            model=target,
+                            temperature=temperature,
+                            messages=request_messages,
+                            **_stream_kwargs(stream_until),
+                            **kwargs,
+                            **_call_site_headers(call_site),
+                        )
+                        if stream_until is not None:
+                            record.streamed = True
+                            text = await _acollect_stream(resp, stream_until, record)
+                        else:
+                            text = _extract_response_text(resp)
+                            record.set_usage(resp)
+                            record.finish_reason = _finish_reason(resp)
+                except Exception as e:
+                    last_error = e
+                    # 熔断状态变化会写 details 日志，同样放到线程里
+                    if await asyncio.to_thread(_record_attempt_failure, target, e):
+                        if MODEL_FALLBACKS.get(target):
+                            # 刚熔断：不再等待退避，下一轮直接改走备用模型
+                            continue
+                        # 没有备用模型时后续尝试都会被熔断拒绝，直接抛出真实的上游错误
+                        raise
+                    seconds = _retry_delay(target, attempt, e)
+                    if seconds is None:
+                        raise
+                    await asyncio.sleep(seconds)
+                    continue
+                breaker = _breaker(target)
+                # 只有 half_open -> closed 的状态变化会写日志，常见的 closed 状态直接记录
+                if breaker.state == "closed":
+                    breaker.record_success()
+                else:
+                    await asyncio.to_thread(breaker.record_success)
+                record.response_bytes = len(text.encode("utf-8"))
+                if record.finish_reason == "length":
+                    await asyncio.to_thread(_report_truncation, record, max_tokens)
+                if key is not None and target == model:
+                    await asyncio.to_thread(get_llm_cache().put, key, model, text)
+                return text
+            finally:
+                # 被取消/中断时探测既未成功也未失败，归还占位；已得出成败时为空操作
+                _breaker(target).release_probe(probe_id)
 
-def call_text_model(
+
+async def acall_vision_model(
     prompt: str,
+    image_path: Path,
     model: str,
     *,
-    max_tokens: int | None = None,
     temperature: float = DEFAULT_TEMPERATURE,
+    call_site: str = "unspecified",
+    stream_until: str | None = None,
 ) -> str:
-    if not API_KEY:
-        raise RuntimeError("缺少 API_KEY 配置，无法调用接口。")
+    # 读图、缩放与 base64 编码都是阻塞操作，不放在共享的事件循环上执行
+    image_url = await asyncio.to_thread(_image_data_url, image_path, model)
+    return await _achat_completion(
+        model,
+        _vision_messages(prompt, image_url),
+        temperature=temperature,
+        call_site=call_site,
+        stream_until=stream_until,
+        messages_for_model=_vision_messages_builder(prompt, image_path),
+    )
 
-    kwargs: dict[str, object] = {}
-    # if max_tokens is not None:
-    #     kwargs["max_tokens"] = max_tokens
 
-    last_error: Exception | None = None
-    max_attempts = max(5, int(API_RECONNECT_RETRIES))
-    for attempt in range(1, max_attempts + 1):
-        try:
-            client = OpenAI(api_key=API_KEY, base_url=API_BASE_URL)
-            resp = client.chat.completions.create(
-                model=model,
-                temperature=temperature,
-                messages=[{"role": "user", "content": prompt}],
-                **kwargs,
-            )
-            return _extract_response_text(resp)
-        except Exception as e:
-            last_error = e
-            _sleep_before_retry(attempt, e)
-    raise last_error  # type: ignore[misc]
+async def acall_text_model(
+    prompt: str,
+    model: str,
+    *,
+    max_tokens: int | None = None,
+    temperature: float = DEFAULT_TEMPERATURE,
+    call_site: str = "unspecified",
+    stream_until: str | None = None,
+) -> str:
+    return await _achat_completion(
+        model,
+        _text_messages(prompt),
+        temperature=temperature,
+        max_tokens=max_tokens,
+        call_site=call_site,
+        stream_until=stream_until,
+    )
 
 
-def call_no_image_model(
+async def acall_no_image_model(
     prompt: str,
     model: str,
     *,
     max_tokens: int | None = None,
     temperature: float = 0,
+    call_site: str = "unspecified",
+    stream_until: str | None = None,
 ) -> str:
-    return call_text_model(prompt, model, max_tokens=max_tokens, temperature=temperature)
\ No newline at end of file
+    return await acall_text_model(
+        prompt,
+        model,
+        max_tokens=max_tokens,
+        temperature=temperature,
+        call_site=call_site,
+        stream_until=stream_until,
+    )
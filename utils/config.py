@@ -35,6 +35,20 @@ def _load_dotenv_if_present() -> None:
 _load_dotenv_if_present()
 
 
+def _parse_env_mapping(name: str) -> dict[str, str]:
+    """解析形如 "key1=value1,key2=value2" 的环境变量为字典。"""
+    mapping: dict[str, str] = {}
+    for item in os.getenv(name, "").split(","):
+        if "=" not in item:
+            continue
+        key, value = item.split("=", 1)
+        key = key.strip()
+        value = _strip_quotes(value)
+        if key and value:
+            mapping[key] = value
+    return mapping
+
+
 # =============================================================================
 # 模型配置 (Model Configuration)
 # =============================================================================
@@ -66,34 +80,149 @@ MODEL_JUDGE = os.getenv("MODEL_JUDGE", MODEL_REVIEW)
 # 生成参数配置 (Generation Parameters)
 # =============================================================================
 DEFAULT_TEMPERATURE = float(os.getenv("DEFAULT_TEMPERATURE", "0"))
+# 默认关闭：部分推理模型接口拒绝 max_tokens(400)，思考 token 也可能耗尽上限而截断回答；开启前按模型确认字段名与额度
+CALL_SITE_BUDGETS_ENABLED = os.getenv("CALL_SITE_BUDGETS_ENABLED", "false").lower() in {"1", "true", "yes"}  # 是否按调用点下发输出上限
+API_MAX_TOKENS_PARAM = os.getenv("API_MAX_TOKENS_PARAM", "max_tokens")  # 输出上限的请求字段名，推理模型可改为 max_completion_tokens
+# 调用点输出预算：max_tokens 为输出 token 上限(推理模型含思考 token)，stop 为可选停止序列(命中时不包含在输出中)
+# 覆盖方式：CALL_SITE_MAX_TOKENS="review=2048,..."；CALL_SITE_STOP="obfuscate=</stem>|###,..."（多个停止序列用 | 分隔）
+CALL_SITE_BUDGETS: dict[str, dict[str, object]] = {
+    "step0": {"max_tokens": 8192},
+    "step_generation": {"max_tokens": 8192},
+    "step_revise": {"max_tokens": 8192},
+    "operate_distinction": {"max_tokens": 4096},
+    "operate_calculation": {"max_tokens": 4096},
+    "visual_verification": {"max_tokens": 2048},
+    "solver_medium": {"max_tokens": 2048},
+    "solver_strong": {"max_tokens": 2048},
+    "solver_no_image": {"max_tokens": 2048},
+    "solver_text_only": {"max_tokens": 4096},
+    "review": {"max_tokens": 4096},
+    "obfuscate": {"max_tokens": 1024},
+    "final": {"max_tokens": 8192},
+    "final_harden": {"max_tokens": 8192},
+    "refine": {"max_tokens": 8192},
+}
+for _site, _limit in _parse_env_mapping("CALL_SITE_MAX_TOKENS").items():
+    CALL_SITE_BUDGETS.setdefault(_site, {})["max_tokens"] = int(_limit) if int(_limit) > 0 else None
+for _site, _stops in _parse_env_mapping("CALL_SITE_STOP").items():
+    CALL_SITE_BUDGETS.setdefault(_site, {})["stop"] = [stop for stop in _stops.split("|") if stop]
 
 # =============================================================================
 # API 配置 (API Configuration)
 # =============================================================================
-API_BASE_URL = "https://idealab.alibaba-inc.com/api/openai/v1" # "https://idealab.alibaba-inc.com/api/openai/v1"
+API_BASE_URL = os.getenv("API_BASE_URL", "https://idealab.alibaba-inc.com/api/openai/v1")
 API_KEY = os.getenv("API_KEY")
-API_MAX_RETRIES = int(os.getenv("API_MAX_RETRIES", "5"))  # 接口调用最大重试次数
-API_RETRY_SLEEP_SECONDS = int(os.getenv("API_RETRY_SLEEP_SECONDS", "5"))  # 重试间隔时间(秒)
-API_RECONNECT_RETRIES = int(os.getenv("API_RECONNECT_RETRIES", "5"))  # 连接失败重试次数
+API_MAX_RETRIES = int(os.getenv("API_MAX_RETRIES", "5"))  # 可重试错误(429/5xx/超时)的最大尝试次数
+API_RETRY_SLEEP_SECONDS = int(os.getenv("API_RETRY_SLEEP_SECONDS", "5"))  # 可重试错误的退避基数(秒)，按 2^n 指数增长并加抖动
+API_RECONNECT_RETRIES = int(os.getenv("API_RECONNECT_RETRIES", "5"))  # 连接失败最大尝试次数
 API_RECONNECT_SLEEP_SECONDS = int(
     os.getenv("API_RECONNECT_SLEEP_SECONDS", "10")
-)  # 连接失败重试间隔(秒)
+)  # 连接失败的退避基数(秒)
+API_RETRY_MAX_SLEEP_SECONDS = float(os.getenv("API_RETRY_MAX_SLEEP_SECONDS", "60"))  # 单次退避上限(秒)，Retry-After 不受此限制
+# 按模型覆盖单次退避上限，格式 API_MODEL_RETRY_MAX_SLEEP="model=seconds,..."
+API_MODEL_RETRY_MAX_SLEEP: dict[str, float] = {
+    model: float(seconds) for model, seconds in _parse_env_mapping("API_MODEL_RETRY_MAX_SLEEP").items()
+}
+API_TIMEOUT_SECONDS = float(os.getenv("API_TIMEOUT_SECONDS", "600"))  # 单次请求超时(秒)
+API_CALL_SITE_HEADER = os.getenv("API_CALL_SITE_HEADER", "")  # 非空时把调用点名放入该请求头(如 X-Call-Site)，供网关统计或本地 stub 按调用点回复
+API_POOL_MAX_CONNECTIONS = int(os.getenv("API_POOL_MAX_CONNECTIONS", "32"))  # 每个客户端连接池的最大连接数
+API_POOL_MAX_KEEPALIVE = int(os.getenv("API_POOL_MAX_KEEPALIVE", "16"))  # 连接池中保持长连接的最大数量
+API_POOL_KEEPALIVE_EXPIRY = float(os.getenv("API_POOL_KEEPALIVE_EXPIRY", "60"))  # 空闲长连接的保活时间(秒)
+API_MAX_CONCURRENCY = int(os.getenv("API_MAX_CONCURRENCY", "16"))  # 全局同时在途请求上限
+API_DEFAULT_MODEL_CONCURRENCY = int(os.getenv("API_DEFAULT_MODEL_CONCURRENCY", "8"))  # 单模型默认同时在途请求上限
+# 单模型并发上限覆盖，格式 API_MODEL_CONCURRENCY="model=n,model2=m"
+API_MODEL_CONCURRENCY: dict[str, int] = {
+    model: int(limit) for model, limit in _parse_env_mapping("API_MODEL_CONCURRENCY").items()
+}
+API_RATE_LIMIT_RPM = float(os.getenv("API_RATE_LIMIT_RPM", "0"))  # 单模型每分钟请求数上限(0 表示不限)
+API_RATE_LIMIT_TPM = float(os.getenv("API_RATE_LIMIT_TPM", "0"))  # 单模型每分钟估算 token 上限(0 表示不限)
+# 按模型覆盖，格式 API_MODEL_RPM="model=60,..." / API_MODEL_TPM="model=200000,..."
+API_MODEL_RPM: dict[str, float] = {
+    model: float(limit) for model, limit in _parse_env_mapping("API_MODEL_RPM").items()
+}
+API_MODEL_TPM: dict[str, float] = {
+    model: float(limit) for model, limit in _parse_env_mapping("API_MODEL_TPM").items()
+}
+API_IMAGE_TOKEN_ESTIMATE = int(os.getenv("API_IMAGE_TOKEN_ESTIMATE", "1000"))  # 限流时每张图片按多少 token 估算
+API_RATE_LIMIT_BACKEND = os.getenv("API_RATE_LIMIT_BACKEND", "memory").lower()  # memory(进程内) / sqlite(多进程共享配额)
+API_RATE_LIMIT_DB = os.getenv("API_RATE_LIMIT_DB", "data/.rate_limit.sqlite")  # sqlite 后端的数据库文件
+API_BREAKER_FAILURE_THRESHOLD = int(os.getenv("API_BREAKER_FAILURE_THRESHOLD", "5"))  # 单模型连续失败多少次后熔断(<=0 关闭熔断)
+API_BREAKER_COOLDOWN_SECONDS = float(os.getenv("API_BREAKER_COOLDOWN_SECONDS", "60"))  # 熔断后多久放行一次探测请求(秒)
+API_BREAKER_PROBE_TIMEOUT_SECONDS = float(os.getenv("API_BREAKER_PROBE_TIMEOUT_SECONDS", str(API_TIMEOUT_SECONDS)))  # 探测请求超过该时长仍未结束视为丢失，放行新的探测(秒)
+# 熔断期间的备用模型，格式 MODEL_FALLBACKS="model=fallback,..."；未配置备用模型时熔断期间直接失败
+MODEL_FALLBACKS: dict[str, str] = {
+    **_parse_env_mapping("MODEL_FALLBACKS"),
+}
+
+# =============================================================================
+# 图片预处理配置 (Image Preprocessing Configuration)
+# =============================================================================
+IMAGE_PREPROCESS = os.getenv("IMAGE_PREPROCESS", "false").lower() in {"1", "true", "yes"}  # 是否在上传前按模型缩放/重压缩图片
+IMAGE_CACHE_DIR = os.getenv("IMAGE_CACHE_DIR", "data/.image_cache")  # 派生图片的磁盘缓存目录
+IMAGE_DEFAULT_PROFILE = os.getenv("IMAGE_DEFAULT_PROFILE", "full")  # 未单独配置的模型使用的 profile
+# 预处理 profile：max_edge 为最长边像素上限(None 表示不缩放)，format 为 None 表示保持原格式
+IMAGE_PROFILES: dict[str, dict[str, object]] = {
+    "full": {"max_edge": None, "format": None, "quality": None},
+    "compact": {
+        "max_edge": int(os.getenv("IMAGE_COMPACT_MAX_EDGE", "1024")),
+        "format": os.getenv("IMAGE_COMPACT_FORMAT", "JPEG").upper(),
+        "quality": int(os.getenv("IMAGE_COMPACT_QUALITY", "85")),
+    },
+    "webp": {
+        "max_edge": int(os.getenv("IMAGE_WEBP_MAX_EDGE", "1024")),
+        "format": "WEBP",
+        "quality": int(os.getenv("IMAGE_WEBP_QUALITY", "80")),
+    },
+}
+# 模型 -> profile 映射；出题模型保持原图，求解/评审模型使用压缩图。可用 IMAGE_MODEL_PROFILES="model=profile,..." 覆盖
+IMAGE_MODEL_PROFILES: dict[str, str] = {
+    MODEL_SOLVE_MEDIUM: "compact",
+    MODEL_REVIEW: "compact",
+    MODEL_STAGE_1: "full",
+    **_parse_env_mapping("IMAGE_MODEL_PROFILES"),
+}
+
+# =============================================================================
+# 响应缓存配置 (LLM Response Cache Configuration)
+# =============================================================================
+LLM_CACHE_MODE = os.getenv("LLM_CACHE_MODE", "off").lower()  # off / read-write / replay-only(未命中直接报错，不访问网络)
+LLM_CACHE_DIR = os.getenv("LLM_CACHE_DIR", "data/.llm_cache")  # 响应缓存目录，每条响应一个文件
+LLM_CACHE_MAX_MB = float(os.getenv("LLM_CACHE_MAX_MB", "512"))  # 缓存总大小上限(MB)，超出后按最近使用时间淘汰
 
 # =============================================================================
 # 生成流程配置 (Generation Process Configuration)
 # =============================================================================
 MAX_ROUNDS = int(os.getenv("MAX_ROUNDS", "10"))  # 最大生成轮次
-GENQA_SIMPLE_PATH = os.getenv("GENQA_SIMPLE_PATH", "genqa_simple.json")  # 简单题目保存路径
-GENQA_MEDIUM_PATH = os.getenv("GENQA_MEDIUM_PATH", "genqa_medium.json")  # 中等题目保存路径
+# 题目保存路径：.jsonl 按行追加；其他后缀沿用旧版 JSON 数组整体重写
+GENQA_SIMPLE_PATH = os.getenv("GENQA_SIMPLE_PATH", "genqa_simple.jsonl")  # 简单题目保存路径
+GENQA_MEDIUM_PATH = os.getenv("GENQA_MEDIUM_PATH", "genqa_medium.jsonl")  # 中等题目保存路径
 GENQA_STRONG_PATH = os.getenv(
-    "GENQA_STRONG_PATH", os.getenv("GENQA_HARD_PATH", "genqa_strong.json")
+    "GENQA_STRONG_PATH", os.getenv("GENQA_HARD_PATH", "genqa_strong.jsonl")
 )  # 困难题目保存路径
-DETAILS_PATH = os.getenv("DETAILS_PATH", "details.json")  # 终端与草稿信息日志
+METRICS_PATH = os.getenv("METRICS_PATH", "")  # 每次 API 调用一行度量记录(jsonl)，跨运行追加；默认为空，只在内存中汇总
+METRICS_MAX_RECORDS = int(os.getenv("METRICS_MAX_RECORDS", "10000"))  # 内存中保留的最近调用记录数(每个调用点的耗时样本同样封顶)；汇总的计数与总和不受影响
+TRACE_PATH = os.getenv("TRACE_PATH", "")  # 非空时把 episode 时间线导出为 Chrome trace JSON(chrome://tracing / Perfetto 打开)，默认关闭
+TRACE_MAX_EVENTS = int(os.getenv("TRACE_MAX_EVENTS", "200000"))  # 内存中最多保留的 span 数，超出后丢弃最早的并计数
+DETAILS_BACKEND = os.getenv("DETAILS_BACKEND", "jsonl").lower()  # 日志存储格式: jsonl(追加写) / json(旧版整体重写)
+DETAILS_PATH = os.getenv(
+    "DETAILS_PATH", "details.jsonl" if DETAILS_BACKEND == "jsonl" else "details.json"
+)  # 终端与草稿信息日志
+DETAILS_FSYNC = os.getenv("DETAILS_FSYNC", "interval").lower()  # jsonl 落盘策略: never / interval / always
+DETAILS_FSYNC_INTERVAL_SECONDS = float(os.getenv("DETAILS_FSYNC_INTERVAL_SECONDS", "1.0"))  # interval 策略下两次 fsync 的最小间隔(秒)
+DETAILS_ASYNC = os.getenv("DETAILS_ASYNC", "true").lower() in {"1", "true", "yes"}  # 日志交给后台线程写盘，print 不阻塞
+DETAILS_QUEUE_SIZE = int(os.getenv("DETAILS_QUEUE_SIZE", "10000"))  # 后台写入队列容量，满时丢弃 stdout 行并计数，事件记录阻塞等待
+DETAILS_FLUSH_INTERVAL_SECONDS = float(os.getenv("DETAILS_FLUSH_INTERVAL_SECONDS", "0.5"))  # 攒批最长等待时间(秒)
+DETAILS_FLUSH_BATCH = int(os.getenv("DETAILS_FLUSH_BATCH", "256"))  # 攒够多少条立即写盘
 
 MAX_STEPS_PER_ROUND = int(os.getenv("MAX_STEPS_PER_ROUND", "6"))  # 每轮生成的最大推理步数
 MIN_HOPS = int(os.getenv("MIN_HOPS", "5"))  # 最小推理跳数 (用于控制题目复杂度)
 REQUIRE_CROSS_MODAL = os.getenv("REQUIRE_CROSS_MODAL", "true").lower() in {"1", "true", "yes"}  # 是否强制要求跨模态推理
 
+PARALLEL_OPERATE_AGENTS = os.getenv("PARALLEL_OPERATE_AGENTS", "true").lower() in {"1", "true", "yes"}  # 两个 operate 智能体并发起草
+PARALLEL_SOLVERS = os.getenv("PARALLEL_SOLVERS", "false").lower() in {"1", "true", "yes"}  # 最终题难度评估时并发调用各求解器(Strong 推测执行)
+SOLVER_STREAMING = os.getenv("SOLVER_STREAMING", "false").lower() in {"1", "true", "yes"}  # 求解器流式读取，读到 </answer> 即断开
+STREAM_INCLUDE_USAGE = os.getenv("STREAM_INCLUDE_USAGE", "true").lower() in {"1", "true", "yes"}  # 流式请求附带 stream_options.include_usage，读完时取得 usage；端点不支持该参数时关闭
+
 VERIFY_STRICT = os.getenv("VERIFY_STRICT", "false").lower() in {"1", "true", "yes"}  # 是否启用严格验证
 
 # =============================================================================
@@ -101,6 +230,10 @@ VERIFY_STRICT = os.getenv("VERIFY_STRICT", "false").lower() in {"1", "true", "ye
 # =============================================================================
 ENABLE_GRAPH_MODE = os.getenv("ENABLE_GRAPH_MODE", "true").lower() in {"1", "true", "yes"}  # 是否启用图模式构建上下文
 DOC_CHUNK_WORDS = int(os.getenv("DOC_CHUNK_WORDS", "160"))  # 文档分块大小 (词数)
+GRAPH_EXTRACTION_MODE = os.getenv("GRAPH_EXTRACTION_MODE", "single").lower()  # 知识链抽取方式: single(全文一次调用) / chunked(分块并发抽取后合并)
+GRAPH_CHUNK_OVERLAP_WORDS = int(os.getenv("GRAPH_CHUNK_OVERLAP_WORDS", "32"))  # 相邻分块重叠的词数，避免跨块的知识链被切断
+GRAPH_STORE_PATH = os.getenv("GRAPH_STORE_PATH", "data/graph_store.sqlite3")  # 知识边缓存 (SQLite，多进程共享)
+GRAPH_CACHE_PATH = os.getenv("GRAPH_CACHE_PATH", "data/graph_cache.json")  # 旧版 JSON 知识边缓存，首次打开 SQLite 存储时自动导入
+GRAPH_CACHE_MAX_DOCUMENTS = int(os.getenv("GRAPH_CACHE_MAX_DOCUMENTS", "64"))  # 知识边缓存保留最近使用（构建或命中）的文档数，其余文档及不再被引用的分块被清理 (0 表示不限)
 REQUIRE_DISTINCT_SOURCES = os.getenv("REQUIRE_DISTINCT_SOURCES", "false").lower() in {"1", "true", "yes"}  # 是否要求信息来源不同
-PATH_SAMPLER = os.getenv("PATH_SAMPLER", "rbfs")  # 路径采样算法 (如: rbfs)
 MAX_SHORTCUT_EDGES = int(os.getenv("MAX_SHORTCUT_EDGES", "10"))  # 图中允许的最大快捷边数量
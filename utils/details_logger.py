@@ -1,22 +1,56 @@
 from __future__ import annotations
 
+import argparse
+import atexit
 import json
+import os
+import queue
+import signal
 import sys
 import time
 from io import TextIOBase
 from pathlib import Path
-from threading import Lock
-from typing import Any
+from threading import Event, Lock, Thread, current_thread
+from typing import Any, TextIO
 
-from utils.config import DETAILS_PATH
+from utils.config import (
+    DETAILS_ASYNC,
+    DETAILS_BACKEND,
+    DETAILS_FLUSH_BATCH,
+    DETAILS_FLUSH_INTERVAL_SECONDS,
+    DETAILS_FSYNC,
+    DETAILS_FSYNC_INTERVAL_SECONDS,
+    DETAILS_PATH,
+    DETAILS_QUEUE_SIZE,
+)
+from utils.file_io import atomic_write_text, file_lock
+
+
+def _stdout_record(line: str) -> dict[str, Any]:
+    return {"type": "stdout", "line": line}
+
+
+def _event_record(kind: str, payload: dict[str, Any]) -> dict[str, Any]:
+    return {"type": "event", "ts": round(time.time(), 3), "kind": kind, "payload": payload}
 
 
 class DetailsLogger:
+    """
+    旧版后端：内存中维护完整的 {"stdout": [...], "events": [...]}，每次写入整体重写 JSON 文件。
+    只有文件在上次写入后被其他进程改过（inode / mtime / size 变化）时才重新读取解析。
+    """
+
     def __init__(self, path: Path) -> None:
         self._path = path
         self._lock = Lock()
         self._data: dict[str, Any] = {"stdout": [], "events": []}
         self._loaded = False
+        self._signature: tuple[int, int, int] | None = None
+        self._writer: _BackgroundWriter | None = None
+
+    @property
+    def path(self) -> Path:
+        return self._path
 
     def _load(self) -> None:
         if self._loaded:
@@ -35,32 +69,316 @@ class DetailsLogger:
                 pass
         self._loaded = True
 
+    def _file_signature(self) -> tuple[int, int, int] | None:
+        try:
+            stat = self._path.stat()
+        except OSError:
+            return None
+        return stat.st_ino, stat.st_mtime_ns, stat.st_size
+
     def _save(self) -> None:
-        self._path.parent.mkdir(parents=True, exist_ok=True)
-        self._path.write_text(
-            json.dumps(self._data, ensure_ascii=False, indent=2),
-            encoding="utf-8",
-        )
+        atomic_write_text(self._path, json.dumps(self._data, ensure_ascii=False, indent=2))
+        self._signature = self._file_signature()
 
-    def log_stdout_line(self, line: str) -> None:
-        with self._lock:
+    def _write_records(self, records: list[dict[str, Any]]) -> None:
+        with file_lock(self._path):
+            # 其他进程可能写过同一文件：持锁比较文件签名，变化时才重新读取磁盘内容，合并后原子替换
+            if self._file_signature() != self._signature:
+                self._loaded = False
             self._load()
-            self._data["stdout"].append(line)
+            for record in records:
+                if record["type"] == "stdout":
+                    self._data["stdout"].append(record["line"])
+                else:
+                    self._data["events"].append(
+                        {"ts": record["ts"], "kind": record["kind"], "payload": record["payload"]}
+                    )
             self._save()
 
-    def log_event(self, kind: str, payload: dict[str, Any]) -> None:
+    def _flush_records(self, records: list[dict[str, Any]]) -> None:
         with self._lock:
-            self._load()
-            self._data["events"].append(
-                {"ts": round(time.time(), 3), "kind": kind, "payload": payload}
+            self._write_records(records)
+
+    def _submit(self, record: dict[str, Any]) -> None:
+        writer = self._writer
+        if writer is not None:
+            writer.submit(record)
+        else:
+            self._flush_records([record])
+
+    def log_stdout_line(self, line: str) -> None:
+        self._submit(_stdout_record(line))
+
+    def log_event(self, kind: str, payload: dict[str, Any]) -> None:
+        self._submit(_event_record(kind, payload))
+
+    def start_background_writer(
+        self,
+        *,
+        max_queue: int = DETAILS_QUEUE_SIZE,
+        flush_interval: float = DETAILS_FLUSH_INTERVAL_SECONDS,
+        flush_batch: int = DETAILS_FLUSH_BATCH,
+    ) -> None:
+        if self._writer is None:
+            self._writer = _BackgroundWriter(
+                self, max_queue=max_queue, flush_interval=flush_interval, flush_batch=flush_batch
             )
+
+    def flush(self, timeout: float | None = None) -> None:
+        if self._writer is not None:
+            self._writer.flush(timeout)
+
+    def stats(self) -> dict[str, int]:
+        if self._writer is None:
+            return {"backlog": 0, "dropped": 0, "written": 0}
+        return self._writer.stats()
+
+    def shutdown(self, timeout: float | None = 5.0) -> None:
+        writer, self._writer = self._writer, None
+        if writer is not None:
+            writer.stop(timeout)
+            if writer.dropped:
+                sys.__stderr__.write(f"[details_logger] 共丢弃 {writer.dropped} 条日志\n")
+        self.close()
+
+    def _reset_storage(self) -> None:
+        self._data = {"stdout": [], "events": []}
+        self._loaded = True
+        with file_lock(self._path):
             self._save()
 
     def reset(self) -> None:
+        self.flush()
         with self._lock:
-            self._data = {"stdout": [], "events": []}
-            self._loaded = True
-            self._save()
+            self._reset_storage()
+
+    def close(self) -> None:
+        return None
+
+
+class JsonlDetailsLogger(DetailsLogger):
+    """
+    追加写后端：每条 stdout 行 / 事件是一行 JSON，写入代价与已有日志大小无关。
+    fsync 策略：never（只 flush 到操作系统）、interval（距上次 fsync 超过间隔才 fsync）、always（每次写入都 fsync）。
+    """
+
+    def __init__(
+        self,
+        path: Path,
+        *,
+        fsync_policy: str = DETAILS_FSYNC,
+        fsync_interval: float = DETAILS_FSYNC_INTERVAL_SECONDS,
+    ) -> None:
+        super().__init__(path)
+        if fsync_policy not in {"never", "interval", "always"}:
+            fsync_policy = "interval"
+        self._fsync_policy = fsync_policy
+        self._fsync_interval = fsync_interval
+        self._last_fsync = 0.0
+        self._handle: TextIO | None = None
+
+    def _open(self, mode: str) -> TextIO:
+        if self._handle is not None:
+            self._handle.close()
+        self._path.parent.mkdir(parents=True, exist_ok=True)
+        self._handle = self._path.open(mode, encoding="utf-8")
+        return self._handle
+
+    def _sync(self, handle: TextIO) -> None:
+        handle.flush()
+        if self._fsync_policy == "never":
+            return
+        now = time.monotonic()
+        if self._fsync_policy == "interval" and now - self._last_fsync < self._fsync_interval:
+            return
+        os.fsync(handle.fileno())
+        self._last_fsync = now
+
+    def _write_records(self, records: list[dict[str, Any]]) -> None:
+        handle = self._handle or self._open("a")
+        with file_lock(self._path):
+            # 持锁写完整批并 flush，多进程共享同一文件时各批次不会交错
+            handle.write(
+                "".join(json.dumps(record, ensure_ascii=False) + "\n" for record in records)
+            )
+            self._sync(handle)
+
+    def _reset_storage(self) -> None:
+        with file_lock(self._path):
+            self._sync(self._open("w"))
+
+    def close(self) -> None:
+        with self._lock:
+            if self._handle is None:
+                return
+            self._handle.flush()
+            if self._fsync_policy != "never":
+                os.fsync(self._handle.fileno())
+            self._handle.close()
+            self._handle = None
+
+
+def load_details(path: Path) -> dict[str, Any]:
+    """读取 details 日志（jsonl 或旧版 json），返回旧版 {"stdout": [...], "events": [...]} 结构。"""
+    data: dict[str, Any] = {"stdout": [], "events": []}
+    text = path.read_text(encoding="utf-8")
+    try:
+        payload = json.loads(text)
+    except json.JSONDecodeError:
+        payload = None
+    if isinstance(payload, dict) and "type" not in payload:
+        data["stdout"] = list(payload.get("stdout") or [])
+        data["events"] = list(payload.get("events") or [])
+        return data
+    for raw_line in text.splitlines():
+        if not raw_line.strip():
+            continue
+        try:
+            record = json.loads(raw_line)
+        except json.JSONDecodeError:
+            # 进程中断时最后一行可能写了一半，跳过即可
+            continue
+        if not isinstance(record, dict):
+            continue
+        if record.get("type") == "stdout":
+            data["stdout"].append(record.get("line", ""))
+        elif record.get("type") == "event":
+            data["events"].append(
+                {"ts": record.get("ts"), "kind": record.get("kind"), "payload": record.get("payload")}
+            )
+    return data
+
+
+def export_legacy_json(source: Path, target: Path) -> dict[str, int]:
+    """把 jsonl 日志压缩/导出为旧版 details.json 结构。"""
+    data = load_details(source)
+    atomic_write_text(target, json.dumps(data, ensure_ascii=False, indent=2))
+    return {"stdout": len(data["stdout"]), "events": len(data["events"])}
+
+
+# 运行中丢弃 stdout 行时，至多每隔这么久在 stderr 与日志中报告一次累计丢弃数
+_DROP_REPORT_INTERVAL_SECONDS = 10.0
+
+
+class _FlushRequest:
+    def __init__(self, *, stop: bool = False) -> None:
+        self.stop = stop
+        self.done = Event()
+
+
+class _BackgroundWriter:
+    """
+    有界队列 + 后台线程：调用方只入队，写盘由后台线程攒批完成。
+    攒够 flush_batch 条或距批次第一条超过 flush_interval 秒即写盘。队列满时 stdout 行丢弃并计数
+    （运行中定期报告），事件记录则阻塞等待入队，绝不丢弃。
+    """
+
+    def __init__(
+        self,
+        logger: DetailsLogger,
+        *,
+        max_queue: int,
+        flush_interval: float,
+        flush_batch: int,
+    ) -> None:
+        self._logger = logger
+        self._queue: queue.Queue[dict[str, Any] | _FlushRequest] = queue.Queue(
+            maxsize=max(1, max_queue)
+        )
+        self._flush_interval = max(0.0, flush_interval)
+        self._flush_batch = max(1, flush_batch)
+        self._stats_lock = Lock()
+        self.dropped = 0
+        self.written = 0
+        self._reported_dropped = 0
+        self._last_report = 0.0
+        self._thread = Thread(target=self._run, name="details-logger", daemon=True)
+        self._thread.start()
+
+    def submit(self, record: dict[str, Any]) -> None:
+        try:
+            self._queue.put_nowait(record)
+            return
+        except queue.Full:
+            pass
+        # 后台线程自身不能等待自己消费队列；写线程已退出时直接同步写盘
+        if record["type"] == "event" and current_thread() is not self._thread:
+            if self._thread.is_alive():
+                self._queue.put(record)
+            else:
+                self._logger._flush_records([record])
+            return
+        with self._stats_lock:
+            self.dropped += 1
+
+    def flush(self, timeout: float | None = None) -> None:
+        if not self._thread.is_alive():
+            return
+        request = _FlushRequest()
+        self._queue.put(request)
+        request.done.wait(timeout)
+
+    def stop(self, timeout: float | None = None) -> None:
+        if not self._thread.is_alive():
+            return
+        request = _FlushRequest(stop=True)
+        self._queue.put(request)
+        request.done.wait(timeout)
+        self._thread.join(timeout)
+
+    def stats(self) -> dict[str, int]:
+        with self._stats_lock:
+            return {"backlog": self._queue.qsize(), "dropped": self.dropped, "written": self.written}
+
+    def _write(self, batch: list[dict[str, Any]]) -> None:
+        if not batch:
+            return
+        try:
+            self._logger._flush_records(batch)
+        except Exception as exc:
+            with self._stats_lock:
+                self.dropped += len(batch)
+            sys.__stderr__.write(f"[details_logger] 写入失败: {type(exc).__name__}: {exc}\n")
+            return
+        with self._stats_lock:
+            self.written += len(batch)
+
+    def _report_drops(self) -> None:
+        now = time.monotonic()
+        with self._stats_lock:
+            dropped = self.dropped
+            if dropped == self._reported_dropped or now - self._last_report < _DROP_REPORT_INTERVAL_SECONDS:
+                return
+            new, self._reported_dropped, self._last_report = dropped - self._reported_dropped, dropped, now
+        sys.__stderr__.write(f"[details_logger] 新丢弃 {new} 条日志（累计 {dropped} 条）\n")
+        self._write([_event_record("details_dropped", {"dropped": dropped, "new": new})])
+
+    def _run(self) -> None:
+        batch: list[dict[str, Any]] = []
+        deadline = 0.0
+        while True:
+            timeout = max(0.0, deadline - time.monotonic()) if batch else None
+            try:
+                item = self._queue.get(timeout=timeout)
+            except queue.Empty:
+                self._write(batch)
+                batch = []
+                self._report_drops()
+                continue
+            if isinstance(item, _FlushRequest):
+                self._write(batch)
+                batch = []
+                item.done.set()
+                if item.stop:
+                    return
+                continue
+            if not batch:
+                deadline = time.monotonic() + self._flush_interval
+            batch.append(item)
+            if len(batch) >= self._flush_batch:
+                self._write(batch)
+                batch = []
+                self._report_drops()
 
 
 class TeeStream(TextIOBase):
@@ -69,15 +387,19 @@ class TeeStream(TextIOBase):
         self._logger = logger
         self._is_stderr = is_stderr
         self._buffer = ""
+        self._buffer_lock = Lock()
 
     def write(self, s: str) -> int:
         if not isinstance(s, str):
             s = str(s)
         self._original.write(s)
         self._original.flush()
-        self._buffer += s
-        while "\n" in self._buffer:
-            line, self._buffer = self._buffer.split("\n", 1)
+        with self._buffer_lock:
+            self._buffer += s
+            if "\n" not in self._buffer:
+                return len(s)
+            *lines, self._buffer = self._buffer.split("\n")
+        for line in lines:
             if self._is_stderr:
                 self._logger.log_event("stderr_line", {"line": line})
             else:
@@ -88,31 +410,81 @@ class TeeStream(TextIOBase):
         self._original.flush()
 
     def close(self) -> None:
-        if self._buffer:
+        with self._buffer_lock:
+            pending, self._buffer = self._buffer, ""
+        if pending:
             if self._is_stderr:
-                self._logger.log_event("stderr_line", {"line": self._buffer})
+                self._logger.log_event("stderr_line", {"line": pending})
             else:
-                self._logger.log_stdout_line(self._buffer)
-            self._buffer = ""
+                self._logger.log_stdout_line(pending)
         self._original.flush()
 
 
 _DETAILS_LOGGER: DetailsLogger | None = None
+_SHUTDOWN_REGISTERED = False
 
 
 def get_details_logger() -> DetailsLogger:
     global _DETAILS_LOGGER
     if _DETAILS_LOGGER is None:
-        _DETAILS_LOGGER = DetailsLogger(Path(DETAILS_PATH))
+        if DETAILS_BACKEND == "json":
+            _DETAILS_LOGGER = DetailsLogger(Path(DETAILS_PATH))
+        else:
+            _DETAILS_LOGGER = JsonlDetailsLogger(Path(DETAILS_PATH))
     return _DETAILS_LOGGER
 
 
+def _shutdown_details_logging() -> None:
+    for name in ("stdout", "stderr"):
+        stream = getattr(sys, name)
+        if isinstance(stream, TeeStream):
+            stream.close()
+    if _DETAILS_LOGGER is not None:
+        _DETAILS_LOGGER.shutdown()
+
+
+def _install_signal_flush() -> None:
+    # SIGTERM 默认直接终止进程、不会执行 atexit；改为抛出 SystemExit 以便先把队列写完。
+    def _handle(signum: int, frame: object) -> None:
+        raise SystemExit(128 + signum)
+
+    try:
+        if signal.getsignal(signal.SIGTERM) in (signal.SIG_DFL, None):
+            signal.signal(signal.SIGTERM, _handle)
+    except (ValueError, OSError):
+        # 非主线程或平台不支持时跳过，仍有 atexit 兜底
+        pass
+
+
 def setup_details_logging(*, reset: bool = True) -> DetailsLogger:
     logger = get_details_logger()
     if reset:
         logger.reset()
+    if DETAILS_ASYNC:
+        logger.start_background_writer()
+        _install_signal_flush()
+    global _SHUTDOWN_REGISTERED
+    if not _SHUTDOWN_REGISTERED:
+        atexit.register(_shutdown_details_logging)
+        _SHUTDOWN_REGISTERED = True
     if not isinstance(sys.stdout, TeeStream):
         sys.stdout = TeeStream(sys.stdout, logger, is_stderr=False)
     if not isinstance(sys.stderr, TeeStream):
         sys.stderr = TeeStream(sys.stderr, logger, is_stderr=True)
     return logger
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="details 日志工具")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+    export_parser = subparsers.add_parser("export", help="把 jsonl 日志导出为旧版 details.json 结构")
+    export_parser.add_argument("source", nargs="?", default=DETAILS_PATH)
+    export_parser.add_argument("target", nargs="?", default="details.json")
+    args = parser.parse_args()
+    if args.command == "export":
+        counts = export_legacy_json(Path(args.source), Path(args.target))
+        print(f"exported {counts['stdout']} stdout lines, {counts['events']} events -> {args.target}")
+
+
+if __name__ == "__main__":
+    main()
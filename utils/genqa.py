@@ -1,24 +1,84 @@
+import argparse
 import json
 from pathlib import Path
 from typing import Any
 
+from utils.file_io import append_bytes, atomic_write_text, file_lock
 
-def save_genqa_item(genqa_path: Path, payload: dict[str, Any]) -> None:
-    genqa_path.parent.mkdir(parents=True, exist_ok=True)
-    existing: list[dict[str, object]] = []
-    if genqa_path.exists():
+
+def _parse_items(text: str) -> list[dict[str, Any]]:
+    try:
+        loaded = json.loads(text)
+    except json.JSONDecodeError:
+        loaded = None
+    if isinstance(loaded, list):
+        return [item for item in loaded if isinstance(item, dict)]
+    if isinstance(loaded, dict):
+        return [loaded]
+
+    items: list[dict[str, Any]] = []
+    for raw_line in text.splitlines():
+        if not raw_line.strip():
+            continue
         try:
-            loaded = json.loads(genqa_path.read_text(encoding="utf-8"))
-            if isinstance(loaded, list):
-                existing = loaded  # type: ignore[assignment]
-            elif isinstance(loaded, dict):
-                existing = [loaded]  # type: ignore[list-item]
-            else:
-                existing = []
+            item = json.loads(raw_line)
         except json.JSONDecodeError:
-            existing = []
-    existing.append(payload)
-    genqa_path.write_text(
-        json.dumps(existing, ensure_ascii=False, indent=2),
-        encoding="utf-8",
+            # 写入中断留下的半行，跳过
+            continue
+        if isinstance(item, dict):
+            items.append(item)
+    return items
+
+
+def load_genqa_items(genqa_path: Path) -> list[dict[str, Any]]:
+    """读取题目文件，兼容 jsonl（每行一题）与旧版 JSON 数组格式。"""
+    if not genqa_path.exists():
+        return []
+    return _parse_items(genqa_path.read_text(encoding="utf-8"))
+
+
+def _migrate_legacy_array(genqa_path: Path) -> None:
+    # 首次写入 xxx.jsonl 时，把同名旧版 xxx.json 数组中的题目导入，保证数据集连续
+    legacy_path = genqa_path.with_suffix(".json")
+    if not legacy_path.exists():
+        return
+    items = load_genqa_items(legacy_path)
+    if not items:
+        return
+    atomic_write_text(
+        genqa_path,
+        "".join(json.dumps(item, ensure_ascii=False) + "\n" for item in items),
     )
+
+
+def save_genqa_item(genqa_path: Path, payload: dict[str, Any]) -> None:
+    """
+    保存一道题目（持有进程间文件锁）。.jsonl 路径按行追加（O_APPEND + fsync，代价与文件大小无关）；
+    其他后缀沿用旧版 JSON 数组，读-改-写后原子替换。
+    """
+    with file_lock(genqa_path):
+        if genqa_path.suffix != ".jsonl":
+            existing = load_genqa_items(genqa_path)
+            existing.append(payload)
+            atomic_write_text(genqa_path, json.dumps(existing, ensure_ascii=False, indent=2))
+            return
+        if not genqa_path.exists():
+            _migrate_legacy_array(genqa_path)
+        append_bytes(genqa_path, (json.dumps(payload, ensure_ascii=False) + "\n").encode("utf-8"))
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="genqa 数据集工具")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+    export_parser = subparsers.add_parser("export", help="把 jsonl/旧版文件导出为 JSON 数组")
+    export_parser.add_argument("source")
+    export_parser.add_argument("target")
+    args = parser.parse_args()
+    if args.command == "export":
+        items = load_genqa_items(Path(args.source))
+        atomic_write_text(Path(args.target), json.dumps(items, ensure_ascii=False, indent=2))
+        print(f"exported {len(items)} items -> {args.target}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,170 @@
+import hashlib
+import json
+import os
+import time
+from pathlib import Path
+from threading import Lock
+
+from utils.config import LLM_CACHE_DIR, LLM_CACHE_MAX_MB, LLM_CACHE_MODE
+from utils.file_io import atomic_write_text
+
+_MODES = {"off", "read-write", "replay-only"}
+# 缓存条目格式版本；请求参数或条目结构变化时递增，旧条目自然失效
+_KEY_VERSION = 1
+
+
+class LLMCacheMiss(RuntimeError):
+    """replay-only 模式下请求未命中缓存。"""
+
+
+def _canonical_messages(messages: list[dict[str, object]]) -> list[dict[str, object]]:
+    # 图片以 data URL 内联在消息里：换成其内容哈希，键只依赖实际上传的图片字节（含预处理 profile）
+    canonical: list[dict[str, object]] = []
+    for message in messages:
+        content = message.get("content")
+        if not isinstance(content, list):
+            canonical.append(message)
+            continue
+        parts: list[object] = []
+        for part in content:
+            if isinstance(part, dict) and part.get("type") == "image_url":
+                url = str((part.get("image_url") or {}).get("url", ""))  # type: ignore[union-attr]
+                digest = hashlib.sha256(url.encode("utf-8")).hexdigest()
+                parts.append({"type": "image_url", "image_sha256": digest})
+            else:
+                parts.append(part)
+        canonical.append({**message, "content": parts})
+    return canonical
+
+
+def cache_key(
+    model: str,
+    messages: list[dict[str, object]],
+    *,
+    temperature: float,
+    **params: object,
+) -> str:
+    """按 (模型, temperature, 提示词, 图片内容哈希, 其他请求参数) 计算内容寻址键。"""
+    payload = {
+        "v": _KEY_VERSION,
+        "model": model,
+        "temperature": temperature,
+        "messages": _canonical_messages(messages),
+        "params": {name: value for name, value in sorted(params.items()) if value is not None},
+    }
+    raw = json.dumps(payload, ensure_ascii=False, sort_keys=True, separators=(",", ":"))
+    return hashlib.sha256(raw.encode("utf-8")).hexdigest()
+
+
+class ResponseCache:
+    """
+    磁盘响应缓存：每条响应存为 <dir>/<key[:2]>/<key>.json。
+    命中时刷新文件 mtime，总大小超过上限时按 mtime 从旧到新淘汰（LRU），淘汰到上限的 90%。
+    """
+
+    def __init__(self, directory: Path, *, mode: str, max_bytes: int) -> None:
+        if mode not in _MODES:
+            raise ValueError(f"未知的 LLM_CACHE_MODE: {mode}（可选 {', '.join(sorted(_MODES))}）")
+        self.directory = directory
+        self.mode = mode
+        self.max_bytes = max_bytes
+        self._lock = Lock()
+        self._total_bytes: int | None = None
+        self._stats = {"hits": 0, "misses": 0, "writes": 0, "evictions": 0}
+
+    @property
+    def enabled(self) -> bool:
+        return self.mode != "off"
+
+    def _entry_path(self, key: str) -> Path:
+        return self.directory / key[:2] / f"{key}.json"
+
+    def _entries(self) -> list[tuple[float, int, Path]]:
+        entries: list[tuple[float, int, Path]] = []
+        for path in self.directory.glob("*/*.json"):
+            try:
+                stat = path.stat()
+            except OSError:
+                continue
+            entries.append((stat.st_mtime, stat.st_size, path))
+        return entries
+
+    def get(self, key: str) -> str | None:
+        path = self._entry_path(key)
+        try:
+            entry = json.loads(path.read_text(encoding="utf-8"))
+            response = entry["response"]
+        except (OSError, json.JSONDecodeError, KeyError, TypeError):
+            response = None
+        with self._lock:
+            if not isinstance(response, str):
+                self._stats["misses"] += 1
+                return None
+            self._stats["hits"] += 1
+        try:
+            os.utime(path)
+        except OSError:
+            pass
+        return response
+
+    def put(self, key: str, model: str, response: str) -> None:
+        if self.mode != "read-write":
+            return
+        entry = {"key": key, "model": model, "created": time.time(), "response": response}
+        text = json.dumps(entry, ensure_ascii=False)
+        try:
+            atomic_write_text(self._entry_path(key), text)
+        except OSError as exc:
+            print(f"[llm_cache] 缓存写入失败: {exc}", flush=True)
+            return
+        with self._lock:
+            self._stats["writes"] += 1
+            if self._total_bytes is None:
+                self._total_bytes = sum(size for _, size, _ in self._entries())
+            else:
+                self._total_bytes += len(text.encode("utf-8"))
+            if self._total_bytes > self.max_bytes:
+                self._evict()
+
+    def _evict(self) -> None:
+        # 重新扫描目录（其他进程可能也在写），按 mtime 淘汰最久未使用的条目
+        entries = sorted(self._entries())
+        total = sum(size for _, size, _ in entries)
+        target = int(self.max_bytes * 0.9)
+        for _, size, path in entries:
+            if total <= target:
+                break
+            try:
+                path.unlink()
+            except OSError:
+                continue
+            total -= size
+            self._stats["evictions"] += 1
+        self._total_bytes = total
+
+    def stats(self) -> dict[str, object]:
+        with self._lock:
+            stats: dict[str, object] = {"mode": self.mode, **self._stats}
+        lookups = int(stats["hits"]) + int(stats["misses"])  # type: ignore[arg-type]
+        stats["hit_rate"] = round(int(stats["hits"]) / lookups, 4) if lookups else None  # type: ignore[arg-type]
+        return stats
+
+
+_CACHE: ResponseCache | None = None
+_CACHE_LOCK = Lock()
+
+
+def get_llm_cache() -> ResponseCache:
+    global _CACHE
+    with _CACHE_LOCK:
+        if _CACHE is None:
+            _CACHE = ResponseCache(
+                Path(LLM_CACHE_DIR),
+                mode=LLM_CACHE_MODE,
+                max_bytes=int(LLM_CACHE_MAX_MB * 1024 * 1024),
+            )
+        return _CACHE
+
+
+def llm_cache_stats() -> dict[str, object]:
+    return get_llm_cache().stats()
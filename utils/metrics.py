@@ -0,0 +1,310 @@
+import asyncio
+import json
+import time
+from collections import deque
+from collections.abc import Iterable, Iterator
+from contextlib import contextmanager
+from dataclasses import asdict, dataclass, field, replace
+from pathlib import Path
+from threading import Lock
+from typing import TextIO
+
+from utils.config import METRICS_MAX_RECORDS, METRICS_PATH
+from utils.tracing import get_tracer
+
+
+@dataclass
+class CallRecord:
+    """一次 API 调用（含全部重试）的度量。"""
+
+    call_site: str
+    model: str
+    served_model: str
+    started_at: float
+    wall_seconds: float = 0.0
+    queue_delay_seconds: float = 0.0
+    attempts: int = 0
+    request_bytes: int = 0
+    response_bytes: int = 0
+    prompt_tokens: int | None = None
+    completion_tokens: int | None = None
+    cache_hit: bool = False
+    streamed: bool = False
+    early_stop: bool = False
+    finish_reason: str | None = None
+    truncated: bool = False
+    ok: bool = True
+    cancelled: bool = False
+    error: str | None = None
+
+    @property
+    def retries(self) -> int:
+        return max(0, self.attempts - 1)
+
+    def set_usage(self, resp: object) -> None:
+        usage = getattr(resp, "usage", None)
+        if usage is None and isinstance(resp, dict):
+            usage = resp.get("usage")
+        if usage is None:
+            return
+        for name in ("prompt_tokens", "completion_tokens"):
+            value = getattr(usage, name, None)
+            if value is None and isinstance(usage, dict):
+                value = usage.get(name)
+            if isinstance(value, int):
+                setattr(self, name, value)
+
+
+@dataclass
+class CallSiteStats:
+    """单个调用点的累计度量；耗时样本只保留最近 max_samples 个，用于 p50 / p95。"""
+
+    max_samples: int = METRICS_MAX_RECORDS
+    calls: int = 0
+    errors: int = 0
+    cancelled: int = 0
+    retries: int = 0
+    cache_hits: int = 0
+    early_stops: int = 0
+    truncated: int = 0
+    wall_seconds: float = 0.0
+    queue_seconds: float = 0.0
+    request_bytes: int = 0
+    prompt_tokens: int = 0
+    completion_tokens: int = 0
+    usage_unknown: int = 0
+    walls: deque[float] = field(init=False)
+
+    def __post_init__(self) -> None:
+        self.walls = deque(maxlen=max(1, self.max_samples))
+
+    def add(self, record: CallRecord) -> None:
+        self.calls += 1
+        self.errors += not record.ok and not record.cancelled
+        self.cancelled += record.cancelled
+        self.retries += record.retries
+        self.cache_hits += record.cache_hit
+        self.early_stops += record.early_stop
+        self.truncated += record.truncated
+        self.wall_seconds += record.wall_seconds
+        self.queue_seconds += record.queue_delay_seconds
+        self.request_bytes += record.request_bytes
+        self.prompt_tokens += record.prompt_tokens or 0
+        self.completion_tokens += record.completion_tokens or 0
+        # 实际发出、但没拿到 usage 的调用（如提前断开的流），其 token 未计入上面两项
+        self.usage_unknown += record.ok and not record.cache_hit and record.completion_tokens is None
+        self.walls.append(record.wall_seconds)
+
+
+class MetricsSink:
+    """
+    按调用点累计度量用于汇总，另在内存中保留最近 max_records 条调用记录；
+    配置了 METRICS_PATH 时同时逐条追加写入 jsonl。长时间运行时内存占用不随调用数增长。
+    """
+
+    def __init__(self, path: Path | None, max_records: int = METRICS_MAX_RECORDS) -> None:
+        self._path = path
+        self._lock = Lock()
+        self._max_records = max(1, max_records)
+        self._records: deque[CallRecord] = deque(maxlen=self._max_records)
+        self._sites: dict[str, CallSiteStats] = {}
+        self.dropped = 0
+        self._handle: TextIO | None = None
+
+    def record(self, record: CallRecord) -> None:
+        line = json.dumps({**asdict(record), "retries": record.retries}, ensure_ascii=False)
+        with self._lock:
+            if len(self._records) == self._records.maxlen:
+                self.dropped += 1
+            self._records.append(record)
+            stats = self._sites.get(record.call_site)
+            if stats is None:
+                stats = self._sites[record.call_site] = CallSiteStats(self._max_records)
+            stats.add(record)
+            if self._path is None:
+                return
+            try:
+                if self._handle is None:
+                    self._path.parent.mkdir(parents=True, exist_ok=True)
+                    self._handle = self._path.open("a", encoding="utf-8")
+                self._handle.write(line + "\n")
+                self._handle.flush()
+            except OSError as exc:
+                print(f"[metrics] 写入失败，停止写文件: {exc}", flush=True)
+                self._path = None
+
+    def records(self) -> list[CallRecord]:
+        """最近的至多 max_records 条调用记录。"""
+        with self._lock:
+            return list(self._records)
+
+    def call_site_stats(self) -> dict[str, CallSiteStats]:
+        with self._lock:
+            return {call_site: _copy_stats(stats) for call_site, stats in self._sites.items()}
+
+    def reset(self) -> None:
+        with self._lock:
+            self._records.clear()
+            self._sites.clear()
+            self.dropped = 0
+
+    def close(self) -> None:
+        with self._lock:
+            if self._handle is not None:
+                self._handle.close()
+                self._handle = None
+
+
+_SINK = MetricsSink(Path(METRICS_PATH) if METRICS_PATH else None)
+
+
+def get_metrics_sink() -> MetricsSink:
+    return _SINK
+
+
+@contextmanager
+def call_span(call_site: str, model: str, request_bytes: int) -> Iterator[CallRecord]:
+    """记录一次调用的墙钟时间与结果；调用方在块内补充 attempts / usage / 排队时间等字段。"""
+    record = CallRecord(
+        call_site=call_site,
+        model=model,
+        served_model=model,
+        started_at=time.time(),
+        request_bytes=request_bytes,
+    )
+    tracer = get_tracer()
+    lane = tracer.lane() if tracer.enabled else 0
+    started = time.perf_counter()
+    try:
+        yield record
+    except asyncio.CancelledError:
+        # 推测执行被放弃的调用（如 Medium 答对后取消的 Strong 求解）不算错误
+        record.ok = False
+        record.cancelled = True
+        raise
+    except BaseException as exc:
+        record.ok = False
+        record.error = f"{type(exc).__name__}: {exc}"[:300]
+        raise
+    finally:
+        finished = time.perf_counter()
+        record.wall_seconds = finished - started
+        _SINK.record(record)
+        if tracer.enabled:
+            tracer.complete(
+                f"api {call_site}",
+                "api",
+                started,
+                finished,
+                {
+                    "model": record.served_model,
+                    "attempts": record.attempts,
+                    "queue_delay_seconds": round(record.queue_delay_seconds, 3),
+                    "cache_hit": record.cache_hit,
+                    "ok": record.ok,
+                    "cancelled": record.cancelled,
+                },
+                lane,
+            )
+
+
+def _percentile(values: list[float], q: float) -> float:
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    index = min(len(ordered) - 1, max(0, round(q * (len(ordered) - 1))))
+    return ordered[index]
+
+
+def _copy_stats(stats: CallSiteStats) -> CallSiteStats:
+    copied = replace(stats)
+    copied.walls.extend(stats.walls)
+    return copied
+
+
+def _aggregate(records: Iterable[CallRecord]) -> dict[str, CallSiteStats]:
+    sites: dict[str, CallSiteStats] = {}
+    for record in records:
+        sites.setdefault(record.call_site, CallSiteStats()).add(record)
+    return sites
+
+
+def summarize_calls(records: list[CallRecord] | None = None) -> list[dict[str, object]]:
+    """按 call_site 汇总，按总耗时降序；不传 records 时使用全程累计值（p50 / p95 基于每个调用点最近的样本）。"""
+    sites = _SINK.call_site_stats() if records is None else _aggregate(records)
+    rows: list[dict[str, object]] = []
+    for call_site, stats in sites.items():
+        walls = list(stats.walls)
+        rows.append(
+            {
+                "call_site": call_site,
+                "calls": stats.calls,
+                "errors": stats.errors,
+                "cancelled": stats.cancelled,
+                "retries": stats.retries,
+                "cache_hits": stats.cache_hits,
+                "early_stops": stats.early_stops,
+                "truncated": stats.truncated,
+                "wall_seconds": round(stats.wall_seconds, 3),
+                "p50_seconds": round(_percentile(walls, 0.5), 3),
+                "p95_seconds": round(_percentile(walls, 0.95), 3),
+                "queue_seconds": round(stats.queue_seconds, 3),
+                "request_mb": round(stats.request_bytes / 1_000_000, 3),
+                "prompt_tokens": stats.prompt_tokens,
+                "completion_tokens": stats.completion_tokens,
+                "usage_unknown": stats.usage_unknown,
+            }
+        )
+    rows.sort(key=lambda row: row["wall_seconds"], reverse=True)  # type: ignore[arg-type, return-value]
+    return rows
+
+
+_SUMMARY_COLUMNS = [
+    ("call_site", "call site"),
+    ("calls", "calls"),
+    ("errors", "err"),
+    ("cancelled", "cancel"),
+    ("retries", "retry"),
+    ("cache_hits", "cache"),
+    ("early_stops", "early"),
+    ("truncated", "trunc"),
+    ("wall_seconds", "wall s"),
+    ("p50_seconds", "p50 s"),
+    ("p95_seconds", "p95 s"),
+    ("queue_seconds", "queue s"),
+    ("request_mb", "req MB"),
+    ("prompt_tokens", "prompt tok"),
+    ("completion_tokens", "compl tok"),
+    ("usage_unknown", "tok ?"),
+]
+
+
+def format_calls_summary(rows: list[dict[str, object]] | None = None) -> str:
+    if rows is None:
+        rows = summarize_calls()
+    if not rows:
+        return "(no API calls recorded)"
+    total: dict[str, object] = {"call_site": "TOTAL"}
+    for key, _ in _SUMMARY_COLUMNS[1:]:
+        if key in {"p50_seconds", "p95_seconds"}:
+            total[key] = ""
+            continue
+        value = sum(row[key] for row in rows)  # type: ignore[misc]
+        total[key] = round(value, 3) if isinstance(value, float) else value
+    table = [[str(row[key]) for key, _ in _SUMMARY_COLUMNS] for row in [*rows, total]]
+    headers = [title for _, title in _SUMMARY_COLUMNS]
+    widths = [max(len(headers[i]), *(len(line[i]) for line in table)) for i in range(len(headers))]
+
+    def _line(cells: list[str]) -> str:
+        return "  ".join(
+            cell.ljust(widths[i]) if i == 0 else cell.rjust(widths[i]) for i, cell in enumerate(cells)
+        )
+
+    separator = "  ".join("-" * width for width in widths)
+    lines = [_line(headers), separator, *(_line(line) for line in table[:-1]), separator, _line(table[-1])]
+    return "\n".join(lines)
+
+
+def print_calls_summary() -> None:
+    print("\n=== API 调用统计（按调用点） ===")
+    print(format_calls_summary())
@@ -119,17 +119,10 @@ def _find_option_letters(text: str) -> str:
     if not text:
         return ""
     normalized = _normalize_option_text(text)
-<<<<<<< HEAD
-    match = re.search(r"(?<![A-Za-z0-9])([A-D])(?![A-Za-z0-9])", normalized, flags=re.IGNORECASE)
-    if not match:
-        return None
-    return match.group(1).upper()
-=======
     matches = re.findall(r"[A-H]", normalized, flags=re.IGNORECASE)
     if not matches:
         return ""
     return "".join(sorted({match.upper() for match in matches}))
->>>>>>> rqlv
 
 
 def parse_option_letter(text: str) -> str:
@@ -162,15 +155,10 @@ def parse_option_letter_optional(text: str) -> str | None:
     for pattern in patterns:
         matches = re.findall(pattern, normalized, flags=re.IGNORECASE)
         if matches:
-<<<<<<< HEAD
-            return matches[-1].upper()
-    letters = re.findall(r"(?<![A-Za-z0-9])([A-D])(?![A-Za-z0-9])", normalized, flags=re.IGNORECASE)
-=======
             letters = _find_option_letters(matches[-1])
             if letters:
                 return letters
     letters = _find_option_letters(normalized)
->>>>>>> rqlv
     if letters:
         return letters
     return None
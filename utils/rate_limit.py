@@ -0,0 +1,184 @@
+import re
+import sqlite3
+import threading
+import time
+from pathlib import Path
+from threading import Lock
+
+from utils.config import (
+    API_IMAGE_TOKEN_ESTIMATE,
+    API_MODEL_RPM,
+    API_MODEL_TPM,
+    API_RATE_LIMIT_BACKEND,
+    API_RATE_LIMIT_DB,
+    API_RATE_LIMIT_RPM,
+    API_RATE_LIMIT_TPM,
+)
+
+_CJK_RE = re.compile(r"[　-〿㐀-䶿一-鿿＀-￯]")
+
+
+def estimate_tokens(messages: list[dict[str, object]], max_tokens: int | None = None) -> int:
+    """
+    本地粗估一次请求消耗的 token：中日韩字符按 1 个 token，其余字符按 4 个字符 1 个 token，
+    每张图片按 API_IMAGE_TOKEN_ESTIMATE 计，再加上输出上限 max_tokens。只用于限流，不追求精确。
+    """
+    total = 0
+    for message in messages:
+        content = message.get("content")
+        parts = content if isinstance(content, list) else [content]
+        for part in parts:
+            if isinstance(part, dict):
+                if part.get("type") == "image_url":
+                    total += API_IMAGE_TOKEN_ESTIMATE
+                    continue
+                part = part.get("text")
+            if not isinstance(part, str):
+                continue
+            cjk = len(_CJK_RE.findall(part))
+            total += cjk + (len(part) - cjk + 3) // 4
+    return total + (max_tokens or 0)
+
+
+class _MemoryBuckets:
+    """进程内令牌桶，多线程共享。"""
+
+    def __init__(self) -> None:
+        self._lock = Lock()
+        self._state: dict[str, tuple[float, float]] = {}
+
+    def reserve(self, requests: list[tuple[str, float, float]]) -> float:
+        now = time.monotonic()
+        with self._lock:
+            return max(_reserve(self._state, key, rate, cost, now) for key, rate, cost in requests)
+
+
+class _SqliteBuckets:
+    """SQLite 令牌桶：同一数据库文件上的多个进程共享配额，每次预留在一个 IMMEDIATE 事务内完成。"""
+
+    def __init__(self, path: Path) -> None:
+        path.parent.mkdir(parents=True, exist_ok=True)
+        self._path = path
+        self._local = threading.local()
+
+    def _connection(self) -> sqlite3.Connection:
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self._path, timeout=30, isolation_level=None)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS buckets (key TEXT PRIMARY KEY, tokens REAL, updated REAL)"
+            )
+            self._local.conn = conn
+        return conn
+
+    def reserve(self, requests: list[tuple[str, float, float]]) -> float:
+        conn = self._connection()
+        now = time.time()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            keys = [key for key, _, _ in requests]
+            rows = conn.execute(
+                f"SELECT key, tokens, updated FROM buckets WHERE key IN ({','.join('?' * len(keys))})",
+                keys,
+            ).fetchall()
+            state = {key: (tokens, updated) for key, tokens, updated in rows}
+            delay = max(_reserve(state, key, rate, cost, now) for key, rate, cost in requests)
+            conn.executemany(
+                "INSERT OR REPLACE INTO buckets (key, tokens, updated) VALUES (?, ?, ?)",
+                [(key, *state[key]) for key in keys],
+            )
+            conn.execute("COMMIT")
+        except BaseException:
+            conn.execute("ROLLBACK")
+            raise
+        return delay
+
+
+def _reserve(
+    state: dict[str, tuple[float, float]], key: str, per_minute: float, cost: float, now: float
+) -> float:
+    # 预留式令牌桶：先扣减（允许为负），欠的部分按补充速率折算成等待时间，调用方睡够再发请求。
+    # 排在后面的请求看到更低的余额、等得更久，因此等待的调用按到达顺序依次放行，不会同时醒来。
+    capacity = per_minute
+    rate = per_minute / 60.0
+    tokens, updated = state.get(key, (capacity, now))
+    tokens = min(capacity, tokens + (now - updated) * rate)
+    tokens -= min(cost, capacity)
+    state[key] = (tokens, now)
+    return max(0.0, -tokens / rate)
+
+
+class RateLimiter:
+    """按模型限制每分钟请求数(RPM)与估算 token 数(TPM)，并统计排队等待时间。"""
+
+    def __init__(self, backend: str = API_RATE_LIMIT_BACKEND, db_path: str = API_RATE_LIMIT_DB) -> None:
+        self._buckets: _MemoryBuckets | _SqliteBuckets
+        if backend == "sqlite":
+            self._buckets = _SqliteBuckets(Path(db_path))
+        else:
+            self._buckets = _MemoryBuckets()
+        self._stats_lock = Lock()
+        self._stats: dict[str, dict[str, float]] = {}
+
+    @staticmethod
+    def limits(model: str) -> tuple[float, float]:
+        return (
+            float(API_MODEL_RPM.get(model, API_RATE_LIMIT_RPM)),
+            float(API_MODEL_TPM.get(model, API_RATE_LIMIT_TPM)),
+        )
+
+    def reserve(self, model: str, tokens: int) -> float:
+        """为一次请求预留配额，返回调用方发请求前需要等待的秒数。"""
+        rpm, tpm = self.limits(model)
+        requests: list[tuple[str, float, float]] = []
+        if rpm > 0:
+            requests.append((f"rpm:{model}", rpm, 1.0))
+        if tpm > 0:
+            requests.append((f"tpm:{model}", tpm, float(tokens)))
+        delay = self._buckets.reserve(requests) if requests else 0.0
+        with self._stats_lock:
+            stats = self._stats.setdefault(
+                model,
+                {
+                    "calls": 0,
+                    "delayed_calls": 0,
+                    "queue_delay_seconds": 0.0,
+                    "max_delay_seconds": 0.0,
+                    "estimated_tokens": 0,
+                },
+            )
+            stats["calls"] += 1
+            stats["estimated_tokens"] += tokens
+            if delay > 0:
+                stats["delayed_calls"] += 1
+                stats["queue_delay_seconds"] += delay
+                stats["max_delay_seconds"] = max(stats["max_delay_seconds"], delay)
+        return delay
+
+    def stats(self) -> dict[str, dict[str, float]]:
+        with self._stats_lock:
+            return {
+                model: {
+                    **stats,
+                    "queue_delay_seconds": round(stats["queue_delay_seconds"], 3),
+                    "max_delay_seconds": round(stats["max_delay_seconds"], 3),
+                }
+                for model, stats in self._stats.items()
+            }
+
+
+_LIMITER: RateLimiter | None = None
+_LIMITER_LOCK = Lock()
+
+
+def get_rate_limiter() -> RateLimiter:
+    global _LIMITER
+    with _LIMITER_LOCK:
+        if _LIMITER is None:
+            _LIMITER = RateLimiter()
+        return _LIMITER
+
+
+def rate_limit_stats() -> dict[str, dict[str, float]]:
+    return get_rate_limiter().stats()
@@ -0,0 +1,163 @@
+import asyncio
+import atexit
+import functools
+import json
+import os
+import threading
+import time
+import weakref
+from collections import deque
+from collections.abc import Callable, Iterator
+from contextlib import contextmanager
+from pathlib import Path
+from threading import RLock
+from typing import Any, TypeVar
+
+from utils.config import TRACE_MAX_EVENTS, TRACE_PATH
+from utils.file_io import atomic_write_text
+
+_F = TypeVar("_F", bound=Callable[..., Any])
+
+
+class Tracer:
+    """
+    收集 Chrome trace 完整事件("X")，导出为 chrome://tracing / Perfetto 可直接打开的 JSON。
+
+    只在进程退出时写一次文件；内存中最多保留 max_events 个 span，超出后丢弃最早的并计数，
+    泳道名称等元数据事件单独保存、不参与淘汰。
+    """
+
+    def __init__(self, path: Path | None, max_events: int = TRACE_MAX_EVENTS) -> None:
+        self._path = path
+        # 任务被回收时的 finalize 回调可能在持锁线程内触发，需要可重入锁
+        self._lock = RLock()
+        self._metadata: list[dict[str, Any]] = []
+        self._events: deque[dict[str, Any]] = deque(maxlen=max(1, max_events))
+        self.dropped = 0
+        self._origin = time.perf_counter()
+        self._pid = os.getpid()
+        self._thread_lanes: dict[int, int] = {}
+        self._task_lanes: weakref.WeakKeyDictionary[asyncio.Task[Any], int] = weakref.WeakKeyDictionary()
+        self._free_task_lanes: list[int] = []
+        self._next_lane = 1
+        if path is not None:
+            atexit.register(self.write)
+
+    @property
+    def enabled(self) -> bool:
+        return self._path is not None
+
+    def _new_lane(self, name: str) -> int:
+        lane = self._next_lane
+        self._next_lane += 1
+        self._metadata.append(
+            {"name": "thread_name", "ph": "M", "pid": self._pid, "tid": lane, "args": {"name": name}}
+        )
+        return lane
+
+    def _release_task_lane(self, lane: int) -> None:
+        with self._lock:
+            self._free_task_lanes.append(lane)
+
+    def lane(self) -> int:
+        # 同一线程上并发的 asyncio 任务各占一条泳道(tid)，否则时间重叠的完整事件无法正确嵌套显示；
+        # 任务结束被回收后泳道归还复用，避免长时间运行时泳道数无限增长
+        try:
+            task = asyncio.current_task()
+        except RuntimeError:
+            task = None
+        thread = threading.current_thread()
+        with self._lock:
+            if task is None:
+                lane = self._thread_lanes.get(thread.ident or 0)
+                if lane is None:
+                    lane = self._thread_lanes[thread.ident or 0] = self._new_lane(thread.name)
+                return lane
+            lane = self._task_lanes.get(task)
+            if lane is None:
+                if self._free_task_lanes:
+                    lane = self._free_task_lanes.pop()
+                else:
+                    lane = self._new_lane(f"{thread.name} / async {self._next_lane}")
+                self._task_lanes[task] = lane
+                weakref.finalize(task, self._release_task_lane, lane)
+            return lane
+
+    def complete(
+        self, name: str, cat: str, start: float, end: float, args: dict[str, Any], lane: int
+    ) -> None:
+        event = {
+            "name": name,
+            "cat": cat,
+            "ph": "X",
+            "ts": round((start - self._origin) * 1_000_000, 1),
+            "dur": round((end - start) * 1_000_000, 1),
+            "pid": self._pid,
+            "tid": lane,
+            "args": args,
+        }
+        with self._lock:
+            if len(self._events) == self._events.maxlen:
+                self.dropped += 1
+            self._events.append(event)
+
+    def events(self) -> list[dict[str, Any]]:
+        with self._lock:
+            return [*self._metadata, *self._events]
+
+    def write(self, path: Path | None = None) -> None:
+        target = path or self._path
+        if target is None:
+            return
+        payload = {
+            "traceEvents": self.events(),
+            "displayTimeUnit": "ms",
+            "otherData": {"dropped_events": self.dropped},
+        }
+        try:
+            target.parent.mkdir(parents=True, exist_ok=True)
+            atomic_write_text(target, json.dumps(payload, ensure_ascii=False, default=str))
+        except OSError as exc:
+            print(f"[tracing] 写入失败: {exc}", flush=True)
+
+
+_TRACER = Tracer(Path(TRACE_PATH) if TRACE_PATH else None)
+
+
+def get_tracer() -> Tracer:
+    return _TRACER
+
+
+@contextmanager
+def trace_span(name: str, cat: str = "pipeline", **args: Any) -> Iterator[dict[str, Any]]:
+    """记录一段耗时；块内可往返回的 dict 中补充参数。未配置 TRACE_PATH 时不做任何事。"""
+    if not _TRACER.enabled:
+        yield args
+        return
+    lane = _TRACER.lane()
+    start = time.perf_counter()
+    try:
+        yield args
+    except BaseException as exc:
+        args["error"] = type(exc).__name__
+        raise
+    finally:
+        _TRACER.complete(name, cat, start, time.perf_counter(), args, lane)
+
+
+def traced(name: str | None = None, cat: str = "pipeline") -> Callable[[_F], _F]:
+    """把整个函数调用记录为一个 span。"""
+
+    def decorator(func: _F) -> _F:
+        @functools.wraps(func)
+        def wrapper(*args: Any, **kwargs: Any) -> Any:
+            with trace_span(name or func.__name__, cat):
+                return func(*args, **kwargs)
+
+        return wrapper  # type: ignore[return-value]
+
+    return decorator
+
+
+def write_trace(path: Path | None = None) -> None:
+    _TRACER.write(path)